@@ -1,14 +1,25 @@
 # importacion de librerias necesarioas
 import streamlit as st
-import geopandas as gpd
 import folium
 from streamlit_folium import st_folium
-from shapely.geometry import Point
-import plotly.express as px
-import plotly.graph_objects as go
 import pandas as pd
 import os
-import urllib.parse
+import time
+
+import carga_datos
+import diagnostico
+import gemelo_3d
+import geometria_web
+import informe
+import instrumentacion
+import red_peatonal
+import registro_datos
+import rejilla_viabilidad
+import servicio_informes
+import teselas_vectoriales
+
+# Duración total de este rerun (se registra al final del script)
+inicio_rerun = time.perf_counter()
 
 # Configuración de la Página
 st.set_page_config(
@@ -101,74 +112,189 @@ with col_info6:
 st.markdown("---")
 
 
-# Función de Carga de Datos (Conectada a DATOS_LIMPIOS)
-@st.cache_data
-def cargar_datasets():
+# Registro de Datos (Conectado a DATOS_LIMPIOS)
+@st.cache_resource
+def cache_diagnosticos():
+    """Caché LRU de diagnósticos del paso 5, compartida por todas las sesiones."""
+    return diagnostico.CacheDiagnosticos()
+
+@st.cache_resource
+def almacen_compartido():
     """
-    Descarga, valida y cachea los datasets geoespaciales.
-    Forzamos la corrección de coordenadas para Verde y Salud.
+    Carga, valida y comparte los datasets geoespaciales: una sola copia por
+    proceso para todas las sesiones (ver registro_datos.py). Primero busca en
+    DATOS_LIMPIOS/ y en la caché binaria local; solo descarga del repositorio
+    remoto las capas que no estén en disco (ver carga_datos.py).
+    Un hilo vigila las fuentes y refresca en caliente solo la capa que cambie.
     """
-    BASE_URL = "https://github.com/andres-fuentex/COPIA_CONCU/raw/main/DATOS_LIMPIOS/"
-    
-    archivos = {
-        "localidades": "dim_localidad.geojson",
-        "areas":       "dim_area.geojson",
-        "manzanas":    "tabla_hechos.geojson",
-        "transporte":  "dim_transporte.geojson",
-        "colegios":    "dim_colegios.geojson",
-        "salud":       "dim_salud.geojson", 
-        "verde":       "dim_verde.geojson"
-    }
-    
-    dataframes = {}
-    errores = []
+    almacen = registro_datos.AlmacenDatos()
+    diagnosticos = cache_diagnosticos()
+    almacen.al_cambiar(lambda registro, cambiadas: diagnosticos.purgar(registro.indice().version))
+    almacen.vigilar()
+    return almacen
 
-    for nombre_clave, nombre_archivo in archivos.items():
-        try:
-            url_completa = f"{BASE_URL}{nombre_archivo}"
-            gdf = gpd.read_file(url_completa)
-            
-            # --- CURACIÓN ESPECÍFICA DE COORDENADAS ---
-            
-            # CASO 1: PARQUES (dim_verde)
-            # Vienen en planas (91130...), hay que decirles que son Bogotá (3116) y pasar a GPS (4326)
-            if nombre_clave == "verde":
-                if gdf.crs is None:
-                    gdf.set_crs(epsg=3116, inplace=True) # Asumimos Magna Bogotá
-                gdf = gdf.to_crs(epsg=4326) # Convertimos a GPS
-            
-            # CASO 2: SALUD (dim_salud)
-            # Vienen en GPS (-74...), pero a veces sin etiqueta. Aseguramos que sea 4326.
-            elif nombre_clave == "salud":
-                if gdf.crs is None:
-                    gdf.set_crs(epsg=4326, inplace=True)
-                else:
-                    gdf = gdf.to_crs(epsg=4326)
-
-            # CASO 3: EL RESTO
-            # Verificación estándar
-            else:
-                if gdf.crs is None:
-                    gdf.set_crs(epsg=4326, inplace=True)
-                elif gdf.crs.to_string() != "EPSG:4326":
-                    gdf = gdf.to_crs("EPSG:4326")
-                
-            dataframes[nombre_clave] = gdf
-            
-        except Exception as e:
-            errores.append(f"Error cargando {nombre_clave}: {str(e)}")
-    
-    if errores:
-        for err in errores:
-            st.error(err)
+def registro_compartido():
+    """Versión vigente de los datos (cambia sola cuando se actualiza un archivo)."""
+    return almacen_compartido().actual
+
+def capas_compartidas():
+    return registro_compartido().capas
+
+def indice_espacial():
+    """
+    Índices STRtree de todas las capas, construidos una sola vez por versión
+    de los datos y compartidos entre reruns y sesiones.
+    """
+    return registro_compartido().indice()
+
+@st.cache_resource
+def red_peatonal_compartida():
+    """
+    Red de calles para las isócronas a pie (ver red_peatonal.py), cargada una
+    vez por proceso, o None si no se ha generado: el paso 5 usa entonces el círculo.
+    """
+    return red_peatonal.RedPeatonal.cargar()
+
+@st.cache_resource(max_entries=2)
+def localidades_web(_localidades, huella):
+    """
+    Localidades simplificadas por nivel de zoom y cuantizadas (ver geometria_web.py),
+    calculadas una vez por versión de la capa.
+    """
+    return geometria_web.GeometriaWeb(_localidades, campos=["nombre_localidad"])
+
+@st.cache_resource(max_entries=2)
+def rejilla_precalculada(version):
+    """
+    Rejilla de viabilidad precalculada (ver rejilla_viabilidad.py) para la
+    versión de datos en uso, o None si no se ha generado o está desactualizada.
+    """
+    return rejilla_viabilidad.cargar_rejilla(version)
+
+@st.cache_resource(max_entries=2)
+def metadatos_teselas(_capas, version):
+    """teselas.json si la pirámide MVT existe y corresponde a los datos cargados (si no, None)."""
+    return teselas_vectoriales.disponibles(_capas)
+
+def fuente_teselas():
+    """
+    Origen de las teselas vectoriales para los mapas del paso 5, o None para
+    volver a los polígonos embebidos (sin pirámide generada o sin archivos estáticos).
+    """
+    if not st.get_option("server.enableStaticServing"):
         return None
-        
-    return dataframes
+    capas = capas_compartidas()
+    metadatos = metadatos_teselas(capas, teselas_vectoriales.version_teselas(capas))
+    if metadatos is None:
+        return None
+    url_base = os.environ.get("BOGOTA_TESELAS_URL")
+    if not url_base:
+        # Mapbox pide las teselas desde un worker: la URL tiene que ser absoluta
+        host = st.context.headers.get("Host")
+        if not host:
+            return None
+        protocolo = st.context.headers.get("X-Forwarded-Proto", "http")
+        prefijo = st.get_option("server.baseUrlPath").strip("/")
+        url_base = f"{protocolo}://{host}/{prefijo + '/' if prefijo else ''}app/static/teselas"
+    return teselas_vectoriales.fuente(metadatos, url_base)
+
+@st.cache_resource
+def servicio_informes_compartido():
+    """Pool de procesos y cola de informes, uno por servidor (ver servicio_informes.py)."""
+    servicio = servicio_informes.ServicioInformes()
+    # Los procesos arrancan mientras el usuario recorre los pasos 1 a 3
+    servicio.calentar()
+    return servicio
+
+# Panel de tiempos del proceso (con el botón que los reinicia) solo para el
+# operador del servidor; ?admin=1 muestra apenas los tiempos de la propia sesión
+PANEL_ADMIN = os.environ.get("BOGOTA_PANEL_ADMIN", "") == "1"
+
+# Cada cuánto consulta la página el estado de un informe pendiente (segundos)
+INTERVALO_SONDEO = float(os.environ.get("BOGOTA_SONDEO_INFORMES", 1.0))
+
+def boton_descarga_informe(clave_informe, nombre_archivo, pendiente):
+    """
+    Progreso del informe en cola y, cuando termina, el botón de descarga.
+    Se ejecuta como fragmento: mientras el informe está pendiente solo esta
+    parte de la página se refresca.
+    """
+    estado = servicio_informes_compartido().estado(clave_informe)
+    if estado is None or estado["estado"] == servicio_informes.ERROR:
+        if pendiente:
+            # Falló (o se descartó) durante el sondeo: se recarga la página para
+            # dejar de sondear y volver a mostrar el botón "Preparar Ficha"
+            st.rerun()
+        st.error(f"No se pudo generar la ficha: {estado['error'] if estado else 'trabajo no encontrado'}")
+        return
+    if estado["estado"] != servicio_informes.LISTO:
+        texto = "⏳ Generando ficha..." if estado["estado"] == servicio_informes.EN_PROCESO \
+            else f"⏳ Ficha en cola ({estado['posicion']} antes que la tuya)"
+        st.progress(estado["progreso"], text=texto)
+        return
+    if pendiente:
+        # Terminó durante el sondeo: se recarga la página para dejar de sondear
+        st.rerun()
+    st.download_button(
+        label="📥 Descargar Ficha",
+        data=estado["html"],
+        file_name=nombre_archivo,
+        mime="text/html"
+    )
+
+def metros(distancia):
+    """1234.5 -> '1.235 m' (separador de miles colombiano)."""
+    return f"{distancia:,.0f} m".replace(",", ".")
+
+def grafico(diag, nombre, teselas=None, **opciones):
+    """st.plotly_chart de una figura del diagnóstico, midiendo su construcción y su envío."""
+    with instrumentacion.tramo(f"paso5.grafico.{nombre}"):
+        st.plotly_chart(diag.figura(nombre, teselas=teselas), **opciones)
+
+def mapa_perezoso(diag, nombre, etiqueta, teselas=None, **opciones):
+    """
+    Mapa del paso 5 dentro de un expander: la figura solo se construye (y se
+    envía al navegador) cuando el usuario lo abre, y sigue abierto en los
+    reruns. Con versiones de Streamlit que no informan si el expander está
+    abierto, se dibuja de una vez como antes.
+    """
+    try:
+        contenedor = st.expander(etiqueta, key=f"abrir_mapa_{nombre}", on_change="rerun")
+        abierto = contenedor.open
+    except TypeError:
+        contenedor, abierto = st.expander(etiqueta, expanded=True), True
+    if abierto:
+        with contenedor:
+            grafico(diag, nombre, teselas=teselas, **opciones)
+
+def nota_cercania(diag, categoria, icono, texto):
+    """Pie con el equipamiento más cercano de la categoría, esté o no dentro del radio."""
+    cercano = diag.mas_cercano(categoria)
+    if cercano is None:
+        return
+    nombre, distancia = cercano
+    if distancia == 0:
+        st.caption(f"{icono} Estás dentro de: **{nombre}**")
+        return
+    st.caption(f"{icono} {texto}: **{nombre}** a {metros(distancia)}")
+
+def nota_tolerancia(diag, criterio):
+    """Aviso cuando un criterio del puntaje se cumple por equipamientos justo por fuera del radio."""
+    umbral, _ = diagnostico.UMBRALES_SCORE[criterio]
+    distancia = diag.distancias_score[criterio]
+    if getattr(diag, criterio) < umbral and diag.alcance_score is not None and distancia <= diag.alcance_score:
+        st.caption(f"↪️ A {metros(distancia)}, justo por fuera del radio: cuenta en tu puntaje.")
 
 # Inicialización del Estado
 if "step" not in st.session_state:
     st.session_state.step = 1
 
+# Tiempos por tramo de esta sesión y del proceso (ver instrumentacion.py)
+if "metricas" not in st.session_state:
+    st.session_state.metricas = instrumentacion.Metricas()
+instrumentacion.usar_sesion(st.session_state.metricas)
+instrumentacion.servir()
+
 
 # PASO 1: SINCRONIZACIÓN Y CARGA DE DATOS
 
@@ -208,14 +334,34 @@ if st.session_state.step == 1:
     with st.spinner("⏳ Sincronizando mapas y estadísticas oficiales... por favor espera."):
         try:
             # Ejecutamos la carga
-            dataframes = cargar_datasets()
+            with instrumentacion.tramo("paso1.carga"):
+                registro = registro_compartido()
             
-            if dataframes:
-                # Guardamos en memoria silenciosamente
-                st.session_state.update(dataframes)
+            if registro.completo:
+                # La sesión no copia las capas: los pasos siguientes leen el registro compartido
+                servicio_informes_compartido()
                 
                 # Mensaje de  limpio
                 st.success("✅ **¡Conexión Exitosa!** Todos los datos de Bogotá están listos para tu análisis.")
+
+                with st.expander("🧪 Calidad de las geometrías"):
+                    st.dataframe(pd.DataFrame(carga_datos.reporte_validez(registro.capas)), hide_index=True)
+
+                with st.expander(f"📦 Memoria por capa ({registro.memoria_total_mb():.1f} MB compartidos)"):
+                    st.dataframe(pd.DataFrame(registro.memoria()), hide_index=True)
+
+                with st.expander(f"🗂️ Versiones de los datos ({registro.version})"):
+                    if registro_datos.INTERVALO_REFRESCO > 0:
+                        remotas = (f"cada {carga_datos.INTERVALO_REMOTOS / 60:.0f} min"
+                                   if carga_datos.INTERVALO_REMOTOS > 0 else "solo al arrancar")
+                        st.caption(
+                            f"Los archivos de DATOS_LIMPIOS se revisan cada {registro_datos.INTERVALO_REFRESCO:.0f} s; "
+                            f"las capas descargadas del repositorio, {remotas}."
+                        )
+                    st.dataframe(
+                        pd.DataFrame([{"capa": n, **e} for n, e in registro.manifiesto.items()]),
+                        hide_index=True
+                    )
                 
                 st.markdown("---")
                 
@@ -226,6 +372,11 @@ if st.session_state.step == 1:
                         st.session_state.step = 2
                         st.rerun()
             else:
+                for err in registro.errores:
+                    st.error(err)
+                # No se deja en caché una carga fallida: el próximo intento vuelve a cargar
+                almacen_compartido().detener()
+                almacen_compartido.clear()
                 st.error("❌ No pudimos conectar con los datos. Por favor revisa tu internet.")
                 
         except Exception as e:
@@ -299,56 +450,58 @@ elif st.session_state.step == 2:
         COLOR_LINEA = "#1B0BA8"    # Azul
         COLOR_HOVER = "#AA1A0F"    # Rojo 
 
-        localidades = st.session_state.localidades
+        localidades = capas_compartidas()["localidades"]
         centro_urbano = [4.6097, -74.0817] 
 
-        m = folium.Map(
-            location=centro_urbano, 
-            zoom_start=11, 
-            tiles="CartoDB positron",
-            control_scale=True
-        )
-        
-        folium.GeoJson(
-            localidades,
-            style_function=lambda feature: {
-                "fillColor": COLOR_BASE,
-                "color": COLOR_LINEA,
-                "weight": 2,
-                "fillOpacity": 0.5,
-            },
-            highlight_function=lambda feature: {
-                "fillColor": COLOR_HOVER,
-                "color": "white",
-                "weight": 3,
-                "fillOpacity": 0.7,
-            },
-            tooltip=folium.GeoJsonTooltip(
-                fields=["nombre_localidad"],
-                aliases=["Localidad:"],
-                style="font-family: sans-serif; font-size: 14px;",
-                sticky=True
+        with instrumentacion.tramo("paso2.mapa"):
+            m = folium.Map(
+                location=centro_urbano, 
+                zoom_start=11, 
+                tiles="CartoDB positron",
+                control_scale=True
             )
-        ).add_to(m)
+        
+            # Geometría simplificada para el zoom del mapa (~65 KB de página en vez de ~2 MB)
+            folium.GeoJson(
+                localidades_web(localidades, localidades.attrs.get("huella")).geojson(11),
+                style_function=lambda feature: {
+                    "fillColor": COLOR_BASE,
+                    "color": COLOR_LINEA,
+                    "weight": 2,
+                    "fillOpacity": 0.5,
+                },
+                highlight_function=lambda feature: {
+                    "fillColor": COLOR_HOVER,
+                    "color": "white",
+                    "weight": 3,
+                    "fillOpacity": 0.7,
+                },
+                tooltip=folium.GeoJsonTooltip(
+                    fields=["nombre_localidad"],
+                    aliases=["Localidad:"],
+                    style="font-family: sans-serif; font-size: 14px;",
+                    sticky=True
+                )
+            ).add_to(m)
 
-        output = st_folium(m, width=None, height=550, returned_objects=["last_clicked"])
+        with instrumentacion.tramo("paso2.st_folium"):
+            output = st_folium(m, width=None, height=550, returned_objects=["last_clicked"])
 
     # Lógica de Selección y Ranking
     clicked = output.get("last_clicked")
     contenedor_resultado = st.container()
 
     if clicked and "lat" in clicked and "lng" in clicked:
-        punto = Point(clicked["lng"], clicked["lat"])
-        
         seleccion = None
         perfil_seguridad = "Sin datos"
         
-        for _, row in localidades.iterrows():
-            if row["geometry"].contains(punto):
-                seleccion = row["nombre_localidad"]
-                if "top_3_delitos" in row:
-                    perfil_seguridad = row["top_3_delitos"]
-                break
+        # Punto en polígono con STRtree (una consulta en vez de recorrer las 20 localidades)
+        with instrumentacion.tramo("paso2.localidad"):
+            row = indice_espacial().localidad_en_punto(clicked["lng"], clicked["lat"])
+        if row is not None:
+            seleccion = row["nombre_localidad"]
+            if "top_3_delitos" in row:
+                perfil_seguridad = row["top_3_delitos"]
         
         if seleccion:
             st.session_state.localidad_clic = seleccion
@@ -436,11 +589,34 @@ elif st.session_state.step == 3:
             
         st.caption(f"{desc_radio}")
 
+        # Vista previa instantánea desde la rejilla precalculada (si existe)
+        if "punto_lat" in st.session_state:
+            with instrumentacion.tramo("paso3.vista_previa"):
+                rejilla = rejilla_precalculada(indice_espacial().version)
+                estimado = rejilla.consultar(
+                    st.session_state.punto_lat, st.session_state.punto_lon, radio_analisis
+                ) if rejilla is not None else None
+            if estimado is not None:
+                st.markdown("---")
+                st.markdown("### 3. Vista previa")
+                st.markdown(f"""
+                    <div style="padding:10px; border-radius:8px; background:{estimado['color_fondo']}; color:white; text-align:center;">
+                        <b>{estimado['dictamen']}</b><br><span style="font-size:12px;">{estimado['score']}/5 factores</span>
+                    </div>
+                """, unsafe_allow_html=True)
+                st.caption(
+                    f"🚌 {estimado['num_tm']} · 🏫 {estimado['num_col']} · 🏥 {estimado['num_salud']} · "
+                    f"🌳 {estimado['num_parques']} · Estrato {estimado['estrato_moda']} · {estimado['uso_moda']}"
+                )
+                st.caption(f"Estimación de la celda más cercana ({rejilla.celda} m). "
+                           "El diagnóstico completo calcula el valor exacto del punto. "
+                           + diagnostico.explicacion_score())
+
     
     # 2. MAPA INTERACTIVO  CENTRADO DINÁMICO
     
     with col_mapa:
-        localidades = st.session_state.localidades
+        localidades = capas_compartidas()["localidades"]
         localidad_geo = localidades[localidades["nombre_localidad"] == st.session_state.localidad_sel]
         
         bounds = localidad_geo.total_bounds
@@ -455,44 +631,48 @@ elif st.session_state.step == 3:
             centro_mapa = [(bounds[1] + bounds[3]) / 2, (bounds[0] + bounds[2]) / 2]
             zoom_inicial = 13
 
-        m = folium.Map(
-            location=centro_mapa,
-            zoom_start=zoom_inicial,
-            tiles="CartoDB positron",
-            control_scale=True
-        )
-
-        folium.GeoJson(
-            localidad_geo,
-            style_function=lambda x: {
-                "fillColor": "#F1C40F",
-                "color": "#7F8C8D",
-                "weight": 2,
-                "fillOpacity": 0.1,
-                "dashArray": "5, 5"
-            }
-        ).add_to(m)
-
-        m.get_root().html.add_child(folium.Element("""
-            <style>.leaflet-container { cursor: crosshair !important; }</style>
-        """))
+        with instrumentacion.tramo("paso3.mapa"):
+            m = folium.Map(
+                location=centro_mapa,
+                zoom_start=zoom_inicial,
+                tiles="CartoDB positron",
+                control_scale=True
+            )
 
-        if "punto_lat" in st.session_state:
-            folium.Marker(
-                [st.session_state.punto_lat, st.session_state.punto_lon],
-                icon=folium.Icon(color="red", icon="info-sign"),
-                tooltip="Punto de Análisis"
+            folium.GeoJson(
+                localidades_web(localidades, localidades.attrs.get("huella")).geojson(
+                    zoom_inicial, filtro={"nombre_localidad": st.session_state.localidad_sel}
+                ),
+                style_function=lambda x: {
+                    "fillColor": "#F1C40F",
+                    "color": "#7F8C8D",
+                    "weight": 2,
+                    "fillOpacity": 0.1,
+                    "dashArray": "5, 5"
+                }
             ).add_to(m)
+
+            m.get_root().html.add_child(folium.Element("""
+                <style>.leaflet-container { cursor: crosshair !important; }</style>
+            """))
+
+            if "punto_lat" in st.session_state:
+                folium.Marker(
+                    [st.session_state.punto_lat, st.session_state.punto_lon],
+                    icon=folium.Icon(color="red", icon="info-sign"),
+                    tooltip="Punto de Análisis"
+                ).add_to(m)
             
-            folium.Circle(
-                location=[st.session_state.punto_lat, st.session_state.punto_lon],
-                radius=st.session_state.radio_analisis,
-                color="#E74C3C",
-                fill=True,
-                fill_opacity=0.2
-            ).add_to(m)
+                folium.Circle(
+                    location=[st.session_state.punto_lat, st.session_state.punto_lon],
+                    radius=st.session_state.radio_analisis,
+                    color="#E74C3C",
+                    fill=True,
+                    fill_opacity=0.2
+                ).add_to(m)
 
-        mapa_output = st_folium(m, width=None, height=500, returned_objects=["last_clicked"])
+        with instrumentacion.tramo("paso3.st_folium"):
+            mapa_output = st_folium(m, width=None, height=500, returned_objects=["last_clicked"])
 
     
     # 3. LÓGICA Y BOTONES
@@ -544,43 +724,39 @@ elif st.session_state.step == 5:
 
     
     # 1. MOTOR DE CÁLCULO ESPACIAL
+    # Zona, cruces (una sola pasada por todas las capas), POT, KPIs y figuras
+    # viven en un diagnóstico memoizado (ver diagnostico.py): los reruns de esta
+    # página no recalculan nada, y las secciones y el informe leen de él.
     
-    localidades = st.session_state.localidades
-    manzanas    = st.session_state.manzanas
-    transporte  = st.session_state.transporte
-    colegios    = st.session_state.colegios
-    areas_pot   = st.session_state.areas
-
-    # nuevos 
-    salud = st.session_state.salud
-    verde = st.session_state.verde
-
-    # 1.1 Buffer de Análisis
-    punto_ref = Point(st.session_state.punto_lon, st.session_state.punto_lat)
-    gdf_punto = gpd.GeoDataFrame([{'geometry': punto_ref}], crs="EPSG:4326")
-    gdf_buffer = gdf_punto.to_crs(epsg=3116).buffer(st.session_state.radio_analisis).to_crs(epsg=4326)
-    area_interes = gdf_buffer.iloc[0]
-
-    # 1.2 Asegurar Proyecciones Idénticas
-    if transporte.crs != "EPSG:4326": transporte = transporte.to_crs("EPSG:4326")
-    if colegios.crs != "EPSG:4326": colegios = colegios.to_crs("EPSG:4326")
-    if manzanas.crs != "EPSG:4326": manzanas = manzanas.to_crs("EPSG:4326")
-    if areas_pot.crs != "EPSG:4326": areas_pot = areas_pot.to_crs("EPSG:4326")
-    if salud.crs != "EPSG:4326": salud = salud.to_crs("EPSG:4326")
-    if verde.crs != "EPSG:4326": verde = verde.to_crs("EPSG:4326")
+    # Una sola versión de los datos para todo el rerun, aunque se refresque a mitad
+    registro = registro_compartido()
+    localidades = registro.capas["localidades"]
+    indice = registro.indice()
+    areas_pot = indice.capas["areas"]
+
+    red = red_peatonal_compartida()
+    with instrumentacion.tramo("paso5.diagnostico"):
+        diag = cache_diagnosticos().obtener(
+            indice, st.session_state.punto_lat, st.session_state.punto_lon, st.session_state.radio_analisis, red
+        )
+    if diag.isocrona:
+        st.caption(
+            f"🚶 La zona analizada es lo que alcanzas caminando {diag.radio} m por las calles "
+            f"(~{round(diag.radio / red_peatonal.VELOCIDAD_CAMINATA)} min), no un círculo."
+        )
 
-    
+    # Resumen primero: conteos y puntaje salen de los cruces ya hechos, sin
+    # figuras. Cada mapa se construye al abrir su sección (ver mapa_perezoso).
+    kpi_score, kpi_tm, kpi_col, kpi_salud, kpi_parques = st.columns(5)
+    kpi_score.metric("Viabilidad", f"{diag.score}/5", help=diag.dictamen)
+    kpi_tm.metric("🚌 Transporte", diag.num_tm)
+    kpi_col.metric("🏫 Colegios", diag.num_col)
+    kpi_salud.metric("🩺 Salud", diag.num_salud)
+    kpi_parques.metric("🌳 Parques", diag.num_parques)
+    st.caption(f"{diag.dictamen}. {diag.explicacion_score}")
 
-    # 1.3 Cruces Espaciales 
-    transporte_zona = transporte[transporte.geometry.intersects(area_interes)]
-    colegios_zona = colegios[colegios.geometry.intersects(area_interes)]
-    manzanas_zona = manzanas[manzanas.geometry.intersects(area_interes)]
-    # nuevos
-    salud_zona = salud[salud.geometry.intersects(area_interes)]
-    parques_zona = verde[verde.geometry.intersects(area_interes)]
-    
-    cant_salud = len(salud_zona)
-    cant_parques = len(parques_zona)
+    # Polígonos de manzanas y parques desde teselas vectoriales, si están generadas
+    teselas = fuente_teselas()
 
     # SECCIÓN 1: MOVILIDAD
    
@@ -591,36 +767,10 @@ elif st.session_state.step == 5:
     col_mapa_mov, col_data_mov = st.columns([2, 1])
 
     with col_mapa_mov:
-        fig_t = go.Figure()
-        # Zona
-        fig_t.add_trace(go.Scattermapbox(
-            lat=list(area_interes.exterior.xy[1]), lon=list(area_interes.exterior.xy[0]),
-            mode='lines', fill='toself', name='Zona analizada',
-            fillcolor='rgba(255, 165, 0, 0.1)', line=dict(color='orange', width=2)
-        ))
-        # Estaciones
-        if not transporte_zona.empty:
-            fig_t.add_trace(go.Scattermapbox(
-                lat=transporte_zona.geometry.y, lon=transporte_zona.geometry.x,
-                mode='markers', name='Paraderos',
-                marker=dict(size=10, color='#E74C3C', symbol='circle'),
-                text=transporte_zona['nombre_estacion'], hoverinfo='text'
-            ))
-        # Tú
-        fig_t.add_trace(go.Scattermapbox(
-            lat=[st.session_state.punto_lat], lon=[st.session_state.punto_lon],
-            mode='markers', name='Tú', marker=dict(size=12, color='#3498DB')
-        ))
-        fig_t.update_layout(
-            mapbox_style="carto-positron", 
-            mapbox_center={"lat": st.session_state.punto_lat, "lon": st.session_state.punto_lon},
-            mapbox_zoom=14, margin={"r":0,"t":0,"l":0,"b":0}, height=350, showlegend=True,
-            legend=dict(orientation="h", y=1.1)
-        )
-        st.plotly_chart(fig_t, use_container_width=True)
+        mapa_perezoso(diag, "movilidad", "🗺️ Mapa de transporte", use_container_width=True)
 
     with col_data_mov:
-        cant_t = len(transporte_zona)
+        cant_t = diag.num_tm
         st.metric("Puntos de Transporte", cant_t)
         
         if cant_t > 5:
@@ -630,6 +780,9 @@ elif st.session_state.step == 5:
         else:
             st.error("❌ **Zona Apartada:**\nDependerás de vehículo particular o caminatas largas.")
 
+        nota_cercania(diag, "transmilenio", "🚉", "Estación más cercana")
+        nota_tolerancia(diag, "num_tm")
+
     
 
     
@@ -642,32 +795,10 @@ elif st.session_state.step == 5:
     col_mapa_edu, col_data_edu = st.columns([2, 1])
 
     with col_mapa_edu:
-        fig_e = go.Figure()
-        fig_e.add_trace(go.Scattermapbox(
-            lat=list(area_interes.exterior.xy[1]), lon=list(area_interes.exterior.xy[0]),
-            mode='lines', fill='toself', name='Zona analizada',
-            fillcolor='rgba(155, 89, 182, 0.1)', line=dict(color='#8E44AD', width=2)
-        ))
-        if not colegios_zona.empty:
-            fig_e.add_trace(go.Scattermapbox(
-                lat=colegios_zona.geometry.y, lon=colegios_zona.geometry.x,
-                mode='markers', name='Colegios',
-                marker=dict(size=9, color='#8E44AD', symbol='circle'),
-                text=colegios_zona['nombre'], hoverinfo='text'
-            ))
-        fig_e.add_trace(go.Scattermapbox(
-            lat=[st.session_state.punto_lat], lon=[st.session_state.punto_lon],
-            mode='markers', name='Tú', marker=dict(size=12, color='#3498DB')
-        ))
-        fig_e.update_layout(
-            mapbox_style="carto-positron", 
-            mapbox_center={"lat": st.session_state.punto_lat, "lon": st.session_state.punto_lon},
-            mapbox_zoom=14, margin={"r":0,"t":0,"l":0,"b":0}, height=350, showlegend=False
-        )
-        st.plotly_chart(fig_e, use_container_width=True)
+        mapa_perezoso(diag, "educacion", "🗺️ Mapa de colegios", use_container_width=True)
 
     with col_data_edu:
-        cant_c = len(colegios_zona)
+        cant_c = diag.num_col
         st.metric("Total Colegios", cant_c)
         
         if cant_c > 3:
@@ -677,9 +808,13 @@ elif st.session_state.step == 5:
         else:
             st.error("❌ **Déficit Educativo:**\nNo se identifican colegios en el radio inmediato.")
 
-        if not colegios_zona.empty:
+        nota_cercania(diag, "colegio_oficial", "🏫", "Colegio oficial más cercano")
+        nota_cercania(diag, "colegio_privado", "🎒", "Colegio privado más cercano")
+        nota_tolerancia(diag, "num_col")
+
+        if cant_c:
             st.caption("Por tipo:")
-            st.dataframe(colegios_zona['sector'].value_counts(), use_container_width=True)
+            st.dataframe(diag.zona.conteos("colegios", "sector"), use_container_width=True)
 
     # --- SECCIÓN SALUD ---
     st.markdown("---")
@@ -689,44 +824,10 @@ elif st.session_state.step == 5:
     col_mapa_salud, col_data_salud = st.columns([2, 1])
 
     with col_mapa_salud:
-        fig_s = go.Figure()
-        
-        # 1. Zona (Círculo Naranja)
-        fig_s.add_trace(go.Scattermapbox(
-            lat=list(area_interes.exterior.xy[1]), lon=list(area_interes.exterior.xy[0]),
-            mode='lines', fill='toself', name='Zona analizada',
-            fillcolor='rgba(255, 165, 0, 0.1)', line=dict(color='orange', width=2)
-        ))
-        
-        # 2. Hospitales (Puntos)
-        if not salud_zona.empty:
-            fig_s.add_trace(go.Scattermapbox(
-                lat=salud_zona.geometry.y, lon=salud_zona.geometry.x,
-                mode='markers', name='Salud',
-                # Usamos símbolo de cruz y color Rojo
-                marker=dict(size=12, color="#0905F7", symbol='circle'),
-                # Ajusta 'nombre_hospital' si tu columna se llama diferente
-                text=salud_zona.get('nombre_hospital', 'Centro de Salud'), 
-                hoverinfo='text'
-            ))
-            
-        # 3. Tú (Punto Azul)
-        fig_s.add_trace(go.Scattermapbox(
-            lat=[st.session_state.punto_lat], lon=[st.session_state.punto_lon],
-            mode='markers', name='Tú', marker=dict(size=12, color='#3498DB')
-        ))
-        
-        # Configuración igual a Movilidad
-        fig_s.update_layout(
-            mapbox_style="carto-positron", 
-            mapbox_center={"lat": st.session_state.punto_lat, "lon": st.session_state.punto_lon},
-            mapbox_zoom=14, margin={"r":0,"t":0,"l":0,"b":0}, height=350, showlegend=True,
-            legend=dict(orientation="h", y=1.1)
-        )
-        st.plotly_chart(fig_s, use_container_width=True, key="mapa_salud_unico")
+        mapa_perezoso(diag, "salud", "🗺️ Mapa de salud", use_container_width=True, key="mapa_salud_unico")
 
     with col_data_salud:
-        cant_s = len(salud_zona)
+        cant_s = diag.num_salud
         st.metric("Centros de Salud", cant_s)
         
         if cant_s > 1:
@@ -736,6 +837,9 @@ elif st.session_state.step == 5:
         else:
             st.error("❌ **Sin Cobertura Inmediata:**\nNo hay hospitales en este radio exacto.")
 
+        nota_cercania(diag, "salud", "🏥", "Unidad de salud más cercana")
+        nota_tolerancia(diag, "num_salud")
+
     # --- SECCIÓN PARQUES (POLÍGONOS) ---
     st.markdown("---")
     st.markdown("### 🌳 6. Espacio Público y Verde")
@@ -744,55 +848,11 @@ elif st.session_state.step == 5:
     col_mapa_ver, col_data_ver = st.columns([2, 1])
 
     with col_mapa_ver:
-        fig_v = go.Figure()
-        
-        # 1. Zona de Análisis (Círculo Naranja)
-        fig_v.add_trace(go.Scattermapbox(
-            lat=list(area_interes.exterior.xy[1]), lon=list(area_interes.exterior.xy[0]),
-            mode='lines', fill='toself', name='Zona analizada',
-            fillcolor='rgba(255, 165, 0, 0.05)', # Muy transparente
-            line=dict(color='orange', width=2)
-        ))
-        
-        # 2. PARQUES (POLÍGONOS REALES)
-        if not parques_zona.empty:
-            # Importamos json aquí por si acaso
-            import json
-            # Convertimos las geometrías a GeoJSON para pintarlas
-            geojson_parques = json.loads(parques_zona.to_json())
-            
-            # Usamos Choroplethmapbox para pintar el relleno verde
-            fig_v.add_trace(go.Choroplethmapbox(
-                geojson=geojson_parques,
-                locations=parques_zona.index, # ID de enlace
-                z=[1] * len(parques_zona),    # Valor dummy para color uniforme
-                colorscale=[[0, '#27AE60'], [1, '#27AE60']], # Verde 'Jardín'
-                showscale=False,              # Sin barra de colores
-                marker_opacity=0.7,
-                marker_line_width=1,
-                marker_line_color='white',
-                name='Zonas Verdes',
-                # Texto al pasar el mouse
-                text=parques_zona.get('nombre_parque', 'Parque / Zona Verde'),
-                hoverinfo='text'
-            ))
-            
-        # 3. Tú 
-        fig_v.add_trace(go.Scattermapbox(
-            lat=[st.session_state.punto_lat], lon=[st.session_state.punto_lon],
-            mode='markers', name='Tú', marker=dict(size=14, color='#2980B9', symbol='circle')
-        ))
-        
-        fig_v.update_layout(
-            mapbox_style="carto-positron", 
-            mapbox_center={"lat": st.session_state.punto_lat, "lon": st.session_state.punto_lon},
-            mapbox_zoom=14.5, margin={"r":0,"t":0,"l":0,"b":0}, height=350, showlegend=True,
-            legend=dict(orientation="h", y=1.1)
-        )
-        st.plotly_chart(fig_v, use_container_width=True, key="mapa_parques_poligonos")
+        mapa_perezoso(diag, "parques", "🗺️ Mapa de parques", teselas=teselas,
+                      use_container_width=True, key="mapa_parques_poligonos")
 
     with col_data_ver:
-        cant_p = len(parques_zona)
+        cant_p = diag.num_parques
         st.metric("Parques Cercanos", cant_p)
         
         
@@ -803,6 +863,9 @@ elif st.session_state.step == 5:
         else:
             st.error("🏢 **Entorno 100% Urbano:**\nEstás en una zona densa. Tendrás que desplazarte un poco para encontrar zonas verdes amplias.")
 
+        nota_cercania(diag, "parque", "🌳", "Parque más cercano (al borde)")
+        nota_tolerancia(diag, "num_parques")
+
 
 
     # SECCIÓN 3: ESTRATIFICACIÓN
@@ -811,26 +874,13 @@ elif st.session_state.step == 5:
     st.markdown("### 🏘️ 3. ¿Cómo es el vecindario? (Estratos)")
     st.markdown("Nivel socioeconómico predominante en las manzanas del sector.")
 
-    if not manzanas_zona.empty:
+    if diag.num_manzanas:
         col_mapa_soc, col_data_soc = st.columns([2, 1])
         with col_mapa_soc:
-            manzanas_zona['estrato'] = manzanas_zona['estrato'].astype(int)
-            fig_s = px.choropleth_mapbox(
-                manzanas_zona, geojson=manzanas_zona.geometry, locations=manzanas_zona.index,
-                color="estrato", mapbox_style="carto-positron", zoom=14.5,
-                center={"lat": st.session_state.punto_lat, "lon": st.session_state.punto_lon},
-                opacity=0.6,
-                color_discrete_map={1:'#C0392B', 2:'#E67E22', 3:'#F1C40F', 4:'#2ECC71', 5:'#3498DB', 6:'#8E44AD'}
-            )
-            fig_s.update_layout(margin={"r":0,"t":0,"l":0,"b":0}, height=350, showlegend=False)
-            fig_s.add_trace(go.Scattermapbox(lat=list(area_interes.exterior.xy[1]), lon=list(area_interes.exterior.xy[0]), mode='lines', line=dict(color='black', width=2), name='Límite'))
-            st.plotly_chart(fig_s, use_container_width=True)
+            mapa_perezoso(diag, "estrato", "🗺️ Mapa de estratos", teselas=teselas, use_container_width=True)
         with col_data_soc:
-            st.info(f"Moda: **Estrato {manzanas_zona['estrato'].mode()[0]}**")
-            conteo_est = manzanas_zona['estrato'].value_counts().sort_index()
-            fig_b = go.Figure(data=[go.Bar(x=[f"E{i}" for i in conteo_est.index], y=conteo_est.values, marker_color='#95A5A6')])
-            fig_b.update_layout(height=200, margin=dict(l=0,r=0,t=0,b=0), paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
-            st.plotly_chart(fig_b, use_container_width=True)
+            st.info(f"Moda: **Estrato {diag.estrato_moda}**")
+            grafico(diag, "estrato_barras", use_container_width=True)
     else:
         st.warning("Sin datos residenciales.")
 
@@ -843,56 +893,10 @@ elif st.session_state.step == 5:
     st.markdown("### 🏗️ 4. ¿Qué se permite construir? (POT)")
     st.markdown("Vocación normativa proyectada sobre cada manzana del sector.")
 
-    # 1. Copia de seguridad
-    manzanas_final = manzanas_zona.copy()
-    clasificacion_exitosa = False
-
-    # Solo para ver si hay datos cargados
-    # st.write(f"Cantidad de áreas POT cargadas: {len(areas_pot)}")
-    # st.write(f"CRS Manzanas: {manzanas_final.crs}")
-    # st.write(f"CRS Áreas POT: {areas_pot.crs}")
+    clasificacion_exitosa = diag.clasificacion_exitosa
 
-    if not manzanas_final.empty and not areas_pot.empty:
-        try:
-            # Asegurar CRS idéntico
-            if areas_pot.crs != manzanas_final.crs:
-                areas_pot = areas_pot.to_crs(manzanas_final.crs)
-
-            # Reparar geometrías inválidas 
-            areas_pot['geometry'] = areas_pot.geometry.buffer(0)
-            manzanas_final['geometry'] = manzanas_final.geometry.buffer(0)
-
-            # CRUCE ESPACIAL
-            
-            # Esto atrapa la manzana si aunque sea un pedacito toca el área del POT.
-            cruce = gpd.sjoin(
-                manzanas_final,  # Usamos el polígono completo, no el centroide
-                areas_pot[['uso_pot_simplificado', 'geometry']], 
-                how='left', 
-                predicate='intersects' 
-            )
-            
-            # Limpieza de duplicados
-            
-            # (Simplificación: nos quedamos con la primera que encuentre para no complicar el código)
-            cruce = cruce[~cruce.index.duplicated(keep='first')]
-            
-            # Asignar
-            manzanas_final['uso_pot_simplificado'] = cruce['uso_pot_simplificado']
-            
-            # Rellenar nulos
-            manzanas_final['uso_pot_simplificado'] = manzanas_final['uso_pot_simplificado'].fillna('Sin Clasificación')
-            
-            # Validar si logramos clasificar algo
-            if len(manzanas_final[manzanas_final['uso_pot_simplificado'] != 'Sin Clasificación']) > 0:
-                clasificacion_exitosa = True
-            
-        except Exception as e:
-            st.error(f"Error técnico en el cruce: {str(e)}")
-            manzanas_final['uso_pot_simplificado'] = 'Sin Clasificación'
-    else:
+    if not diag.num_manzanas or areas_pot.empty:
         st.warning("No hay datos de POT cargados o manzanas seleccionadas.")
-        manzanas_final['uso_pot_simplificado'] = 'Sin Clasificación'
 
       
     # VISUALIZACIÓN
@@ -900,64 +904,17 @@ elif st.session_state.step == 5:
     col_mapa_pot, col_data_pot = st.columns([2, 1])
     
     with col_mapa_pot:
-        # Definir colores
-        cats = manzanas_final["uso_pot_simplificado"].unique().tolist()
-        palette = px.colors.qualitative.Bold # Usamos colores fuertes
-        
-        
-        color_map = {}
-        for i, cat in enumerate(cats):
-            if cat == "Sin Clasificación":
-                color_map[cat] = "#95A5A6" # Gris
-            else:
-                color_map[cat] = palette[i % len(palette)]
-        
-        fig_p = px.choropleth_mapbox(
-            manzanas_final, 
-            geojson=manzanas_final.geometry, 
-            locations=manzanas_final.index,
-            color="uso_pot_simplificado", 
-            color_discrete_map=color_map,
-            mapbox_style="carto-positron", 
-            zoom=14.5,
-            center={"lat": st.session_state.punto_lat, "lon": st.session_state.punto_lon},
-            opacity=0.6,
-            title="Vocación del Suelo"
-        )
-        fig_p.update_layout(margin={"r":0,"t":0,"l":0,"b":0}, height=350, showlegend=True)
-        
-        # Línea de límite
-        if 'area_interes' in locals():
-             fig_p.add_trace(go.Scattermapbox(
-                lat=list(area_interes.exterior.xy[1]), 
-                lon=list(area_interes.exterior.xy[0]), 
-                mode='lines', 
-                line=dict(color='black', width=2), 
-                name='Zona'
-            ))
-        st.plotly_chart(fig_p, use_container_width=True)
+        mapa_perezoso(diag, "pot", "🗺️ Mapa del POT", teselas=teselas, use_container_width=True)
 
     with col_data_pot:
-        conteo = manzanas_final['uso_pot_simplificado'].value_counts()
+        conteo = diag.conteo_pot
         
         # Verificar si hay datos reales
         hay_datos = not (len(conteo) == 1 and 'Sin Clasificación' in conteo)
         
         if clasificacion_exitosa and hay_datos:
-            moda = conteo.index[0]
-            st.info(f"Uso predominante: **{moda}**")
-            
-            # Usar los mismos colores del mapa
-            colores_barras = [color_map.get(x, '#333') for x in conteo.index]
-            
-            fig_bp = go.Figure(data=[go.Bar(
-                y=[str(x)[:25] for x in conteo.index], 
-                x=conteo.values, 
-                orientation='h',
-                marker_color=colores_barras
-            )])
-            fig_bp.update_layout(height=250, margin=dict(l=0,r=0,t=0,b=0), yaxis=dict(autorange="reversed"))
-            st.plotly_chart(fig_bp, use_container_width=True)
+            st.info(f"Uso predominante: **{diag.uso_moda}**")
+            grafico(diag, "pot_barras", use_container_width=True)
         else:
             st.warning("⚠️ No se cruzó información.")
             st.markdown("""
@@ -999,275 +956,21 @@ elif st.session_state.step == 5:
 # PASO 5: REPORTE EJECUTIVO (VERSIÓN FINAL - MAPA DETALLADO Y TEXTOS)
 
 if st.session_state.step == 5: 
-    import base64
-    import plotly.graph_objects as go
-    import geopandas as gpd
-
     st.markdown("---")
     st.header("📑 Informe Ejecutivo")
 
-    # RECUPERACIÓN Y PROCESAMIENTO DE DATOS
-    
-    # Recuperar Dataframe de Manzanas
-    if 'manzanas_final' in locals() and not manzanas_final.empty:
-        df_reporte = manzanas_final.copy()
-    else:
-        df_reporte = manzanas_zona.copy()
-        # Cruce con POT si la columna no existe
-        if not areas_pot.empty and 'uso_pot_simplificado' not in df_reporte.columns:
-            try:
-                if areas_pot.crs != df_reporte.crs:
-                    areas_pot = areas_pot.to_crs(df_reporte.crs)
-                cruce = gpd.sjoin(df_reporte, areas_pot[['uso_pot_simplificado', 'geometry']], how='left', predicate='intersects')
-                cruce = cruce[~cruce.index.duplicated(keep='first')]
-                df_reporte['uso_pot_simplificado'] = cruce['uso_pot_simplificado']
-            except:
-                pass 
-
-    # Calcular KPIs (Los 5 puntos clave)
-    num_tm = len(transporte_zona)
-    num_col = len(colegios_zona)
-    # --- NUEVOS KPIs ---
-    num_salud = len(salud_zona)
-    num_parques = len(parques_zona)
-    
-    # 3. Normativa (POT) - Moda
-    if 'uso_pot_simplificado' not in df_reporte.columns:
-        df_reporte['uso_pot_simplificado'] = "Sin Clasificación"
-    uso_moda = df_reporte['uso_pot_simplificado'].fillna("Sin Clasificación").mode()[0]
-    
-    # 4. Estratificación (Moda)
-    try:
-        if 'estrato' in df_reporte.columns:
-            estrato_moda = int(df_reporte['estrato'].mode()[0])
-        else:
-            estrato_moda = "N/A"
-    except:
-        estrato_moda = "N/A"
-
     # 5. Seguridad
     localidad = st.session_state.localidad_sel
     datos_loc = localidades[localidades['nombre_localidad'] == localidad].iloc[0]
     seguridad_texto = datos_loc.get('top_3_delitos', 'No disponible')
-    
-    # Formatear seguridad en lista vertical
-    if "," in seguridad_texto:
-        items_seg = seguridad_texto.split(",")
-        lista_seguridad_html = "<ul style='margin-top:5px; margin-bottom:5px;'>"
-        for item in items_seg:
-            lista_seguridad_html += f"<li>{item.strip()}</li>"
-        lista_seguridad_html += "</ul>"
-    else:
-        lista_seguridad_html = f"<p>{seguridad_texto}</p>"
-
-    # Variables de Contexto
-    radio = st.session_state.radio_analisis
-    lat, lon = st.session_state.punto_lat, st.session_state.punto_lon
-
-    # ALGORITMO DE SCORING VIABILIDAD (ACTUALIZADO 5 PUNTOS)
-    score = 0
-    if num_tm >= 2: score += 1      # Transporte
-    if num_col >= 1: score += 1     # Educación
-    if uso_moda != "Sin Clasificación": score += 1 # Normativa
-    if num_parques >= 1: score += 1 # Parques (NUEVO)
-    if num_salud >= 1: score += 1   # Salud (NUEVO)
-    
-    # Recalibración del dictamen
-    if score >= 4:
-        dictamen = "VIABILIDAD ALTA ⭐⭐⭐"
-        color_fondo = "#27AE60"
-    elif score >= 2:
-        dictamen = "VIABILIDAD MEDIA ⭐⭐"
-        color_fondo = "#F39C12"
-    else:
-        dictamen = "VIABILIDAD RESTRINGIDA ⭐"
-        color_fondo = "#C0392B"
 
-    # GENERACIÓN DE IMAGEN ESTÁTICA PARA EL REPORTE
-    with st.spinner("Generando mapa detallado con estaciones, colegios y bienestar..."):
-        try:
-            fig_mapa = go.Figure()
-
-            # Radio de Influencia
-            if 'area_interes' in locals():
-                lats_poly = list(area_interes.exterior.xy[1])
-                lons_poly = list(area_interes.exterior.xy[0])
-                fig_mapa.add_trace(go.Scattermapbox(
-                    lat=lats_poly, lon=lons_poly,
-                    mode='lines', fill='toself',
-                    fillcolor='rgba(52, 152, 219, 0.1)',
-                    line=dict(color='#3498DB', width=2),
-                    name='Zona'
-                ))
-
-            # Estaciones de Transmilenio
-            if not transporte_zona.empty:
-                fig_mapa.add_trace(go.Scattermapbox(
-                    lat=transporte_zona.geometry.y,
-                    lon=transporte_zona.geometry.x,
-                    mode='markers',
-                    marker=dict(size=6, color='#E74C3C'), # Rojo
-                    name='Estaciones'
-                ))
-
-            # Colegios
-            if not colegios_zona.empty:
-                fig_mapa.add_trace(go.Scattermapbox(
-                    lat=colegios_zona.geometry.y,
-                    lon=colegios_zona.geometry.x,
-                    mode='markers',
-                    marker=dict(size=6, color="#9625C7"), # Morado
-                    name='Colegios'
-                ))
-
-            # --- NUEVO: SALUD ---
-            if not salud_zona.empty:
-                fig_mapa.add_trace(go.Scattermapbox(
-                    lat=salud_zona.geometry.y,
-                    lon=salud_zona.geometry.x,
-                    mode='markers',
-                    marker=dict(size=6, color="#3A07F3", symbol='circle'), 
-                    name='Salud'
-                ))
-
-            # --- NUEVO: PARQUES (Puntos centroides para la imagen estática) ---
-            if not parques_zona.empty:
-                centros = parques_zona.geometry.centroid
-                fig_mapa.add_trace(go.Scattermapbox(
-                    lat=centros.y,
-                    lon=centros.x,
-                    mode='markers',
-                    marker=dict(size=6, color="#178B27", symbol='circle'), 
-                    name='Parques'
-                ))
-
-            # El PIN del Usuario
-            fig_mapa.add_trace(go.Scattermapbox(
-                lat=[lat], lon=[lon],
-                mode='markers',
-                marker=dict(size=12, color='black', symbol='circle'),
-                name='Ubicación'
-            ))
-
-            fig_mapa.update_layout(
-                mapbox_style="carto-positron",
-                mapbox_zoom=14.5,
-                mapbox_center={"lat": lat, "lon": lon},
-                margin={"r":0,"t":0,"l":0,"b":0},
-                showlegend=False
-            )
-            
-            # Exportar a Base64 para poder incrustar en HTML
-            img_bytes = fig_mapa.to_image(format="png", width=600, height=350, scale=2)
-            b64_mapa = base64.b64encode(img_bytes).decode('utf-8')
-            html_mapa = f'<img src="data:image/png;base64,{b64_mapa}" style="width:100%; border-radius:8px; border:1px solid #ccc;">'
-            
-        except Exception as e:
-            html_mapa = f"<div style='padding:20px; background:#f0f0f0;'>Mapa no disponible ({str(e)})</div>"
-    
-    # Generar marca de tiempo con Zona Horaria de Colombia
-    from datetime import datetime
-    import pytz # Librería para zonas horarias
+    # El HTML (mapa incluido) se genera en el pool de procesos (ver servicio_informes.py)
+    # y solo cuando el usuario lo pide: la sesión encola el trabajo y consulta su estado.
+    servicio = servicio_informes_compartido()
+    clave_informe = diagnostico.clave_diagnostico(
+        diag.lat, diag.lon, diag.radio, diagnostico.version_datos(indice, red)
+    ) + (localidad,)
 
-    zona_bogota = pytz.timezone('America/Bogota')
-    
-    ahora_bogota = datetime.now(zona_bogota)
-    
-    fecha_reporte = ahora_bogota.strftime("%d/%m/%Y %I:%M %p") 
-
-    # PLANTILLA HTML MEJORADA CON LEYENDA DE COLORES
-    html_report = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <style>
-            body {{ font-family: 'Helvetica', sans-serif; max-width: 800px; margin: 0 auto; color: #333; }}
-            .header {{ text-align: center; padding: 25px; background: #2C3E50; color: white; border-radius: 0 0 10px 10px; }}
-            .card {{ border: 1px solid #ddd; padding: 20px; border-radius: 8px; margin-top: 20px; box-shadow: 0 4px 6px rgba(0,0,0,0.05); }}
-            .intro-text {{ font-size: 14px; color: #555; font-style: italic; margin-bottom: 15px; text-align: justify; }}
-            
-            /* Estilo Tabla KPI */
-            .kpi-table {{ width: 100%; border-collapse: collapse; margin-top: 15px; }}
-            .kpi-table th {{ background-color: #F4F6F7; padding: 8px; text-align: left; border: 1px solid #ddd; font-size: 11px; color: #555; vertical-align: middle; }}
-            .kpi-table td {{ padding: 10px; text-align: center; border: 1px solid #ddd; font-size: 16px; font-weight: bold; color: #2C3E50; }}
-            
-            /* Círculos de Colores (Leyenda) */
-            .dot {{
-                height: 10px;
-                width: 10px;
-                border-radius: 50%;
-                display: inline-block;
-                margin-right: 5px;
-                border: 1px solid #ccc;
-            }}
-
-            .dictamen-box {{ margin-top: 20px; padding: 20px; background: {color_fondo}; color: white; text-align: center; border-radius: 8px; }}
-            .security-box {{ margin-top: 10px; padding: 15px; background: #FDEDEC; border-left: 5px solid #C0392B; color: #922B21; }}
-        </style>
-    </head>
-    <body>
-        <div class="header">
-            <h1 style="margin:0;">Ficha de Inteligencia Territorial</h1>
-            <p style="margin:5px 0 0;">Bogotá D.C. | Localidad {localidad}</p>
-        </div>
-
-        <div class="card">
-            <h3 style="margin-top:0; border-bottom: 1px solid #eee; padding-bottom: 10px;">📍 Análisis de Entorno y Cobertura</h3>
-            
-            <p class="intro-text">
-                Una vez evaluada la zona seleccionada en las coordenadas ({lat:.4f}, {lon:.4f}) con un radio de {radio} metros, 
-                es importante determinar los factores de infraestructura, bienestar y normativa detallados:
-            </p>
-            
-            {html_mapa}
-            
-            <table class="kpi-table">
-                <tr>
-                    <th><span class="dot" style="background-color: #E74C3C;"></span>TRANSMILENIO</th>
-                    <th><span class="dot" style="background-color: #9625C7;"></span>COLEGIOS</th>
-                    <th><span class="dot" style="background-color: #178B27;"></span>PARQUES</th>
-                    <th><span class="dot" style="background-color: #3A07F3;"></span>SALUD</th>
-                    <th>MODA ESTRATO</th>
-                    <th>MODA USO POT</th>
-                </tr>
-                <tr>
-                    <td>{num_tm}</td>
-                    <td>{num_col}</td>
-                    <td>{num_parques}</td>
-                    <td>{num_salud}</td>
-                    <td>{estrato_moda}</td>
-                    <td style="font-size:12px;">{uso_moda}</td>
-                </tr>
-            </table>
-        </div>
-
-        <div class="card">
-            <h3 style="margin-top:0; border-bottom: 1px solid #eee; padding-bottom: 10px;">🛡️ Contexto de Seguridad</h3>
-            <p class="intro-text">
-                A nivel de la localidad de {localidad}, es prudente destacar que el entorno de seguridad se caracteriza 
-                por la prevalencia de los siguientes incidentes de alto impacto:
-            </p>
-            <div class="security-box">
-                {lista_seguridad_html}
-            </div>
-        </div>
-
-        <div class="dictamen-box">
-            <p style="margin:0; font-size:14px; opacity:0.9;">DICTAMEN TÉCNICO MULTIDIMENSIONAL</p>
-            <h2 style="margin:5px 0 0; font-size:24px;">{dictamen}</h2>
-            <p style="margin-top:10px; font-size:12px;">Basado en 5 factores: Movilidad, Educación, Salud, Espacio Público y Normativa.</p>
-        </div>
-        
-        <div style="text-align: center; margin-top: 30px; color: #999; font-size: 11px;">
-            Reporte generado automáticamente con Datos Abiertos de Bogotá | {fecha_reporte}
-        </div>
-    </body>
-    </html>
-    """
-
-   
-   
     # ZONA DE DESCARGA Y ACCIONES
     st.markdown("---")
     
@@ -1275,16 +978,23 @@ if st.session_state.step == 5:
     # [1, 1, 2] significa: Pequeña, Pequeña, Grande (para el botón del Gemelo)
     col1, col2, col3 = st.columns([1, 1, 2])
     
-    # 1. Botón Descargar Reporte
+    # 1. Botón Preparar / Descargar Reporte (la descarga aparece cuando el informe termina)
     with col1:
         # Estilo para botón verde
         st.markdown("""<style>div.stDownloadButton > button {background-color: #27AE60 !important; color: white !important; width: 100%;}</style>""", unsafe_allow_html=True)
-        st.download_button(
-            label="📥 Descargar Ficha",
-            data=html_report,
-            file_name=f"Ficha_{localidad}.html",
-            mime="text/html"
-        )
+        estado_informe = servicio.estado(clave_informe)
+        if estado_informe is None or estado_informe["estado"] == servicio_informes.ERROR:
+            if estado_informe is not None:
+                st.caption(f"⚠️ La ficha anterior falló: {estado_informe['error']}")
+            if st.button("📄 Preparar Ficha", use_container_width=True):
+                with instrumentacion.tramo("paso5.encolar_informe"):
+                    servicio.enviar(clave_informe, informe.datos_informe(diag, localidad, seguridad_texto))
+                estado_informe = servicio.estado(clave_informe)
+        if estado_informe is not None and estado_informe["estado"] != servicio_informes.ERROR:
+            pendiente = estado_informe["estado"] in (servicio_informes.EN_COLA, servicio_informes.EN_PROCESO)
+            st.fragment(run_every=INTERVALO_SONDEO if pendiente else None)(
+                boton_descarga_informe
+            )(clave_informe, f"Ficha_{localidad}.html", pendiente)
         
     # 2. Botón Nuevo Análisis
     with col2:
@@ -1296,22 +1006,9 @@ if st.session_state.step == 5:
 
     # 3. Botón GEMELO DIGITAL (Cesium)
     with col3:
-        # Importante: Asegúrate de tener 'import urllib.parse' al inicio del script
-        
-        # URL DE TU GITHUB (Ya no localhost)
-        URL_BASE_CESIUM = "https://andres-fuentex.github.io/COPIA_CONCU/index.html" 
-        
-        # Construir Parámetros
-        params_payload = {
-            "lat": st.session_state.punto_lat,
-            "lon": st.session_state.punto_lon,
-            "radio": st.session_state.radio_analisis,
-            "loc": st.session_state.localidad_sel,
-            "altura": "800" # Un poco más alto para mejor vista inicial
-        }
-        
-        query_string = urllib.parse.urlencode(params_payload)
-        url_final = f"{URL_BASE_CESIUM}?{query_string}"
+        # Visor en GitHub Pages; los equipamientos de la zona viajan ya filtrados y
+        # comprimidos en el fragmento del enlace (ver gemelo_3d.py)
+        url_final = gemelo_3d.url_gemelo(diag, st.session_state.localidad_sel)
         
         # Botón HTML personalizado (Negro/Azul oscuro)
         st.markdown(f"""
@@ -1332,4 +1029,26 @@ if st.session_state.step == 5:
                     🚀 VER EN 3D (CESIUM)
                 </button>
             </a>
-        """, unsafe_allow_html=True)
\ No newline at end of file
+        """, unsafe_allow_html=True)
+
+
+# PANEL DE TIEMPOS (ADMINISTRACIÓN)
+# Tiempos del rerun completo por paso (los reruns cortados con st.rerun() no llegan aquí)
+instrumentacion.registrar(f"paso{st.session_state.step}.rerun", (time.perf_counter() - inicio_rerun) * 1000)
+
+if PANEL_ADMIN or st.query_params.get("admin") == "1":
+    with st.sidebar:
+        st.markdown("### ⏱️ Tiempos por tramo")
+        st.caption("Esta sesión")
+        st.dataframe(pd.DataFrame(st.session_state.metricas.resumen()), hide_index=True)
+
+# Lo que es de todo el proceso (y el reinicio, que afecta a todas las sesiones) solo con BOGOTA_PANEL_ADMIN
+if PANEL_ADMIN:
+    with st.sidebar:
+        st.caption("Todo el proceso")
+        st.dataframe(pd.DataFrame(instrumentacion.METRICAS.resumen()), hide_index=True)
+        st.download_button("⬇️ JSON", instrumentacion.METRICAS.a_json(), "tiempos.json", "application/json")
+        st.download_button("⬇️ Prometheus", instrumentacion.METRICAS.a_prometheus(), "tiempos.prom", "text/plain")
+        if st.button("🧹 Reiniciar tiempos"):
+            instrumentacion.METRICAS.reiniciar()
+            st.session_state.metricas.reiniciar()
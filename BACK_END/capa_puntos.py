@@ -0,0 +1,191 @@
+# Capas de puntos compactas
+"""
+Representación liviana de las capas de puntos (transporte, colegios, salud).
+
+En vez de un GeoDataFrame con un objeto shapely Point por fila y columnas de
+texto de tipo objeto, cada capa guarda:
+
+* x, y: arreglos float64 contiguos en metros (EPSG:3116),
+* los atributos como categorías (sector, calendario, troncal_estacion y
+  también los nombres: cada texto distinto se guarda una sola vez y las filas
+  solo llevan su código).
+
+Las consultas por radio y de vecinos más cercanos son cálculos vectorizados
+de distancias, exactos en metros; los objetos shapely (y el STRtree para
+consultas por lotes) se construyen solo si alguien los pide.
+"""
+import numpy as np
+import pandas as pd
+import pyproj
+import shapely
+
+CRS_METRICO = "EPSG:3116"
+CAPAS_PUNTUALES = ("transporte", "colegios", "salud")
+
+_A_METRICO = pyproj.Transformer.from_crs("EPSG:4326", CRS_METRICO, always_xy=True)
+_A_GPS = pyproj.Transformer.from_crs(CRS_METRICO, "EPSG:4326", always_xy=True)
+
+
+def a_metrico(lon, lat):
+    """(lon, lat) en EPSG:4326 -> (x, y) en EPSG:3116. Acepta escalares o arreglos."""
+    return _A_METRICO.transform(lon, lat)
+
+
+def a_gps(x, y):
+    """(x, y) en EPSG:3116 -> (lon, lat) en EPSG:4326."""
+    return _A_GPS.transform(x, y)
+
+
+def es_capa_de_puntos(gdf):
+    geoms = gdf.geometry.dropna()
+    return len(geoms) > 0 and bool((geoms.geom_type == "Point").all())
+
+
+class CapaPuntos:
+    """
+    Capa de puntos en arreglos. `atributos` es un DataFrame de columnas
+    categóricas alineado con x e y (posición i = punto i).
+    Expone attrs y len() como el GeoDataFrame del que sale.
+    """
+
+    def __init__(self, gdf):
+        gdf = gdf[gdf.geometry.notna() & ~gdf.geometry.is_empty]
+        metrico = gdf.geometry.to_crs(CRS_METRICO)
+        self.x = np.ascontiguousarray(metrico.x.to_numpy(dtype=np.float64))
+        self.y = np.ascontiguousarray(metrico.y.to_numpy(dtype=np.float64))
+        self.atributos = pd.DataFrame({
+            columna: pd.Categorical(gdf[columna].to_numpy(dtype=object))
+            for columna in gdf.columns if columna != gdf.geometry.name
+        })
+        self.attrs = dict(gdf.attrs)
+        self._arboles = {}
+        self._mascaras = {}
+
+    def __len__(self):
+        return len(self.x)
+
+    @property
+    def empty(self):
+        return len(self.x) == 0
+
+    @property
+    def columns(self):
+        return self.atributos.columns
+
+    def __getitem__(self, columna):
+        return self.atributos[columna]
+
+    def dentro_de_radio(self, x, y, radio):
+        """Posiciones (en orden) de los puntos a `radio` metros o menos de (x, y)."""
+        d2 = (self.x - x) ** 2 + (self.y - y) ** 2
+        return np.flatnonzero(d2 <= float(radio) ** 2)
+
+    def tabla(self, posiciones=None):
+        """
+        DataFrame liviano (lon, lat, x, y y atributos) de las posiciones pedidas,
+        para pintar o listar. Las coordenadas GPS se calculan aquí.
+        """
+        if posiciones is None:
+            posiciones = np.arange(len(self.x))
+        x, y = self.x[posiciones], self.y[posiciones]
+        lon, lat = a_gps(x, y)
+        tabla = self.atributos.iloc[posiciones].reset_index(drop=True)
+        tabla.insert(0, "lat", lat)
+        tabla.insert(0, "lon", lon)
+        tabla["x"] = x
+        tabla["y"] = y
+        return tabla
+
+    def geometrias(self, crs="EPSG:4326"):
+        """Puntos shapely (solo cuando alguien los necesita)."""
+        if crs == CRS_METRICO:
+            return shapely.points(self.x, self.y)
+        lon, lat = a_gps(self.x, self.y)
+        return shapely.points(lon, lat)
+
+    @property
+    def arbol(self):
+        """STRtree sobre los puntos en metros, construido la primera vez que se usa."""
+        return self._arbol_filtrado(None)
+
+    def _arbol_filtrado(self, filtro):
+        """STRtree de los puntos que cumplen `filtro` (todos si es None), construido una vez."""
+        if filtro not in self._arboles:
+            if filtro is None:
+                geoms = self.geometrias(CRS_METRICO)
+            else:
+                mascara = self.mascara(*filtro)
+                geoms = shapely.points(self.x[mascara], self.y[mascara])
+            self._arboles[filtro] = shapely.STRtree(geoms)
+        return self._arboles[filtro]
+
+    def mascara(self, columna, valor):
+        """Arreglo booleano de los puntos con `columna` == `valor` (se calcula una vez)."""
+        clave = (columna, valor)
+        if clave not in self._mascaras:
+            self._mascaras[clave] = (self.atributos[columna] == valor).to_numpy(dtype=bool)
+        return self._mascaras[clave]
+
+    def k_cercanos(self, x, y, k=1, mascara=None):
+        """
+        (posiciones, distancias en metros) de los `k` puntos más cercanos a
+        (x, y), de menor a mayor. `mascara` (opcional) limita la búsqueda.
+        """
+        candidatos = np.arange(len(self.x)) if mascara is None else np.flatnonzero(mascara)
+        d = np.hypot(self.x[candidatos] - x, self.y[candidatos] - y)
+        k = min(int(k), len(d))
+        if k <= 0:
+            return np.array([], dtype=np.intp), np.array([], dtype=float)
+        if k < len(d):
+            elegidos = np.argpartition(d, k - 1)[:k]
+            candidatos, d = candidatos[elegidos], d[elegidos]
+        orden = np.lexsort((candidatos, d))
+        return candidatos[orden], d[orden]
+
+    def distancias_k(self, xs, ys, k=1, filtro=None, tam_bloque=1024):
+        """
+        Para muchos puntos a la vez: matriz (n, k) con las distancias en metros
+        a los k puntos más cercanos de la capa (o de los que cumplen `filtro`,
+        un par (columna, valor)), de menor a mayor; inf si no hay k puntos.
+        """
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        mascara = None if filtro is None else self.mascara(*filtro)
+        px = self.x if mascara is None else self.x[mascara]
+        py = self.y if mascara is None else self.y[mascara]
+        resultado = np.full((len(xs), k), np.inf)
+        m = min(k, len(px))
+        if m == 0:
+            return resultado
+        if k == 1:
+            # El más cercano sale del STRtree (filtrado) sin armar la matriz de distancias
+            arbol = self._arbol_filtrado(filtro)
+            (pos_consulta, _), distancias = arbol.query_nearest(
+                shapely.points(xs, ys), return_distance=True, all_matches=False
+            )
+            resultado[pos_consulta, 0] = distancias
+            return resultado
+        # Por bloques, para no armar de una vez la matriz completa de distancias
+        for i in range(0, len(xs), tam_bloque):
+            d = np.hypot(xs[i:i + tam_bloque, None] - px[None, :], ys[i:i + tam_bloque, None] - py[None, :])
+            if m < d.shape[1]:
+                d = np.partition(d, m - 1, axis=1)[:, :m]
+            resultado[i:i + tam_bloque, :m] = np.sort(d, axis=1)
+        return resultado
+
+    def memoria(self):
+        """(bytes de atributos, bytes de coordenadas)."""
+        return int(self.atributos.memory_usage(deep=True, index=True).sum()), self.x.nbytes + self.y.nbytes
+
+
+def compactar(capas, nombres=CAPAS_PUNTUALES):
+    """
+    Copia del dict de capas con las capas puntuales de `nombres` convertidas
+    a CapaPuntos (las que ya lo son, o no son de puntos, quedan igual).
+    """
+    resultado = dict(capas)
+    for nombre in nombres:
+        capa = resultado.get(nombre)
+        if capa is not None and not isinstance(capa, CapaPuntos) and es_capa_de_puntos(capa):
+            resultado[nombre] = CapaPuntos(capa)
+    return resultado
@@ -0,0 +1,379 @@
+# Carga de las capas geoespaciales limpias de Bogotá Visible
+"""
+Cargador local-primero de los siete datasets que consume la app.
+
+Orden de búsqueda de cada capa:
+    1. Caché binaria en disco (GeoParquet), indexada por el hash del GeoJSON de origen.
+    2. Carpeta local DATOS_LIMPIOS/.
+    3. Copia descargada previamente del repositorio remoto.
+    4. Repositorio remoto (BOGOTA_DATOS_URL), solo si no hay nada local.
+
+Las siete capas se leen en paralelo sobre un pool de hilos.
+
+El manifiesto (manifiesto()) da la huella de contenido de la fuente de cada
+capa; con él se recargan solo las capas que cambiaron (ver registro_datos.py).
+Las capas que solo existen en el repositorio remoto también se refrescan: al
+armar el manifiesto, la copia descargada se revalida cada INTERVALO_REMOTOS
+segundos con una petición condicional (ETag / Last-Modified), que no baja
+nada si no cambió. Una fuente que falla no se reintenta en cada consulta:
+espera ESPERA_FALLO segundos, el doble tras cada fallo seguido (hasta
+ESPERA_FALLO_MAX), y mientras tanto se sigue usando la copia que haya.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import geopandas as gpd
+
+import preparacion
+
+# Rutas del proyecto (independientes del directorio desde donde se lance streamlit)
+RAIZ_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIR_DATOS_LIMPIOS = os.path.join(RAIZ_PROYECTO, "DATOS_LIMPIOS")
+DIR_CACHE = os.environ.get("BOGOTA_CACHE_DIR", os.path.join(RAIZ_PROYECTO, ".cache_datos"))
+
+# Fuente remota configurable (por defecto, el repositorio público del proyecto)
+BASE_URL = os.environ.get(
+    "BOGOTA_DATOS_URL",
+    "https://github.com/andres-fuentex/COPIA_CONCU/raw/main/DATOS_LIMPIOS/"
+)
+
+# Cada cuántos segundos se revalida una capa descargada contra el remoto (0 = nunca)
+INTERVALO_REMOTOS = float(os.environ.get("BOGOTA_INTERVALO_REMOTOS", 3600))
+# Espera (segundos) antes de reintentar una descarga fallida; se duplica con cada fallo seguido
+ESPERA_FALLO = float(os.environ.get("BOGOTA_ESPERA_FALLO", 60))
+ESPERA_FALLO_MAX = 3600
+
+# Se sube cuando cambia lo que se guarda en la caché binaria (invalida lo anterior)
+VERSION_CACHE = 2
+
+RUTA_MANIFIESTO = os.path.join(DIR_CACHE, "manifiesto.json")
+
+ARCHIVOS = {
+    "localidades": "dim_localidad.geojson",
+    "areas":       "dim_area.geojson",
+    "manzanas":    "tabla_hechos.geojson",
+    "transporte":  "dim_transporte.geojson",
+    "colegios":    "dim_colegios.geojson",
+    "salud":       "dim_salud.geojson",
+    "verde":       "dim_verde.geojson"
+}
+
+# Capas que se recalculan cuando cambia otra (manzanas lleva el uso POT cruzado con áreas)
+DEPENDIENTES = {"areas": ("manzanas",)}
+
+# (ruta, tamaño, fecha de modificación) -> huella: solo se vuelve a leer un archivo que cambió
+_huellas = {}
+_lock_huellas = threading.Lock()
+
+# nombre de archivo -> {"revisada": momento de la última consulta al remoto,
+# "fallos": fallos seguidos, "reintento": momento desde el que se puede volver a intentar}
+_remotos = {}
+_lock_remotos = threading.Lock()
+
+
+def _hash_archivo(ruta):
+    """Hash SHA-256 (abreviado) del contenido de un archivo."""
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()[:16]
+
+
+def huella_archivo(ruta):
+    """Huella del contenido, recalculada solo si cambian el tamaño o la fecha del archivo."""
+    estado = os.stat(ruta)
+    clave = (os.path.abspath(ruta), estado.st_size, estado.st_mtime_ns)
+    with _lock_huellas:
+        if clave in _huellas:
+            return _huellas[clave]
+    huella = _hash_archivo(ruta)
+    with _lock_huellas:
+        _huellas[clave] = huella
+    return huella
+
+
+def _parquet_disponible():
+    """GeoParquet requiere pyarrow; sin él la app funciona igual, solo que sin caché."""
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def normalizar_crs(nombre_clave, gdf):
+    """
+    Deja cada capa en EPSG:4326.
+    Forzamos la corrección de coordenadas para Verde y Salud.
+    """
+    # CASO 1: PARQUES (dim_verde)
+    # Vienen en planas (91130...), hay que decirles que son Bogotá (3116) y pasar a GPS (4326)
+    if nombre_clave == "verde":
+        if gdf.crs is None:
+            gdf = gdf.set_crs(epsg=3116)  # Asumimos Magna Bogotá
+        return gdf.to_crs(epsg=4326)
+
+    # CASO 2: SALUD (dim_salud)
+    # Vienen en GPS (-74...), pero a veces sin etiqueta. Aseguramos que sea 4326.
+    if nombre_clave == "salud":
+        if gdf.crs is None:
+            return gdf.set_crs(epsg=4326)
+        return gdf.to_crs(epsg=4326)
+
+    # CASO 3: EL RESTO
+    if gdf.crs is None:
+        return gdf.set_crs(epsg=4326)
+    if gdf.crs.to_string() != "EPSG:4326":
+        return gdf.to_crs("EPSG:4326")
+    return gdf
+
+
+def _leer_validadores(ruta_descarga):
+    try:
+        with open(f"{ruta_descarga}.http.json", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _descargar(url, ruta_descarga):
+    """
+    Baja `url` a `ruta_descarga` de forma atómica. Si ya hay copia, la petición
+    es condicional: con 304 (sin cambios) no se toca el archivo.
+    Devuelve True si el archivo cambió.
+    """
+    peticion = urllib.request.Request(url)
+    if os.path.exists(ruta_descarga):
+        validadores = _leer_validadores(ruta_descarga)
+        if validadores.get("etag"):
+            peticion.add_header("If-None-Match", validadores["etag"])
+        if validadores.get("last_modified"):
+            peticion.add_header("If-Modified-Since", validadores["last_modified"])
+    try:
+        respuesta = urllib.request.urlopen(peticion, timeout=60)
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return False
+        raise
+
+    ruta_temporal = f"{ruta_descarga}.{os.getpid()}.tmp"
+    with respuesta, open(ruta_temporal, "wb") as f:
+        for bloque in iter(lambda: respuesta.read(1 << 20), b""):
+            f.write(bloque)
+        validadores = {"etag": respuesta.headers.get("ETag"),
+                       "last_modified": respuesta.headers.get("Last-Modified")}
+    os.replace(ruta_temporal, ruta_descarga)
+    # ETag / Last-Modified de la copia, para la próxima petición condicional
+    ruta_temporal = f"{ruta_descarga}.http.json.{os.getpid()}.tmp"
+    with open(ruta_temporal, "w", encoding="utf-8") as f:
+        json.dump(validadores, f)
+    os.replace(ruta_temporal, f"{ruta_descarga}.http.json")
+    return True
+
+
+def ubicar_fuente(nombre_archivo, base_url=None, refrescar_remotos=False, revalidar=False):
+    """
+    Devuelve la ruta local del GeoJSON, descargándolo solo si no existe en
+    DATOS_LIMPIOS ni en la carpeta de descargas de la caché. Con `revalidar`
+    la copia descargada se compara con el remoto si pasaron INTERVALO_REMOTOS
+    segundos desde la última vez; con `refrescar_remotos`, siempre.
+    """
+    ruta_local = os.path.join(DIR_DATOS_LIMPIOS, nombre_archivo)
+    if os.path.exists(ruta_local):
+        return ruta_local
+
+    dir_descargas = os.path.join(DIR_CACHE, "descargas")
+    ruta_descarga = os.path.join(dir_descargas, nombre_archivo)
+    existe = os.path.exists(ruta_descarga)
+    ahora = time.monotonic()
+    with _lock_remotos:
+        estado = _remotos.setdefault(nombre_archivo, {"revisada": ahora, "fallos": 0, "reintento": 0.0})
+        if existe and not refrescar_remotos:
+            if not revalidar or INTERVALO_REMOTOS <= 0 or ahora - estado["revisada"] < INTERVALO_REMOTOS:
+                return ruta_descarga
+        if ahora < estado["reintento"]:
+            # Falló hace poco: se sigue con la copia que haya, sin volver a intentar todavía
+            if existe:
+                return ruta_descarga
+            raise OSError(f"{nombre_archivo}: descarga en espera tras {estado['fallos']} fallo(s)")
+
+    os.makedirs(dir_descargas, exist_ok=True)
+    try:
+        _descargar(f"{base_url or BASE_URL}{nombre_archivo}", ruta_descarga)
+    except Exception:
+        with _lock_remotos:
+            estado["fallos"] += 1
+            estado["reintento"] = time.monotonic() + min(
+                ESPERA_FALLO * 2 ** (estado["fallos"] - 1), ESPERA_FALLO_MAX
+            )
+        if existe:
+            return ruta_descarga
+        raise
+    with _lock_remotos:
+        estado.update(revisada=time.monotonic(), fallos=0, reintento=0.0)
+    return ruta_descarga
+
+
+def _guardar_en_cache(gdf, ruta_cache, prefijo):
+    """Escribe el GeoParquet de forma atómica y borra versiones viejas del mismo prefijo."""
+    os.makedirs(DIR_CACHE, exist_ok=True)
+    # Borramos versiones viejas para que la caché no crezca sin límite
+    for viejo in os.listdir(DIR_CACHE):
+        if viejo.startswith(prefijo) and viejo.endswith(".parquet"):
+            try:
+                os.remove(os.path.join(DIR_CACHE, viejo))
+            except OSError:
+                pass  # Otro proceso pudo haberla borrado primero
+    ruta_temporal = f"{ruta_cache}.{os.getpid()}.tmp"
+    gdf.to_parquet(ruta_temporal)
+    os.replace(ruta_temporal, ruta_cache)
+
+
+def cargar_capa(nombre_clave, nombre_archivo, base_url=None, usar_cache=True, refrescar_remotos=False):
+    """
+    Lee una capa desde la caché binaria o, si no está, desde su GeoJSON.
+    Las geometrías inválidas se reparan aquí (una vez por versión del archivo)
+    y el reporte de validez queda en gdf.attrs["validez"].
+    """
+    ruta_fuente = ubicar_fuente(nombre_archivo, base_url, refrescar_remotos)
+
+    # La huella del contenido identifica la versión de la capa (caché binaria,
+    # caché de diagnósticos, etc.) y viaja con el GeoDataFrame en gdf.attrs
+    huella = huella_archivo(ruta_fuente)
+
+    ruta_cache = None
+    if usar_cache and _parquet_disponible():
+        ruta_cache = os.path.join(DIR_CACHE, f"{nombre_clave}-{huella}-v{VERSION_CACHE}.parquet")
+        if os.path.exists(ruta_cache):
+            gdf = gpd.read_parquet(ruta_cache)
+            gdf.attrs["huella"] = huella
+            return gdf
+
+    gdf = normalizar_crs(nombre_clave, gpd.read_file(ruta_fuente))
+    gdf, validez = preparacion.reparar_geometrias(gdf)
+    gdf.attrs["huella"] = huella
+    gdf.attrs["validez"] = validez
+
+    if ruta_cache:
+        _guardar_en_cache(gdf, ruta_cache, f"{nombre_clave}-")
+
+    return gdf
+
+
+def preparar_manzanas(manzanas, areas, usar_cache=True):
+    """
+    Agrega a las manzanas la columna precalculada uso_pot_simplificado (uso
+    dominante por área de traslape). Depende de la versión de ambas capas.
+    """
+    huella = f"{manzanas.attrs.get('huella', '')}-{areas.attrs.get('huella', '')}"
+
+    ruta_cache = None
+    if usar_cache and _parquet_disponible():
+        ruta_cache = os.path.join(DIR_CACHE, f"manzanas_pot-{huella}-v{VERSION_CACHE}.parquet")
+        if os.path.exists(ruta_cache):
+            preparadas = gpd.read_parquet(ruta_cache)
+            preparadas.attrs.update(manzanas.attrs)
+            return preparadas
+
+    preparadas = manzanas.copy()
+    preparadas["uso_pot_simplificado"] = preparacion.asignar_uso_pot(manzanas, areas)
+
+    if ruta_cache:
+        _guardar_en_cache(preparadas, ruta_cache, "manzanas_pot-")
+
+    return preparadas
+
+
+def cargar_todo(base_url=None, usar_cache=True, refrescar_remotos=False, max_hilos=None,
+                nombres=None, previas=None):
+    """
+    Carga las siete capas en paralelo.
+    Devuelve (dataframes, errores); si hubo errores, dataframes queda incompleto.
+
+    Con `nombres` solo se leen esas capas (y sus DEPENDIENTES); las demás se
+    toman tal cual de `previas` (un dict de capas ya cargadas y preparadas).
+    """
+    nombres = set(ARCHIVOS if nombres is None else nombres)
+    for nombre in list(nombres):
+        nombres.update(DEPENDIENTES.get(nombre, ()))
+    dataframes = {n: capa for n, capa in (previas or {}).items() if n not in nombres}
+    errores = []
+
+    with ThreadPoolExecutor(max_workers=max_hilos or len(nombres) or 1) as pool:
+        futuros = {
+            nombre_clave: pool.submit(
+                cargar_capa, nombre_clave, nombre_archivo, base_url, usar_cache, refrescar_remotos
+            )
+            for nombre_clave, nombre_archivo in ARCHIVOS.items() if nombre_clave in nombres
+        }
+        for nombre_clave, futuro in futuros.items():
+            try:
+                dataframes[nombre_clave] = futuro.result()
+            except Exception as e:
+                errores.append(f"Error cargando {nombre_clave}: {str(e)}")
+
+    # Cruce manzana -> uso POT precalculado (el paso 5 solo lo consulta)
+    if "manzanas" in futuros and "manzanas" in dataframes and "areas" in dataframes:
+        try:
+            dataframes["manzanas"] = preparar_manzanas(dataframes["manzanas"], dataframes["areas"], usar_cache)
+        except Exception as e:
+            errores.append(f"Error asignando uso POT a manzanas: {str(e)}")
+
+    return dataframes, errores
+
+
+def manifiesto(base_url=None):
+    """
+    Estado actual de las fuentes: capa -> {"archivo", "ruta", "huella"}.
+    Solo se hashean los archivos que cambiaron desde la última consulta; las
+    capas descargadas se revalidan contra el remoto cuando toca (ver
+    ubicar_fuente) y las capas sin fuente accesible quedan por fuera.
+    """
+    fuentes = {}
+    for nombre_clave, nombre_archivo in ARCHIVOS.items():
+        try:
+            ruta = ubicar_fuente(nombre_archivo, base_url, revalidar=True)
+            fuentes[nombre_clave] = {"archivo": nombre_archivo, "ruta": ruta, "huella": huella_archivo(ruta)}
+        except Exception:
+            continue
+    return fuentes
+
+
+def leer_manifiesto(ruta=RUTA_MANIFIESTO):
+    """Último manifiesto guardado (capa -> entrada), o {} si no hay."""
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def guardar_manifiesto(entradas, ruta=RUTA_MANIFIESTO):
+    """Escribe el manifiesto (JSON) de forma atómica."""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    ruta_temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(ruta_temporal, "w", encoding="utf-8") as f:
+        json.dump(entradas, f, ensure_ascii=False, indent=2)
+    os.replace(ruta_temporal, ruta)
+
+
+def reporte_validez(dataframes):
+    """Tabla (lista de dicts) con el reporte de validez de cada capa."""
+    filas = []
+    for nombre, gdf in dataframes.items():
+        validez = gdf.attrs.get("validez", {})
+        filas.append({
+            "capa": nombre,
+            "registros": validez.get("total", len(gdf)),
+            "nulas": validez.get("nulas", 0),
+            "invalidas": validez.get("invalidas", 0),
+            "reparadas": validez.get("reparadas", 0),
+        })
+    return filas
@@ -0,0 +1,632 @@
+# Diagnóstico de entorno (Paso 5) memoizado
+"""
+Todo lo que el paso 5 calcula para un punto y un radio: cruces espaciales,
+clasificación POT, KPIs, figuras Plotly y mapa PNG del Informe Ejecutivo
+(rasterizado con mapa_estatico.py, sin kaleido). El HTML del informe se arma
+en informe.py.
+
+Los diagnósticos se guardan en una caché LRU de proceso, indexada por
+(lat, lon redondeados, radio, versión de los datos) y con tope de memoria,
+así que los reruns de Streamlit y las visitas repetidas a un mismo punto no
+recalculan nada.
+
+Con red peatonal (ver red_peatonal.py), la zona analizada es la isócrona: lo
+que se alcanza caminando `radio` metros por las calles desde el punto. Sin
+red, o con el punto lejos de cualquier calle, es el círculo de `radio` metros.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import shapely
+
+import capa_puntos
+import informe
+import instrumentacion
+import motor_espacial
+import red_peatonal
+import teselas_vectoriales
+from preparacion import SIN_CLASIFICACION
+
+
+# 4 decimales ~ 11 m: clics a pocos metros de distancia comparten diagnóstico
+DECIMALES_CLAVE = 4
+MAX_DIAGNOSTICOS = int(os.environ.get("BOGOTA_MAX_DIAGNOSTICOS", 256))
+MAX_MB_DIAGNOSTICOS = float(os.environ.get("BOGOTA_MAX_MB_DIAGNOSTICOS", 512))
+
+# Mapas cuyos polígonos pueden venir de teselas vectoriales (ver teselas_vectoriales.py)
+FIGURAS_CON_TESELAS = ("estrato", "pot", "parques")
+
+COLORES_ESTRATO = {1:'#C0392B', 2:'#E67E22', 3:'#F1C40F', 4:'#2ECC71', 5:'#3498DB', 6:'#8E44AD'}
+
+# Capas que se cruzan con la zona analizada (una sola pasada, ver motor_espacial.ConsultaZona)
+CAPAS_ZONA = ("transporte", "colegios", "salud", "manzanas", "verde")
+
+# Margen más allá del radio (metros): un equipamiento a pocos pasos del borde del
+# círculo también suma al puntaje. Con isócrona no se aplica (ver alcance_score).
+TOLERANCIA_CERCANIA = int(os.environ.get("BOGOTA_TOLERANCIA_CERCANIA", 150))
+# Equipamientos más cercanos que se listan por categoría
+K_CERCANOS = 3
+
+# Categoría -> (capa, filtro (columna, valor), columna del nombre, etiqueta)
+CATEGORIAS_CERCANIA = {
+    "transmilenio":    ("transporte", None, "nombre_estacion", "Estación TransMilenio"),
+    "colegio_oficial": ("colegios", ("sector", "OFICIAL"), "nombre", "Colegio oficial"),
+    "colegio_privado": ("colegios", ("sector", "NO OFICIAL"), "nombre", "Colegio privado"),
+    "salud":           ("salud", None, "nombre_hospital", "Unidad de salud (RASA)"),
+    "parque":          ("verde", None, "nombre_parque", "Parque"),
+}
+
+# Criterio del score -> (equipamientos que pide, categorías de donde salen)
+UMBRALES_SCORE = {
+    "num_tm":      (2, ("transmilenio",)),
+    "num_col":     (1, ("colegio_oficial", "colegio_privado")),
+    "num_parques": (1, ("parque",)),
+    "num_salud":   (1, ("salud",)),
+}
+
+
+def clave_diagnostico(lat, lon, radio, version):
+    """Clave de caché: punto redondeado, radio y versión de los datos."""
+    return (round(float(lat), DECIMALES_CLAVE), round(float(lon), DECIMALES_CLAVE), int(radio), version)
+
+
+def version_datos(indice, red=None):
+    """Versión de los datos del índice y, si la hay, de la red peatonal (para las claves de caché)."""
+    version = getattr(indice, "version", None)
+    return version if red is None else f"{version}|red:{red.version}"
+
+
+def area_de_analisis(lat, lon, radio):
+    """
+    Círculo de `radio` metros en EPSG:4326, para dibujarlo. Los cruces no lo
+    usan: se resuelven por distancia en metros (ver motor_espacial.py).
+    """
+    return motor_espacial.circulo_gps(lon, lat, radio)
+
+
+def alcance_score(radio, isocrona=False):
+    """
+    Distancia en línea recta hasta la que un equipamiento cuenta para el
+    puntaje aunque quede fuera de la zona: radio + TOLERANCIA_CERCANIA con el
+    círculo; None con la isócrona, donde la línea recta no dice si se llega a pie.
+    """
+    return None if isocrona else radio + TOLERANCIA_CERCANIA
+
+
+def explicacion_score(isocrona=False):
+    """Criterio del puntaje en una frase, para mostrarlo junto al dictamen."""
+    if isocrona:
+        return "El puntaje cuenta solo lo que está dentro de la zona a pie."
+    return (f"El puntaje también cuenta equipamientos hasta {TOLERANCIA_CERCANIA} m "
+            "por fuera del radio, a pocos pasos del borde.")
+
+
+def calcular_score(num_tm, num_col, uso_moda, num_parques, num_salud, alcance=None, distancias=None):
+    """
+    Algoritmo de scoring de viabilidad (5 puntos).
+    Con `alcance` (ver alcance_score) y `distancias` (criterio de
+    UMBRALES_SCORE -> distancia en metros al equipamiento que completa el
+    umbral, ver distancias_score) un criterio también se cumple si ese
+    equipamiento está a `alcance` metros o menos, aunque caiga fuera de la zona.
+    Devuelve (score, dictamen, color_fondo).
+    """
+    if not distancias:
+        alcance = None
+
+    def cumple(criterio, conteo):
+        if conteo >= UMBRALES_SCORE[criterio][0]:
+            return True
+        return alcance is not None and distancias.get(criterio, np.inf) <= alcance
+
+    score = 0
+    if cumple("num_tm", num_tm): score += 1          # Transporte
+    if cumple("num_col", num_col): score += 1        # Educación
+    if uso_moda != SIN_CLASIFICACION: score += 1     # Normativa
+    if cumple("num_parques", num_parques): score += 1  # Parques
+    if cumple("num_salud", num_salud): score += 1    # Salud
+
+    if score >= 4:
+        return score, "VIABILIDAD ALTA ⭐⭐⭐", "#27AE60"
+    elif score >= 2:
+        return score, "VIABILIDAD MEDIA ⭐⭐", "#F39C12"
+    return score, "VIABILIDAD RESTRINGIDA ⭐", "#C0392B"
+
+
+def cercanias(indice, lon, lat, k=K_CERCANOS):
+    """
+    Los `k` equipamientos más cercanos de cada categoría de
+    CATEGORIAS_CERCANIA, desde los árboles ya construidos del índice:
+    dict categoria -> lista de (nombre, distancia en metros), de menor a mayor.
+    Para los parques la distancia es al borde (0 si el punto está dentro).
+    """
+    resultado = {}
+    for categoria, (capa, filtro, columna, etiqueta) in CATEGORIAS_CERCANIA.items():
+        posiciones, distancias = indice.k_cercanos(capa, lon, lat, k, filtro)
+        if columna in indice.capas[capa].columns:
+            nombres = [etiqueta if pd.isna(n) else str(n) for n in indice.valores(capa, columna)[posiciones]]
+        else:
+            nombres = [etiqueta] * len(posiciones)
+        resultado[categoria] = list(zip(nombres, distancias.tolist()))
+    return resultado
+
+
+def distancias_score(cercanias_punto):
+    """Criterio -> distancia al equipamiento que completa su umbral (inf si no hay suficientes)."""
+    distancias = {}
+    for criterio, (umbral, categorias) in UMBRALES_SCORE.items():
+        valores = sorted(d for c in categorias for _, d in cercanias_punto.get(c, []))
+        distancias[criterio] = valores[umbral - 1] if len(valores) >= umbral else np.inf
+    return distancias
+
+
+def clasificar_pot(manzanas_zona):
+    """
+    Uso POT de las manzanas de la zona. El cruce con las áreas del POT ya viene
+    precalculado en la columna uso_pot_simplificado (ver preparacion.py), así
+    que aquí solo se consulta.
+    Devuelve (manzanas_final, clasificacion_exitosa).
+    """
+    manzanas_final = manzanas_zona.copy()
+    if 'uso_pot_simplificado' not in manzanas_final.columns:
+        manzanas_final['uso_pot_simplificado'] = SIN_CLASIFICACION
+    manzanas_final['uso_pot_simplificado'] = manzanas_final['uso_pot_simplificado'].fillna(SIN_CLASIFICACION)
+    exitosa = bool((manzanas_final['uso_pot_simplificado'] != SIN_CLASIFICACION).any())
+    return manzanas_final, exitosa
+
+
+def _bytes_gdf(gdf):
+    """Estimación de memoria de un GeoDataFrame (columnas + coordenadas) o de una tabla de puntos."""
+    if gdf is None or gdf.empty:
+        return 0
+    if not isinstance(gdf, gpd.GeoDataFrame):
+        return int(gdf.memory_usage(deep=True).sum())
+    atributos = int(gdf.drop(columns=gdf.geometry.name).memory_usage(deep=True).sum())
+    return atributos + int(shapely.get_num_coordinates(gdf.geometry.values).sum()) * 16
+
+
+class Diagnostico:
+    """
+    Resultado completo del paso 5 para un punto y un radio.
+    Los cruces (una ConsultaZona) y los KPIs se calculan al crearlo; los
+    subconjuntos de cada capa, las figuras y el mapa del informe se construyen
+    la primera vez que se piden y quedan guardados en el objeto.
+    Con `red` (una red_peatonal.RedPeatonal) la zona es la isócrona de `radio`
+    metros a pie; `isocrona` dice si se usó o si se volvió al círculo.
+    """
+
+    def __init__(self, indice, lat, lon, radio, red=None):
+        self.lat = float(lat)
+        self.lon = float(lon)
+        self.radio = int(radio)
+
+        # 1.1 Zona de Análisis: isócrona a pie o, sin red, círculo
+        with instrumentacion.tramo("diagnostico.zona"):
+            isocrona = None
+            if red is not None:
+                isocrona = red.isocrona_metrica(*capa_puntos.a_metrico(self.lon, self.lat), self.radio)
+            self.isocrona = isocrona is not None
+            if self.isocrona:
+                self.area_interes = red_peatonal.a_gps(isocrona)
+            else:
+                self.area_interes = area_de_analisis(self.lat, self.lon, self.radio)
+
+        # 1.2 Cruces Espaciales: una sola pasada por todas las capas, exacta en metros
+        with instrumentacion.tramo("diagnostico.cruces"):
+            self.zona = indice.consultar_zona(CAPAS_ZONA, self.lon, self.lat, self.radio, area=isocrona)
+
+        # KPIs (los 5 puntos clave), desde las posiciones: sin armar tablas ni GeoDataFrames
+        self.num_tm = self.zona.conteo("transporte")
+        self.num_col = self.zona.conteo("colegios")
+        self.num_salud = self.zona.conteo("salud")
+        self.num_parques = self.zona.conteo("verde")
+        self.num_manzanas = self.zona.conteo("manzanas")
+
+        # 1.3 Normativa POT sobre cada manzana (consulta de la columna precalculada)
+        self.conteo_pot = self.zona.conteos("manzanas", "uso_pot_simplificado", vacio=SIN_CLASIFICACION)
+        self.uso_moda = self.zona.moda("manzanas", "uso_pot_simplificado", vacio=SIN_CLASIFICACION)
+        self.clasificacion_exitosa = bool((self.conteo_pot.index != SIN_CLASIFICACION).any())
+
+        if self.num_manzanas:
+            self.estrato_moda = int(self.zona.moda("manzanas", "estrato"))
+            conteo_estrato = self.zona.conteos("manzanas", "estrato")
+            conteo_estrato.index = conteo_estrato.index.astype(int)
+            self.conteo_estrato = conteo_estrato.sort_index()
+        else:
+            self.estrato_moda = "N/A"
+            self.conteo_estrato = None
+
+        # Equipamientos más cercanos (dentro o fuera del radio)
+        with instrumentacion.tramo("diagnostico.cercanias"):
+            self.cercanias = cercanias(indice, self.lon, self.lat)
+        self.distancias_score = distancias_score(self.cercanias)
+        self.alcance_score = alcance_score(self.radio, self.isocrona)
+        self.explicacion_score = explicacion_score(self.isocrona)
+
+        self.score, self.dictamen, self.color_fondo = calcular_score(
+            self.num_tm, self.num_col, self.uso_moda, self.num_parques, self.num_salud,
+            self.alcance_score, self.distancias_score
+        )
+
+        self._manzanas_zona = None
+        self._manzanas_final = None
+        self._figuras = {}
+        self._html_mapa = None
+        self._lock = threading.RLock()
+        # Lo fija CacheDiagnosticos: se llama con el diagnóstico cada vez que construye un artefacto
+        self.al_crecer = None
+
+    # SUBCONJUNTOS DE LA ZONA (se arman la primera vez que una figura o la página los pide)
+
+    @property
+    def transporte_zona(self):
+        return self.zona.subconjunto("transporte")
+
+    @property
+    def colegios_zona(self):
+        return self.zona.subconjunto("colegios")
+
+    @property
+    def salud_zona(self):
+        return self.zona.subconjunto("salud")
+
+    @property
+    def parques_zona(self):
+        return self.zona.subconjunto("verde")
+
+    @property
+    def centros_parques(self):
+        """Centroides de los parques (para marcadores y el mapa del informe), calculados en metros."""
+        return self.zona.lonlat("verde")
+
+    @property
+    def manzanas_zona(self):
+        with self._lock:
+            if self._manzanas_zona is None:
+                manzanas = self.zona.subconjunto("manzanas").copy()
+                if not manzanas.empty:
+                    manzanas['estrato'] = manzanas['estrato'].astype(int)
+                self._manzanas_zona = manzanas
+            return self._manzanas_zona
+
+    @property
+    def manzanas_final(self):
+        with self._lock:
+            if self._manzanas_final is None:
+                self._manzanas_final, _ = clasificar_pot(self.manzanas_zona)
+            return self._manzanas_final
+
+    def mas_cercano(self, categoria):
+        """(nombre, distancia en metros) del equipamiento más cercano de la categoría, o None."""
+        lista = self.cercanias.get(categoria)
+        return lista[0] if lista else None
+
+    # ARTEFACTOS MEMOIZADOS
+
+    def figura(self, nombre, teselas=None):
+        """
+        Devuelve la figura Plotly `nombre`, construyéndola solo la primera vez.
+        Con `teselas` (una teselas_vectoriales.FuenteTeselas) los mapas de
+        estrato, POT y parques pintan los polígonos desde las teselas en vez
+        de llevarlos dentro de la figura.
+        """
+        clave = (nombre, teselas)
+        with self._lock:
+            if clave not in self._figuras:
+                metodo = getattr(self, f"_fig_{nombre}")
+                with instrumentacion.tramo(f"figura.{nombre}"):
+                    self._figuras[clave] = metodo(teselas) if nombre in FIGURAS_CON_TESELAS else metodo()
+                nueva = True
+            else:
+                nueva = False
+            figura = self._figuras[clave]
+        if nueva:
+            self._crecio()
+        return figura
+
+    def html_mapa(self):
+        """Mapa PNG (base64) incrustable en el Informe Ejecutivo."""
+        with self._lock:
+            nuevo = self._html_mapa is None
+            if nuevo:
+                self._html_mapa = self._generar_html_mapa()
+            html = self._html_mapa
+        if nuevo:
+            self._crecio()
+        return html
+
+    def _crecio(self):
+        # Fuera del lock del diagnóstico: la caché toma el suyo para actualizar su total
+        if self.al_crecer is not None:
+            self.al_crecer(self)
+
+    def tamano_bytes(self):
+        """Memoria aproximada del diagnóstico (para el tope de la caché)."""
+        # Solo lo ya construido: medir no arma los subconjuntos que nadie ha pedido
+        total = sum(_bytes_gdf(g) for g in self.zona.subconjuntos_construidos())
+        total += _bytes_gdf(self._manzanas_zona) + _bytes_gdf(self._manzanas_final)
+        # Las figuras guardan copias de las coordenadas que dibujan
+        total += 3 * (_bytes_gdf(self._manzanas_final) if self._figuras else 0)
+        total += len(self._html_mapa or "")
+        return total
+
+    # CONSTRUCCIÓN DE FIGURAS
+
+    def _traza_zona(self, fillcolor, color, name='Zona analizada', fill=True):
+        xs, ys = self.area_interes.exterior.xy
+        return go.Scattermapbox(
+            lat=list(ys), lon=list(xs),
+            mode='lines', fill='toself' if fill else None, name=name,
+            fillcolor=fillcolor if fill else None, line=dict(color=color, width=2)
+        )
+
+    def _traza_tu(self, size=12, color='#3498DB'):
+        return go.Scattermapbox(
+            lat=[self.lat], lon=[self.lon],
+            mode='markers', name='Tú', marker=dict(size=size, color=color, symbol='circle')
+        )
+
+    def _layout_mapa(self, fig, zoom=14, showlegend=True):
+        fig.update_layout(
+            mapbox_style="carto-positron",
+            mapbox_center={"lat": self.lat, "lon": self.lon},
+            mapbox_zoom=zoom, margin={"r":0,"t":0,"l":0,"b":0}, height=350, showlegend=showlegend,
+            legend=dict(orientation="h", y=1.1)
+        )
+        return fig
+
+    def _fig_movilidad(self):
+        fig = go.Figure()
+        fig.add_trace(self._traza_zona('rgba(255, 165, 0, 0.1)', 'orange'))
+        if not self.transporte_zona.empty:
+            fig.add_trace(go.Scattermapbox(
+                lat=self.transporte_zona['lat'], lon=self.transporte_zona['lon'],
+                mode='markers', name='Paraderos',
+                marker=dict(size=10, color='#E74C3C', symbol='circle'),
+                text=self.transporte_zona['nombre_estacion'], hoverinfo='text'
+            ))
+        fig.add_trace(self._traza_tu())
+        return self._layout_mapa(fig)
+
+    def _fig_educacion(self):
+        fig = go.Figure()
+        fig.add_trace(self._traza_zona('rgba(155, 89, 182, 0.1)', '#8E44AD'))
+        if not self.colegios_zona.empty:
+            fig.add_trace(go.Scattermapbox(
+                lat=self.colegios_zona['lat'], lon=self.colegios_zona['lon'],
+                mode='markers', name='Colegios',
+                marker=dict(size=9, color='#8E44AD', symbol='circle'),
+                text=self.colegios_zona['nombre'], hoverinfo='text'
+            ))
+        fig.add_trace(self._traza_tu())
+        return self._layout_mapa(fig, showlegend=False)
+
+    def _fig_salud(self):
+        fig = go.Figure()
+        fig.add_trace(self._traza_zona('rgba(255, 165, 0, 0.1)', 'orange'))
+        if not self.salud_zona.empty:
+            fig.add_trace(go.Scattermapbox(
+                lat=self.salud_zona['lat'], lon=self.salud_zona['lon'],
+                mode='markers', name='Salud',
+                marker=dict(size=12, color="#0905F7", symbol='circle'),
+                text=self.salud_zona.get('nombre_hospital', 'Centro de Salud'),
+                hoverinfo='text'
+            ))
+        fig.add_trace(self._traza_tu())
+        return self._layout_mapa(fig)
+
+    def _fig_parques(self, teselas=None):
+        fig = go.Figure()
+        fig.add_trace(self._traza_zona('rgba(255, 165, 0, 0.05)', 'orange'))
+        if teselas is not None:
+            # Polígonos desde las teselas; los nombres quedan en marcadores invisibles para el hover
+            fig.update_layout(mapbox_layers=[teselas_vectoriales.capa_mapbox(teselas, "verde", '#27AE60', 0.7)])
+            if not self.parques_zona.empty:
+                lons, lats = self.centros_parques
+                fig.add_trace(go.Scattermapbox(
+                    lat=lats, lon=lons, mode='markers', name='Zonas Verdes',
+                    marker=dict(size=12, color='#27AE60', opacity=0),
+                    text=self.parques_zona.get('nombre_parque', 'Parque / Zona Verde'),
+                    hoverinfo='text'
+                ))
+        elif not self.parques_zona.empty:
+            # Polígonos reales de los parques (relleno verde uniforme)
+            fig.add_trace(go.Choroplethmapbox(
+                geojson=self.parques_zona.__geo_interface__,
+                locations=self.parques_zona.index.astype(str),
+                z=[1] * len(self.parques_zona),
+                colorscale=[[0, '#27AE60'], [1, '#27AE60']],
+                showscale=False,
+                marker_opacity=0.7,
+                marker_line_width=1,
+                marker_line_color='white',
+                name='Zonas Verdes',
+                text=self.parques_zona.get('nombre_parque', 'Parque / Zona Verde'),
+                hoverinfo='text'
+            ))
+        fig.add_trace(self._traza_tu(size=14, color='#2980B9'))
+        return self._layout_mapa(fig, zoom=14.5)
+
+    def _fig_estrato(self, teselas=None):
+        manzanas_zona = self.manzanas_zona
+        if teselas is not None:
+            capas = dict((str(etiqueta), nombre) for nombre, etiqueta in teselas.capas)
+            fig = go.Figure()
+            fig.update_layout(mapbox_layers=[
+                teselas_vectoriales.capa_mapbox(teselas, capas[str(e)], COLORES_ESTRATO.get(e, '#95A5A6'), 0.6)
+                for e in self.conteo_estrato.index if str(e) in capas
+            ] if self.conteo_estrato is not None else [])
+            fig.add_trace(self._traza_zona(None, 'black', name='Límite', fill=False))
+            return self._layout_mapa(fig, zoom=14.5, showlegend=False)
+        fig = px.choropleth_mapbox(
+            manzanas_zona, geojson=manzanas_zona.geometry, locations=manzanas_zona.index,
+            color="estrato", mapbox_style="carto-positron", zoom=14.5,
+            center={"lat": self.lat, "lon": self.lon},
+            opacity=0.6,
+            color_discrete_map=COLORES_ESTRATO
+        )
+        fig.update_layout(margin={"r":0,"t":0,"l":0,"b":0}, height=350, showlegend=False)
+        fig.add_trace(self._traza_zona(None, 'black', name='Límite', fill=False))
+        return fig
+
+    def _fig_estrato_barras(self):
+        conteo_est = self.conteo_estrato
+        fig = go.Figure(data=[go.Bar(x=[f"E{i}" for i in conteo_est.index], y=conteo_est.values, marker_color='#95A5A6')])
+        fig.update_layout(height=200, margin=dict(l=0,r=0,t=0,b=0), paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
+        return fig
+
+    def colores_pot(self):
+        """Paleta por uso POT (gris para 'Sin Clasificación'), compartida por mapa y barras."""
+        cats = self.manzanas_final["uso_pot_simplificado"].unique().tolist()
+        palette = px.colors.qualitative.Bold
+        return {
+            cat: "#95A5A6" if cat == SIN_CLASIFICACION else palette[i % len(palette)]
+            for i, cat in enumerate(cats)
+        }
+
+    def _fig_pot(self, teselas=None):
+        manzanas_final = self.manzanas_final
+        if teselas is not None:
+            capas = dict((etiqueta, nombre) for nombre, etiqueta in teselas.capas)
+            colores = {uso: c for uso, c in self.colores_pot().items() if uso in capas}
+            fig = go.Figure()
+            fig.update_layout(mapbox_layers=[
+                teselas_vectoriales.capa_mapbox(teselas, capas[uso], color, 0.6) for uso, color in colores.items()
+            ])
+            # Las capas de mapbox no tienen leyenda: una traza vacía por uso la reemplaza
+            for uso, color in colores.items():
+                fig.add_trace(go.Scattermapbox(
+                    lat=[None], lon=[None], mode='markers', name=uso, marker=dict(size=10, color=color)
+                ))
+            fig.add_trace(self._traza_zona(None, 'black', name='Zona', fill=False))
+            fig = self._layout_mapa(fig, zoom=14.5)
+            fig.update_layout(title="Vocación del Suelo", legend=dict(orientation="v", y=1))
+            return fig
+        fig = px.choropleth_mapbox(
+            manzanas_final,
+            geojson=manzanas_final.geometry,
+            locations=manzanas_final.index,
+            color="uso_pot_simplificado",
+            color_discrete_map=self.colores_pot(),
+            mapbox_style="carto-positron",
+            zoom=14.5,
+            center={"lat": self.lat, "lon": self.lon},
+            opacity=0.6,
+            title="Vocación del Suelo"
+        )
+        fig.update_layout(margin={"r":0,"t":0,"l":0,"b":0}, height=350, showlegend=True)
+        fig.add_trace(self._traza_zona(None, 'black', name='Zona', fill=False))
+        return fig
+
+    def _fig_pot_barras(self):
+        conteo = self.conteo_pot
+        color_map = self.colores_pot()
+        fig = go.Figure(data=[go.Bar(
+            y=[str(x)[:25] for x in conteo.index],
+            x=conteo.values,
+            orientation='h',
+            marker_color=[color_map.get(x, '#333') for x in conteo.index]
+        )])
+        fig.update_layout(height=250, margin=dict(l=0,r=0,t=0,b=0), yaxis=dict(autorange="reversed"))
+        return fig
+
+    # MAPA DEL INFORME
+
+    def puntos_informe(self):
+        """Estaciones, colegios, salud y centroides de parques como (lons, lats, color)."""
+        capas = []
+        # Parques como centroides (calculados en metros y devueltos a GPS)
+        for nombre, color in (("transporte", '#E74C3C'), ("colegios", "#9625C7"),
+                              ("salud", "#3A07F3"), ("verde", "#178B27")):
+            if self.zona.conteo(nombre):
+                lons, lats = self.zona.lonlat(nombre)
+                capas.append((np.asarray(lons), np.asarray(lats), color))
+        return capas
+
+    def _generar_html_mapa(self):
+        return informe.html_mapa(self.area_interes, self.lat, self.lon, self.puntos_informe())
+
+
+class CacheDiagnosticos:
+    """
+    Caché LRU de diagnósticos compartida por todas las sesiones del proceso.
+    Expulsa los menos usados cuando se supera el número de entradas o el tope
+    de memoria. El tamaño de cada entrada se mide al guardarla y otra vez cada
+    vez que construye una figura o el mapa del informe (ver Diagnostico.al_crecer),
+    y la caché lleva el total: recortar no vuelve a medir nada.
+    """
+
+    def __init__(self, max_entradas=MAX_DIAGNOSTICOS, max_mb=MAX_MB_DIAGNOSTICOS):
+        self.max_entradas = max_entradas
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._datos = OrderedDict()
+        self._bytes = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, indice, lat, lon, radio, red=None):
+        """Devuelve el diagnóstico del punto, calculándolo solo si no está en caché."""
+        clave = clave_diagnostico(lat, lon, radio, version_datos(indice, red))
+        with self._lock:
+            if clave in self._datos:
+                self._datos.move_to_end(clave)
+                self.aciertos += 1
+                return self._datos[clave]
+            self.fallos += 1
+
+        # El cálculo va fuera del lock para no bloquear a las demás sesiones
+        with instrumentacion.tramo("diagnostico.calculo"):
+            diag = Diagnostico(indice, clave[0], clave[1], radio, red)
+        diag.al_crecer = lambda d, clave=clave: self._medir(clave, d)
+        tamano = diag.tamano_bytes()
+
+        with self._lock:
+            self._datos[clave] = diag
+            self._datos.move_to_end(clave)
+            self._ajustar(clave, tamano)
+            self._recortar()
+        return diag
+
+    def _medir(self, clave, diag):
+        """Vuelve a medir una sola entrada (tras construir un artefacto) y recorta si hace falta."""
+        tamano = diag.tamano_bytes()
+        with self._lock:
+            if self._datos.get(clave) is diag:
+                self._ajustar(clave, tamano)
+                self._recortar(conservar=clave)
+
+    def _ajustar(self, clave, tamano):
+        self._total_bytes += tamano - self._bytes.get(clave, 0)
+        self._bytes[clave] = tamano
+
+    def _expulsar(self, clave):
+        del self._datos[clave]
+        self._total_bytes -= self._bytes.pop(clave, 0)
+
+    def purgar(self, version):
+        """Descarta los diagnósticos calculados con otra versión de los datos (tras un refresco)."""
+        with self._lock:
+            for clave in [c for c in self._datos if not str(c[3]).startswith(version)]:
+                self._expulsar(clave)
+
+    def _recortar(self, conservar=None):
+        # El diagnóstico más reciente (y el que acaba de crecer) nunca se expulsa
+        intocables = {next(reversed(self._datos), None), conservar}
+        while len(self._datos) > self.max_entradas:
+            self._expulsar(next(iter(self._datos)))
+        candidatas = [c for c in self._datos if c not in intocables]
+        while candidatas and self._total_bytes > self.max_bytes:
+            self._expulsar(candidatas.pop(0))
+
+    def tamano_bytes(self):
+        return self._total_bytes
+
+    def __len__(self):
+        return len(self._datos)
@@ -0,0 +1,290 @@
+# Diagnóstico por lotes (sin interfaz)
+"""
+El motor del paso 5 (cruces por radio + scoring de viabilidad) para miles de
+puntos a la vez, sin pasar por la app.
+
+Cada capa se consulta por distancia en metros con una sola llamada
+vectorizada al STRtree por bloque de puntos (el mismo índice y el mismo
+criterio del paso 5), así que los conteos coinciden con los que ve el usuario
+en el paso 5 cuando no hay red peatonal: aquí la zona siempre es el círculo,
+no la isócrona a pie (ver red_peatonal.py). Los bloques se reparten entre
+procesos y los resultados se escriben a medida que salen (CSV o Parquet).
+
+Uso:
+    python BACK_END/diagnostico_lote.py predios.csv -o viabilidad.csv
+    python BACK_END/diagnostico_lote.py predios.csv -o viabilidad.parquet --radio 900 --procesos 4
+
+El CSV de entrada necesita columnas lat y lon; radio es opcional (por defecto
+--radio). Las demás columnas (p. ej. un id de predio) se copian a la salida.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import capa_puntos
+import carga_datos
+import diagnostico
+import motor_espacial
+from preparacion import SIN_CLASIFICACION
+
+TAM_BLOQUE = int(os.environ.get("BOGOTA_TAM_BLOQUE_LOTE", 2000))
+RADIO_POR_DEFECTO = 600
+
+# Capa -> columna de conteo (las mismas del paso 5)
+CONTEOS = {
+    "transporte": "num_tm",
+    "colegios": "num_col",
+    "salud": "num_salud",
+    "verde": "num_parques",
+}
+
+COLUMNAS_RESULTADO = [
+    "lat", "lon", "radio", "num_tm", "num_col", "num_salud", "num_parques",
+    "num_manzanas", "uso_moda", "estrato_moda",
+    *(f"dist_{categoria}" for categoria in diagnostico.CATEGORIAS_CERCANIA),
+    "score", "dictamen",
+]
+
+# Índice heredado por los procesos hijos (fork) sin volver a serializarlo
+_INDICE_LOTE = None
+
+
+def _modas(pos_punto, valores_capa, pos_geom, n):
+    """
+    Moda por punto de `valores_capa[pos_geom]` (como Series.mode()[0]: ante
+    empates gana el menor). Devuelve un arreglo de objetos con None donde el
+    punto no tiene valores.
+    """
+    codigos, categorias = pd.factorize(valores_capa, sort=True)
+    k = max(len(categorias), 1)
+    conteo = np.bincount(pos_punto * k + codigos[pos_geom], minlength=n * k).reshape(n, k)
+
+    resultado = np.full(n, None, dtype=object)
+    con_datos = conteo.any(axis=1)
+    # argmax devuelve el primer máximo: el de menor código, es decir, el menor valor
+    resultado[con_datos] = np.asarray(categorias, dtype=object)[conteo[con_datos].argmax(axis=1)]
+    return resultado
+
+
+def distancias_lote(indice, xs, ys):
+    """
+    Distancias en metros desde muchos puntos (xs, ys en EPSG:3116) a los
+    equipamientos de diagnostico.CATEGORIAS_CERCANIA. Devuelve (cercanos,
+    umbrales): categoría -> distancia al más cercano, y criterio del score ->
+    distancia al equipamiento que completa su umbral (lo mismo que
+    diagnostico.distancias_score para un punto).
+    """
+    k_categoria = {}
+    for umbral, categorias in diagnostico.UMBRALES_SCORE.values():
+        for categoria in categorias:
+            k_categoria[categoria] = max(k_categoria.get(categoria, 1), umbral)
+
+    matrices = {
+        categoria: indice.distancias_k(capa, xs, ys, k_categoria.get(categoria, 1), filtro)
+        for categoria, (capa, filtro, _, _) in diagnostico.CATEGORIAS_CERCANIA.items()
+    }
+    cercanos = {categoria: matriz[:, 0] for categoria, matriz in matrices.items()}
+    umbrales = {}
+    for criterio, (umbral, categorias) in diagnostico.UMBRALES_SCORE.items():
+        juntas = np.sort(np.hstack([matrices[c] for c in categorias]), axis=1)
+        umbrales[criterio] = juntas[:, umbral - 1]
+    return cercanos, umbrales
+
+
+def diagnosticar_puntos(indice, lats, lons, radios, distancias=None):
+    """
+    KPIs y score de viabilidad para cada punto. `indice` es un
+    motor_espacial.IndiceEspacial; lats, lons y radios son arreglos del mismo
+    largo (radios también puede ser un escalar). `distancias` es lo que
+    devuelve distancias_lote para esos mismos puntos, si ya se calculó (no
+    depende del radio). Devuelve un DataFrame con COLUMNAS_RESULTADO, en el
+    orden de entrada.
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    radios = np.broadcast_to(np.asarray(radios, dtype=int), lats.shape)
+    n = len(lats)
+    xs, ys = capa_puntos.a_metrico(lons, lats)
+
+    resultado = pd.DataFrame({"lat": lats, "lon": lons, "radio": radios})
+    for capa, columna in CONTEOS.items():
+        resultado[columna] = indice.contar_en_radio(capa, xs, ys, radios)
+
+    # Manzanas: uso POT (precalculado por manzana) y estrato
+    pos_punto, pos_manz = indice.pares_en_radio("manzanas", xs, ys, radios)
+    manzanas = indice.capas["manzanas"]
+    resultado["num_manzanas"] = np.bincount(pos_punto, minlength=n)
+
+    if "uso_pot_simplificado" in manzanas.columns:
+        usos = manzanas["uso_pot_simplificado"].fillna(SIN_CLASIFICACION).to_numpy(dtype=object)
+    else:
+        usos = np.full(len(manzanas), SIN_CLASIFICACION, dtype=object)
+    uso_moda = _modas(pos_punto, usos, pos_manz, n)
+    uso_moda[pd.isna(uso_moda)] = SIN_CLASIFICACION
+    resultado["uso_moda"] = uso_moda
+
+    estratos = manzanas["estrato"].astype(int).to_numpy()
+    resultado["estrato_moda"] = pd.array(_modas(pos_punto, estratos, pos_manz, n), dtype="Int64")
+
+    # Equipamientos más cercanos, dentro o fuera del radio
+    cercanos, umbrales = distancias if distancias is not None else distancias_lote(indice, xs, ys)
+    for categoria, dist in cercanos.items():
+        resultado[f"dist_{categoria}"] = np.round(dist, 1)
+
+    # El mismo algoritmo de 5 puntos de la app
+    criterios = list(umbrales)
+    scores = [
+        diagnostico.calcular_score(
+            tm, col, uso, parques, salud, diagnostico.alcance_score(radio), dict(zip(criterios, distancias))
+        )[:2]
+        for tm, col, uso, parques, salud, radio, *distancias in zip(
+            resultado["num_tm"], resultado["num_col"], resultado["uso_moda"],
+            resultado["num_parques"], resultado["num_salud"], resultado["radio"],
+            *umbrales.values()
+        )
+    ]
+    resultado["score"] = [s for s, _ in scores]
+    resultado["dictamen"] = [d for _, d in scores]
+    return resultado[COLUMNAS_RESULTADO]
+
+
+def _tramo_distancias(distancias, inicio, fin):
+    """Las filas [inicio, fin) de un resultado de distancias_lote."""
+    if distancias is None:
+        return None
+    return tuple({clave: valores[inicio:fin] for clave, valores in parte.items()} for parte in distancias)
+
+
+def _diagnosticar_bloque(bloque):
+    return diagnosticar_puntos(_INDICE_LOTE, *bloque)
+
+
+def diagnosticar_en_bloques(indice, lats, lons, radios, tam_bloque=TAM_BLOQUE, procesos=None, distancias=None):
+    """
+    Generador de DataFrames (uno por bloque, en orden) para listas grandes.
+    Con procesos > 1 los bloques se reparten entre procesos hijos creados con
+    fork, que heredan el índice ya construido; donde fork no existe se usan hilos.
+    `distancias` (de distancias_lote, para todos los puntos) evita recalcularlas
+    cuando los mismos puntos se diagnostican con varios radios.
+    """
+    global _INDICE_LOTE
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    radios = np.broadcast_to(np.asarray(radios, dtype=int), lats.shape)
+    bloques = [
+        (lats[i:i + tam_bloque], lons[i:i + tam_bloque], radios[i:i + tam_bloque],
+         _tramo_distancias(distancias, i, i + tam_bloque))
+        for i in range(0, len(lats), tam_bloque)
+    ]
+    procesos = procesos or os.cpu_count() or 1
+
+    if procesos <= 1 or len(bloques) <= 1:
+        for bloque in bloques:
+            yield diagnosticar_puntos(indice, *bloque)
+        return
+
+    _INDICE_LOTE = indice
+    try:
+        if "fork" in multiprocessing.get_all_start_methods():
+            pool = ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context("fork"))
+        else:
+            pool = ThreadPoolExecutor(max_workers=procesos)
+        with pool:
+            # map conserva el orden de entrada
+            yield from pool.map(_diagnosticar_bloque, bloques)
+    finally:
+        _INDICE_LOTE = None
+
+
+class EscritorResultados:
+    """Escribe bloques de resultados a CSV o Parquet sin juntarlos en memoria."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.parquet = ruta.lower().endswith(".parquet")
+        self._escritor = None
+        self._primero = True
+        self.filas = 0
+
+    def escribir(self, df):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            tabla = pa.Table.from_pandas(df, preserve_index=False)
+            if self._escritor is None:
+                self._escritor = pq.ParquetWriter(self.ruta, tabla.schema)
+            elif tabla.schema != self._escritor.schema:
+                # Un bloque con una columna toda vacía se infiere con otro tipo
+                tabla = tabla.cast(self._escritor.schema)
+            self._escritor.write_table(tabla)
+        else:
+            df.to_csv(self.ruta, mode="w" if self._primero else "a", header=self._primero, index=False)
+        self._primero = False
+        self.filas += len(df)
+
+    def cerrar(self):
+        if self._escritor is not None:
+            self._escritor.close()
+            self._escritor = None
+
+
+def leer_puntos(ruta, radio=RADIO_POR_DEFECTO):
+    """Lee el CSV/Parquet de entrada y valida las columnas lat, lon (y radio)."""
+    puntos = pd.read_parquet(ruta) if ruta.lower().endswith(".parquet") else pd.read_csv(ruta)
+    faltantes = {"lat", "lon"} - set(puntos.columns)
+    if faltantes:
+        raise ValueError(f"Faltan columnas en {ruta}: {', '.join(sorted(faltantes))}")
+    if "radio" not in puntos.columns:
+        puntos["radio"] = radio
+    puntos = puntos.dropna(subset=["lat", "lon"]).reset_index(drop=True)
+    puntos["radio"] = puntos["radio"].fillna(radio).astype(int)
+    return puntos
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score de viabilidad (paso 5) para una lista de puntos.")
+    parser.add_argument("entrada", help="CSV o Parquet con columnas lat, lon y opcionalmente radio")
+    parser.add_argument("-o", "--salida", required=True, help="Archivo de salida (.csv o .parquet)")
+    parser.add_argument("--radio", type=int, default=RADIO_POR_DEFECTO, help="Radio en metros si no viene en la entrada")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos en paralelo (por defecto, uno por núcleo)")
+    parser.add_argument("--bloque", type=int, default=TAM_BLOQUE, help="Puntos por bloque")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    puntos = leer_puntos(args.entrada, args.radio)
+    dataframes, errores = carga_datos.cargar_todo()
+    if errores:
+        for err in errores:
+            print(err, file=sys.stderr)
+        return 1
+    indice = motor_espacial.IndiceEspacial(dataframes)
+    t_carga = time.perf_counter() - t0
+
+    extras = puntos.drop(columns=["lat", "lon", "radio"])
+    escritor = EscritorResultados(args.salida)
+    inicio = 0
+    try:
+        for bloque in diagnosticar_en_bloques(indice, puntos["lat"], puntos["lon"], puntos["radio"],
+                                              args.bloque, args.procesos):
+            fin = inicio + len(bloque)
+            # Columnas de la entrada (id de predio, etc.) primero, como en el archivo original
+            bloque = pd.concat([extras.iloc[inicio:fin].reset_index(drop=True), bloque], axis=1)
+            escritor.escribir(bloque)
+            inicio = fin
+    finally:
+        escritor.cerrar()
+
+    t_total = time.perf_counter() - t0
+    print(f"{escritor.filas} puntos -> {args.salida} "
+          f"(carga {t_carga:.1f} s, diagnóstico {t_total - t_carga:.1f} s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
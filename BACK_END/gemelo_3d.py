@@ -0,0 +1,139 @@
+# Carga compacta para el gemelo digital (Cesium)
+"""
+El visor 3D (docs/index.html, en GitHub Pages) antes descargaba los GeoJSON
+completos de transporte, colegios y salud en cada sesión y filtraba por radio
+en JavaScript. Ahora la app le pasa solo lo que hay en la zona del
+diagnóstico, ya filtrado:
+
+* Coordenadas cuantizadas como enteros relativos al punto del usuario
+  (1 unidad = 10^-5 grados, ~1 m), nombres recortados y, si la zona es una
+  isócrona (ver red_peatonal.py), su contorno simplificado.
+* JSON sin espacios -> deflate crudo -> base64 para URL.
+* Viaja en el fragmento del enlace (#d=...): el navegador no lo envía al
+  servidor, así que no le aplica el límite de longitud de URL de GitHub Pages,
+  y el visor lo descomprime con DecompressionStream("deflate-raw").
+
+Sin fragmento (enlaces viejos), el visor vuelve a cargar las capas completas.
+
+Formato de la carga, versión 1 (VERSION_CARGA aquí y en docs/index.html;
+cualquier cambio en las claves o en su significado sube la versión en los
+dos lados, y tests/test_gemelo_3d.py fija la ida y vuelta):
+
+    v      versión del formato
+    o      [lon, lat] del punto del usuario (origen de los deltas)
+    r      radio del diagnóstico en metros
+    q      unidades por grado de los deltas (CUANTIZACION)
+    t/c/s  transporte, colegios y salud: [[dlon, dlat, nombre], ...]
+    z      opcional, contorno de la isócrona: [[dlon, dlat], ...]
+
+La posición de cada elemento es o + [dlon, dlat] / q.
+"""
+import base64
+import json
+import os
+import urllib.parse
+import zlib
+
+import numpy as np
+import shapely
+
+import capa_puntos
+import red_peatonal
+
+URL_GEMELO = os.environ.get("BOGOTA_URL_GEMELO", "https://andres-fuentex.github.io/COPIA_CONCU/index.html")
+
+# Formato de la carga (se sube si cambia; el visor ignora versiones que no conoce)
+VERSION_CARGA = 1
+
+# 1 unidad = 10^-5 grados (~1,1 m en Bogotá)
+CUANTIZACION = 100_000
+
+# Tope de elementos por capa (los más cercanos al punto) y de caracteres por nombre
+MAX_ELEMENTOS = int(os.environ.get("BOGOTA_MAX_ELEMENTOS_GEMELO", 150))
+MAX_NOMBRE = 40
+
+# Tolerancia (m) al simplificar el contorno de la isócrona
+TOLERANCIA_CONTORNO = 10.0
+
+# Clave en la carga -> (capa del índice, columna del nombre)
+CAPAS_GEMELO = {
+    "t": ("transporte", "nombre_estacion"),
+    "c": ("colegios", "nombre"),
+    "s": ("salud", "nombre_hospital"),
+}
+
+
+def _relativas(lons, lats, lon0, lat0):
+    """Enteros (dlon, dlat) respecto al punto, en unidades de CUANTIZACION."""
+    dlon = np.round((np.asarray(lons, dtype=float) - lon0) * CUANTIZACION).astype(int)
+    dlat = np.round((np.asarray(lats, dtype=float) - lat0) * CUANTIZACION).astype(int)
+    return dlon, dlat
+
+
+def _nombre(valor):
+    if valor is None or (isinstance(valor, float) and np.isnan(valor)):
+        return ""
+    return str(valor).strip()[:MAX_NOMBRE]
+
+
+def carga_gemelo(diag, max_elementos=MAX_ELEMENTOS):
+    """
+    Dict con el origen [lon, lat], el radio y, por capa de CAPAS_GEMELO, una lista de
+    [dlon, dlat, nombre] de lo que cae en la zona del diagnóstico; con
+    isócrona, también su contorno como [[dlon, dlat], ...].
+    """
+    zona = diag.zona
+    lon0, lat0 = round(diag.lon, 6), round(diag.lat, 6)
+    x0, y0 = capa_puntos.a_metrico(lon0, lat0)
+    carga = {"v": VERSION_CARGA, "o": [lon0, lat0], "r": diag.radio, "q": CUANTIZACION}
+
+    for clave, (capa, columna) in CAPAS_GEMELO.items():
+        posiciones = zona.posiciones[capa]
+        if len(posiciones) == 0:
+            continue
+        lons, lats = zona.lonlat(capa)
+        if columna in zona.indice.capas[capa].columns:
+            nombres = zona.indice.valores(capa, columna)[posiciones]
+        else:
+            nombres = [None] * len(posiciones)
+        dlon, dlat = _relativas(lons, lats, lon0, lat0)
+        orden = np.arange(len(posiciones))
+        if len(orden) > max_elementos:
+            # Sobran elementos: se quedan los más cercanos al punto
+            capa_metrica = zona.indice.capas[capa]
+            d2 = (capa_metrica.x[posiciones] - x0) ** 2 + (capa_metrica.y[posiciones] - y0) ** 2
+            orden = np.sort(np.argsort(d2, kind="stable")[:max_elementos])
+        carga[clave] = [[int(dlon[i]), int(dlat[i]), _nombre(nombres[i])] for i in orden]
+
+    if diag.isocrona:
+        metrico = shapely.transform(
+            diag.area_interes, lambda c: np.column_stack(capa_puntos.a_metrico(c[:, 0], c[:, 1]))
+        )
+        contorno = red_peatonal.a_gps(shapely.simplify(metrico, TOLERANCIA_CONTORNO))
+        if isinstance(contorno, shapely.Polygon) and not contorno.is_empty:
+            xs, ys = contorno.exterior.xy
+            dlon, dlat = _relativas(xs, ys, lon0, lat0)
+            carga["z"] = np.column_stack([dlon, dlat]).tolist()
+    return carga
+
+
+def codificar(carga):
+    """dict -> texto para URL (JSON compacto, deflate crudo, base64url sin relleno)."""
+    datos = json.dumps(carga, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    compresor = zlib.compressobj(9, zlib.DEFLATED, -15)
+    comprimido = compresor.compress(datos) + compresor.flush()
+    return base64.urlsafe_b64encode(comprimido).rstrip(b"=").decode("ascii")
+
+
+def decodificar(texto):
+    """Inverso de codificar (lo que hace el visor en JavaScript)."""
+    comprimido = base64.urlsafe_b64decode(texto + "=" * (-len(texto) % 4))
+    return json.loads(zlib.decompress(comprimido, -15).decode("utf-8"))
+
+
+def url_gemelo(diag, localidad, url_base=URL_GEMELO, altura=800):
+    """Enlace al visor 3D: los parámetros de siempre en la consulta y la carga en el fragmento."""
+    parametros = urllib.parse.urlencode({
+        "lat": diag.lat, "lon": diag.lon, "radio": diag.radio, "loc": localidad, "altura": altura,
+    })
+    return f"{url_base}?{parametros}#d={codificar(carga_gemelo(diag))}"
@@ -0,0 +1,86 @@
+# Geometría liviana para los mapas Folium
+"""
+Versiones simplificadas y cuantizadas de una capa de polígonos, una por nivel
+de zoom, para no mandar al navegador el GeoJSON completo en cada rerun.
+
+* La simplificación es de cobertura (shapely.coverage_simplify): los bordes
+  compartidos entre localidades se simplifican una sola vez, así que no
+  aparecen huecos ni traslapes entre vecinas.
+* La tolerancia de cada nivel es ~1 píxel a ese zoom, medida en metros
+  (EPSG:3116).
+* Las coordenadas se cuantizan a 5 decimales (~1 m) y solo viajan las columnas
+  que el mapa usa.
+
+Se calcula una vez por versión de datos y se guarda en memoria (la app lo
+envuelve en st.cache_resource).
+"""
+import math
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+CRS_METRICO = "EPSG:3116"
+DECIMALES = 5
+
+# Zoom -> tolerancia (m): un píxel de 256 px por tesela a la latitud de Bogotá
+LATITUD_REFERENCIA = 4.6
+NIVELES_ZOOM = (11, 13, 15, 17)
+
+
+def metros_por_pixel(zoom, lat=LATITUD_REFERENCIA):
+    return 156543.03392 * math.cos(math.radians(lat)) / (2 ** zoom)
+
+
+def _cuantizar(geoms, decimales=DECIMALES):
+    """Redondea las coordenadas a la rejilla de `decimales` sin romper la validez."""
+    geoms = shapely.set_precision(geoms, 10 ** -decimales)
+    coords = shapely.get_coordinates(geoms)
+    return shapely.set_coordinates(geoms.copy(), np.round(coords, decimales))
+
+
+class GeometriaWeb:
+    """
+    Niveles simplificados de una capa de polígonos.
+    geojson(zoom) devuelve el FeatureCollection (dict) del nivel adecuado,
+    listo para folium.GeoJson.
+    """
+
+    def __init__(self, gdf, campos, niveles=NIVELES_ZOOM):
+        gdf = gdf[gdf.geometry.notna() & ~gdf.geometry.is_empty]
+        self.campos = list(campos)
+        self.propiedades = gdf[self.campos].to_dict("records")
+        metrico = gdf.geometry.to_crs(CRS_METRICO).values
+
+        self.niveles = {}
+        for zoom in sorted(niveles):
+            simplificadas = shapely.coverage_simplify(metrico, metros_por_pixel(zoom))
+            en_gps = gpd.GeoSeries(simplificadas, crs=CRS_METRICO).to_crs("EPSG:4326").values
+            self.niveles[zoom] = _cuantizar(np.asarray(en_gps))
+
+    def nivel_para(self, zoom):
+        """El nivel más grueso cuyo error es menor a un píxel al zoom pedido."""
+        for nivel in self.niveles:
+            if nivel >= zoom:
+                return nivel
+        return max(self.niveles)
+
+    def geojson(self, zoom, filtro=None):
+        """
+        FeatureCollection del nivel para `zoom`. `filtro` (opcional) es un dict
+        campo -> valor para quedarse con algunos elementos.
+        """
+        geoms = self.niveles[self.nivel_para(zoom)]
+        features = []
+        for props, geom in zip(self.propiedades, geoms):
+            if filtro and any(props.get(c) != v for c, v in filtro.items()):
+                continue
+            features.append({
+                "type": "Feature",
+                "properties": props,
+                "geometry": shapely.geometry.mapping(geom),
+            })
+        return {"type": "FeatureCollection", "features": features}
+
+    def vertices(self, zoom):
+        return int(shapely.get_num_coordinates(self.niveles[self.nivel_para(zoom)]).sum())
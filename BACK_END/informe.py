@@ -0,0 +1,168 @@
+# Informe Ejecutivo (Ficha de Inteligencia Territorial)
+"""
+Construcción del HTML descargable del paso 5, separada de la app para que
+pueda correr fuera del hilo de la sesión de Streamlit (ver servicio_informes.py).
+
+datos_informe() extrae del diagnóstico solo lo que el informe necesita, en un
+dict de tipos simples que se puede enviar a otro proceso; generar_informe()
+rasteriza el mapa y llena la plantilla.
+"""
+import base64
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import mapa_estatico
+
+
+def html_mapa(area, lat, lon, puntos):
+    """Mapa PNG (base64) incrustable en el Informe Ejecutivo."""
+    try:
+        img_bytes = mapa_estatico.mapa_informe(area, lat, lon, puntos)
+        b64_mapa = base64.b64encode(img_bytes).decode('utf-8')
+        return f'<img src="data:image/png;base64,{b64_mapa}" style="width:100%; border-radius:8px; border:1px solid #ccc;">'
+    except Exception as e:
+        return f"<div style='padding:20px; background:#f0f0f0;'>Mapa no disponible ({str(e)})</div>"
+
+
+def lista_seguridad(seguridad_texto):
+    """Top 3 de delitos como lista vertical HTML."""
+    if "," in seguridad_texto:
+        items_seg = seguridad_texto.split(",")
+        lista_seguridad_html = "<ul style='margin-top:5px; margin-bottom:5px;'>"
+        for item in items_seg:
+            lista_seguridad_html += f"<li>{item.strip()}</li>"
+        lista_seguridad_html += "</ul>"
+    else:
+        lista_seguridad_html = f"<p>{seguridad_texto}</p>"
+    return lista_seguridad_html
+
+
+def datos_informe(diag, localidad, seguridad_texto):
+    """Todo lo que necesita el informe, en tipos simples (serializable con pickle)."""
+    datos = {
+        "localidad": localidad,
+        "seguridad_texto": seguridad_texto,
+        "lat": diag.lat, "lon": diag.lon, "radio": diag.radio,
+        "num_tm": diag.num_tm, "num_col": diag.num_col,
+        "num_salud": diag.num_salud, "num_parques": diag.num_parques,
+        "uso_moda": diag.uso_moda, "estrato_moda": diag.estrato_moda,
+        "dictamen": diag.dictamen, "color_fondo": diag.color_fondo,
+        "explicacion_score": diag.explicacion_score,
+        "area": diag.area_interes,
+        "puntos": diag.puntos_informe(),
+    }
+    # Si el mapa ya se generó para este diagnóstico, se reutiliza
+    if diag._html_mapa is not None:
+        datos["html_mapa"] = diag._html_mapa
+    return datos
+
+
+def generar_informe(datos):
+    """HTML completo de la Ficha de Inteligencia Territorial."""
+    localidad = datos["localidad"]
+    lista_seguridad_html = lista_seguridad(datos["seguridad_texto"])
+    lat, lon, radio = datos["lat"], datos["lon"], datos["radio"]
+    num_tm, num_col = datos["num_tm"], datos["num_col"]
+    num_salud, num_parques = datos["num_salud"], datos["num_parques"]
+    uso_moda, estrato_moda = datos["uso_moda"], datos["estrato_moda"]
+    dictamen, color_fondo = datos["dictamen"], datos["color_fondo"]
+    explicacion_score = datos.get("explicacion_score", "")
+
+    html_mapa_informe = datos.get("html_mapa") or html_mapa(datos["area"], lat, lon, datos["puntos"])
+
+    # Marca de tiempo con Zona Horaria de Colombia
+    zona_bogota = ZoneInfo('America/Bogota')
+    ahora_bogota = datetime.now(zona_bogota)
+    fecha_reporte = ahora_bogota.strftime("%d/%m/%Y %I:%M %p") 
+
+    # PLANTILLA HTML MEJORADA CON LEYENDA DE COLORES
+    html_report = f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="UTF-8">
+        <style>
+            body {{ font-family: 'Helvetica', sans-serif; max-width: 800px; margin: 0 auto; color: #333; }}
+            .header {{ text-align: center; padding: 25px; background: #2C3E50; color: white; border-radius: 0 0 10px 10px; }}
+            .card {{ border: 1px solid #ddd; padding: 20px; border-radius: 8px; margin-top: 20px; box-shadow: 0 4px 6px rgba(0,0,0,0.05); }}
+            .intro-text {{ font-size: 14px; color: #555; font-style: italic; margin-bottom: 15px; text-align: justify; }}
+            
+            /* Estilo Tabla KPI */
+            .kpi-table {{ width: 100%; border-collapse: collapse; margin-top: 15px; }}
+            .kpi-table th {{ background-color: #F4F6F7; padding: 8px; text-align: left; border: 1px solid #ddd; font-size: 11px; color: #555; vertical-align: middle; }}
+            .kpi-table td {{ padding: 10px; text-align: center; border: 1px solid #ddd; font-size: 16px; font-weight: bold; color: #2C3E50; }}
+            
+            /* Círculos de Colores (Leyenda) */
+            .dot {{
+                height: 10px;
+                width: 10px;
+                border-radius: 50%;
+                display: inline-block;
+                margin-right: 5px;
+                border: 1px solid #ccc;
+            }}
+
+            .dictamen-box {{ margin-top: 20px; padding: 20px; background: {color_fondo}; color: white; text-align: center; border-radius: 8px; }}
+            .security-box {{ margin-top: 10px; padding: 15px; background: #FDEDEC; border-left: 5px solid #C0392B; color: #922B21; }}
+        </style>
+    </head>
+    <body>
+        <div class="header">
+            <h1 style="margin:0;">Ficha de Inteligencia Territorial</h1>
+            <p style="margin:5px 0 0;">Bogotá D.C. | Localidad {localidad}</p>
+        </div>
+
+        <div class="card">
+            <h3 style="margin-top:0; border-bottom: 1px solid #eee; padding-bottom: 10px;">📍 Análisis de Entorno y Cobertura</h3>
+            
+            <p class="intro-text">
+                Una vez evaluada la zona seleccionada en las coordenadas ({lat:.4f}, {lon:.4f}) con un radio de {radio} metros, 
+                es importante determinar los factores de infraestructura, bienestar y normativa detallados:
+            </p>
+            
+            {html_mapa_informe}
+            
+            <table class="kpi-table">
+                <tr>
+                    <th><span class="dot" style="background-color: #E74C3C;"></span>TRANSMILENIO</th>
+                    <th><span class="dot" style="background-color: #9625C7;"></span>COLEGIOS</th>
+                    <th><span class="dot" style="background-color: #178B27;"></span>PARQUES</th>
+                    <th><span class="dot" style="background-color: #3A07F3;"></span>SALUD</th>
+                    <th>MODA ESTRATO</th>
+                    <th>MODA USO POT</th>
+                </tr>
+                <tr>
+                    <td>{num_tm}</td>
+                    <td>{num_col}</td>
+                    <td>{num_parques}</td>
+                    <td>{num_salud}</td>
+                    <td>{estrato_moda}</td>
+                    <td style="font-size:12px;">{uso_moda}</td>
+                </tr>
+            </table>
+        </div>
+
+        <div class="card">
+            <h3 style="margin-top:0; border-bottom: 1px solid #eee; padding-bottom: 10px;">🛡️ Contexto de Seguridad</h3>
+            <p class="intro-text">
+                A nivel de la localidad de {localidad}, es prudente destacar que el entorno de seguridad se caracteriza 
+                por la prevalencia de los siguientes incidentes de alto impacto:
+            </p>
+            <div class="security-box">
+                {lista_seguridad_html}
+            </div>
+        </div>
+
+        <div class="dictamen-box">
+            <p style="margin:0; font-size:14px; opacity:0.9;">DICTAMEN TÉCNICO MULTIDIMENSIONAL</p>
+            <h2 style="margin:5px 0 0; font-size:24px;">{dictamen}</h2>
+            <p style="margin-top:10px; font-size:12px;">Basado en 5 factores: Movilidad, Educación, Salud, Espacio Público y Normativa. {explicacion_score}</p>
+        </div>
+        
+        <div style="text-align: center; margin-top: 30px; color: #999; font-size: 11px;">
+            Reporte generado automáticamente con Datos Abiertos de Bogotá | {fecha_reporte}
+        </div>
+    </body>
+    </html>
+    """
+    return html_report
@@ -0,0 +1,205 @@
+# Instrumentación: tiempos por tramo
+"""
+Tramos con nombre alrededor de cada etapa de la app (carga de datos, mapas
+folium, st_folium, cruces espaciales, figuras Plotly, informe) y un
+histograma de latencias por tramo.
+
+    with instrumentacion.tramo("paso5.diagnostico"):
+        ...
+
+Cada medición va al agregado del proceso (METRICAS) y, si la sesión de
+Streamlit registró las suyas con usar_sesion(), también a las de esa sesión.
+Los histogramas usan cubetas fijas en milisegundos, así que ocupan lo mismo
+con diez mediciones que con un millón; los percentiles se interpolan dentro
+de la cubeta.
+
+Exportación: a_json() y a_prometheus() (formato de texto de Prometheus). Con
+BOGOTA_PUERTO_METRICAS, servir() expone ambos en 127.0.0.1:<puerto>/metrics
+y /metrics.json para rasparlos localmente.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Límites superiores de las cubetas (ms); la última cubeta (+Inf) recoge el resto
+LIMITES_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# Puerto del exportador local (0 = apagado)
+PUERTO_METRICAS = int(os.environ.get("BOGOTA_PUERTO_METRICAS", 0))
+
+
+class Histograma:
+    """Conteos por cubeta + suma, mínimo y máximo de las mediciones (ms)."""
+
+    def __init__(self, limites=LIMITES_MS):
+        self.limites = limites
+        self.conteos = [0] * (len(limites) + 1)
+        self.n = 0
+        self.suma_ms = 0.0
+        self.min_ms = float("inf")
+        self.max_ms = 0.0
+
+    def registrar(self, ms):
+        i = 0
+        while i < len(self.limites) and ms > self.limites[i]:
+            i += 1
+        self.conteos[i] += 1
+        self.n += 1
+        self.suma_ms += ms
+        self.min_ms = min(self.min_ms, ms)
+        self.max_ms = max(self.max_ms, ms)
+
+    def cuantil(self, q):
+        """Percentil `q` (0-1) aproximado, interpolando dentro de la cubeta."""
+        if self.n == 0:
+            return None
+        objetivo = q * self.n
+        acumulado = 0
+        for i, conteo in enumerate(self.conteos):
+            if conteo and acumulado + conteo >= objetivo:
+                inferior = self.limites[i - 1] if i > 0 else 0.0
+                superior = self.limites[i] if i < len(self.limites) else self.max_ms
+                inferior, superior = max(inferior, self.min_ms), min(superior, self.max_ms)
+                return inferior + (superior - inferior) * (objetivo - acumulado) / conteo
+            acumulado += conteo
+        return self.max_ms
+
+    def resumen(self):
+        return {
+            "n": self.n,
+            "media_ms": round(self.suma_ms / self.n, 3) if self.n else None,
+            "p50_ms": _redondear(self.cuantil(0.5)),
+            "p95_ms": _redondear(self.cuantil(0.95)),
+            "max_ms": round(self.max_ms, 3) if self.n else None,
+        }
+
+
+def _redondear(valor):
+    return None if valor is None else round(valor, 3)
+
+
+class Metricas:
+    """Histogramas por nombre de tramo, seguros entre hilos."""
+
+    def __init__(self):
+        self._histogramas = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, nombre, ms):
+        with self._lock:
+            if nombre not in self._histogramas:
+                self._histogramas[nombre] = Histograma()
+            self._histogramas[nombre].registrar(ms)
+
+    def reiniciar(self):
+        with self._lock:
+            self._histogramas.clear()
+
+    def resumen(self):
+        """Tabla (lista de dicts) con n, media, p50, p95 y máximo de cada tramo."""
+        with self._lock:
+            return [{"tramo": nombre, **h.resumen()} for nombre, h in sorted(self._histogramas.items())]
+
+    def a_json(self):
+        """Resumen y cubetas de cada tramo, en JSON."""
+        with self._lock:
+            datos = {
+                nombre: {**h.resumen(), "limites_ms": list(h.limites), "conteos": list(h.conteos)}
+                for nombre, h in sorted(self._histogramas.items())
+            }
+        return json.dumps({"generado": time.time(), "tramos": datos}, ensure_ascii=False, indent=2)
+
+    def a_prometheus(self, metrica="bogota_tramo_segundos"):
+        """Histogramas en el formato de texto de Prometheus (segundos, cubetas acumuladas)."""
+        lineas = [
+            f"# HELP {metrica} Duración de cada tramo instrumentado de la app.",
+            f"# TYPE {metrica} histogram",
+        ]
+        with self._lock:
+            for nombre, h in sorted(self._histogramas.items()):
+                etiqueta = nombre.replace("\\", "\\\\").replace('"', '\\"')
+                acumulado = 0
+                for limite, conteo in zip(h.limites, h.conteos):
+                    acumulado += conteo
+                    lineas.append(f'{metrica}_bucket{{tramo="{etiqueta}",le="{limite / 1000:g}"}} {acumulado}')
+                lineas.append(f'{metrica}_bucket{{tramo="{etiqueta}",le="+Inf"}} {h.n}')
+                lineas.append(f'{metrica}_sum{{tramo="{etiqueta}"}} {h.suma_ms / 1000:.6f}')
+                lineas.append(f'{metrica}_count{{tramo="{etiqueta}"}} {h.n}')
+        return "\n".join(lineas) + "\n"
+
+
+# Agregado del proceso (todas las sesiones)
+METRICAS = Metricas()
+
+# Métricas de la sesión que corre en este hilo (las fija la app al inicio de cada rerun)
+_sesion = contextvars.ContextVar("metricas_sesion", default=None)
+
+
+def usar_sesion(metricas):
+    """Las mediciones siguientes de este hilo también van a `metricas` (None = solo al agregado)."""
+    _sesion.set(metricas)
+
+
+def registrar(nombre, ms):
+    """Registra una duración ya medida (ms) en el agregado y en la sesión actual."""
+    METRICAS.registrar(nombre, ms)
+    sesion = _sesion.get()
+    if sesion is not None:
+        sesion.registrar(nombre, ms)
+
+
+@contextmanager
+def tramo(nombre):
+    """Mide el bloque (también si termina con excepción, p. ej. st.rerun); sirve como decorador."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar(nombre, (time.perf_counter() - inicio) * 1000)
+
+
+class _Exportador(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            cuerpo, tipo = METRICAS.a_prometheus(), "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path == "/metrics.json":
+            cuerpo, tipo = METRICAS.a_json(), "application/json; charset=utf-8"
+        else:
+            self.send_error(404)
+            return
+        datos = cuerpo.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def log_message(self, *args):
+        pass  # Sin una línea en consola por cada raspado
+
+
+_servidor = None
+_lock_servidor = threading.Lock()
+
+
+def servir(puerto=PUERTO_METRICAS, anfitrion="127.0.0.1"):
+    """
+    Arranca (una sola vez por proceso) el exportador HTTP en un hilo.
+    Devuelve el servidor, o None si `puerto` es 0 o ya está ocupado.
+    """
+    global _servidor
+    if not puerto:
+        return None
+    with _lock_servidor:
+        if _servidor is None:
+            try:
+                _servidor = ThreadingHTTPServer((anfitrion, puerto), _Exportador)
+            except OSError:
+                return None
+            _servidor.daemon_threads = True
+            threading.Thread(target=_servidor.serve_forever, name="exportador-metricas", daemon=True).start()
+        return _servidor
@@ -0,0 +1,115 @@
+# Lectura por bloques de las fuentes brutas
+"""
+Lectores acotados en memoria para las fuentes de DATOS_BRUTOS/ que usa
+pipeline_datos.py.
+
+Antes cada etapa leía el archivo completo (todas las columnas y todas las
+filas) y luego se quedaba con dos a cinco columnas. Aquí:
+
+* Capas vectoriales (shp, zip, gpkg, geojson): pyogrio lee solo las columnas
+  pedidas y los elementos que tocan la caja de Bogotá, en lotes Arrow de
+  `tam_bloque` filas; cada lote se reproyecta a EPSG:4326 antes de pasar al
+  siguiente.
+* Excel: openpyxl en modo solo lectura, fila a fila, y solo las columnas
+  pedidas, en bloques de `tam_bloque` filas.
+* CSV: pandas con usecols y chunksize.
+
+Así el pico de memoria depende del tamaño del bloque y de lo que se conserva,
+no del tamaño del archivo.
+"""
+import os
+
+import geopandas as gpd
+import pandas as pd
+import pyogrio
+import pyproj
+
+# Caja de Bogotá en EPSG:4326 (incluye Sumapaz), con margen
+BBOX_BOGOTA = (-74.50, 3.70, -73.95, 4.85)
+
+TAM_BLOQUE = int(os.environ.get("BOGOTA_BLOQUE_LECTURA", 20_000))
+
+
+def _arrow_disponible():
+    """Los lotes de pyogrio necesitan pyarrow; sin él se lee de una vez (igual con columnas y caja)."""
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _caja_en_crs(crs, bbox=BBOX_BOGOTA):
+    """`bbox` (EPSG:4326) en el CRS de la capa, para filtrar sin reproyectar la capa."""
+    if crs is None:
+        return bbox
+    transformador = pyproj.Transformer.from_crs("EPSG:4326", crs, always_xy=True)
+    return transformador.transform_bounds(*bbox)
+
+
+def leer_vectorial(ruta, columnas, bbox=BBOX_BOGOTA, tam_bloque=TAM_BLOQUE, crs_si_falta=None):
+    """
+    GeoDataFrame (EPSG:4326) con solo `columnas` + geometry y solo los
+    elementos que tocan `bbox` (None = todos), leído por lotes.
+    `crs_si_falta` se asume cuando el archivo no trae CRS.
+    """
+    info = pyogrio.read_info(ruta)
+    crs = info["crs"] or crs_si_falta
+    caja = _caja_en_crs(crs, bbox) if bbox is not None else None
+
+    if not _arrow_disponible():
+        gdf = pyogrio.read_dataframe(ruta, columns=columnas, bbox=caja)
+        if gdf.crs is None and crs is not None:
+            gdf = gdf.set_crs(crs)
+        return gdf.to_crs("EPSG:4326") if gdf.crs is not None else gdf
+
+    bloques = []
+    with pyogrio.open_arrow(ruta, columns=columnas, bbox=caja, batch_size=tam_bloque, use_pyarrow=True) as (meta, lector):
+        for lote in lector:
+            bloque = gpd.GeoDataFrame.from_arrow(lote)
+            bloque = bloque.rename_geometry("geometry") if bloque.geometry.name != "geometry" else bloque
+            if bloque.crs is None and crs is not None:
+                bloque = bloque.set_crs(crs)
+            if bloque.crs is not None:
+                bloque = bloque.to_crs("EPSG:4326")
+            bloques.append(bloque[list(columnas) + ["geometry"]])
+
+    if not bloques:
+        return gpd.GeoDataFrame(columns=list(columnas) + ["geometry"], geometry="geometry", crs="EPSG:4326")
+    return pd.concat(bloques, ignore_index=True)
+
+
+def bloques_excel(ruta, columnas, tam_bloque=TAM_BLOQUE, hoja=None):
+    """
+    Genera DataFrames de hasta `tam_bloque` filas con solo `columnas` de la
+    hoja (la primera si es None); la primera fila es el encabezado.
+    """
+    from openpyxl import load_workbook
+
+    libro = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        hoja = libro[hoja] if hoja is not None else libro.worksheets[0]
+        filas = hoja.iter_rows(values_only=True)
+        encabezado = [str(c).strip() if c is not None else "" for c in next(filas, ())]
+        faltantes = [c for c in columnas if c not in encabezado]
+        if faltantes:
+            raise KeyError(f"Columnas ausentes en {os.path.basename(ruta)}: {faltantes}")
+        posiciones = [encabezado.index(c) for c in columnas]
+
+        bloque = []
+        for fila in filas:
+            if fila is None or all(v is None for v in fila):
+                continue  # Filas vacías (read_excel también las descarta al final de la hoja)
+            bloque.append([fila[i] if i < len(fila) else None for i in posiciones])
+            if len(bloque) >= tam_bloque:
+                yield pd.DataFrame(bloque, columns=columnas)
+                bloque = []
+        if bloque:
+            yield pd.DataFrame(bloque, columns=columnas)
+    finally:
+        libro.close()
+
+
+def bloques_csv(ruta, columnas, tam_bloque=TAM_BLOQUE, **opciones):
+    """Genera DataFrames de hasta `tam_bloque` filas con solo `columnas` (opciones de read_csv aparte)."""
+    yield from pd.read_csv(ruta, usecols=columnas, chunksize=tam_bloque, **opciones)
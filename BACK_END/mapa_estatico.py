@@ -0,0 +1,144 @@
+# Mapa estático del Informe Ejecutivo (sin navegador)
+"""
+Rasterizador en Python puro (Pillow) para el mapa PNG del Informe Ejecutivo.
+
+Reemplaza a fig.to_image() de kaleido, que levantaba un Chromium por cada
+informe. Dibuja el radio de análisis, las estaciones, los colegios, la salud,
+los centroides de parques y el punto del usuario sobre una proyección Web
+Mercator. Si hay teselas base guardadas en disco (BOGOTA_TESELAS_DIR, con la
+estructura {z}/{x}/{y}.png) se usan de fondo; si no, el fondo es liso.
+
+La salida es estable byte a byte: las mismas entradas producen el mismo PNG.
+"""
+import io
+import math
+import os
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+DIR_TESELAS = os.environ.get("BOGOTA_TESELAS_DIR", "")
+TAMANO_TESELA = 256
+
+ANCHO, ALTO = 1200, 700
+# Se dibuja a mayor resolución y se reduce al final: bordes suavizados sin depender del motor de dibujo
+SUPERMUESTREO = 2
+MARGEN = 0.12
+
+COLOR_FONDO = (242, 242, 240)
+COLOR_ZONA_RELLENO = (52, 152, 219, 26)
+COLOR_ZONA_BORDE = (52, 152, 219, 255)
+
+
+def _hex_a_rgb(color):
+    color = color.lstrip("#")
+    return tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def _mercator(lon, lat):
+    """Coordenadas Web Mercator normalizadas a [0, 1] (x hacia el este, y hacia el sur)."""
+    lon = np.asarray(lon, dtype=float)
+    lat = np.clip(np.asarray(lat, dtype=float), -85.0511, 85.0511)
+    x = (lon + 180.0) / 360.0
+    s = np.sin(np.radians(lat))
+    y = 0.5 - np.log((1 + s) / (1 - s)) / (4 * np.pi)
+    return x, y
+
+
+class Lienzo:
+    """Marco de píxeles centrado en un punto y ajustado a unos límites (lon/lat)."""
+
+    def __init__(self, centro_lon, centro_lat, limites, ancho=ANCHO, alto=ALTO, escala=SUPERMUESTREO):
+        self.ancho, self.alto, self.escala = ancho * escala, alto * escala, escala
+        self.cx, self.cy = (float(v) for v in _mercator(centro_lon, centro_lat))
+
+        # Píxeles por unidad Mercator para que los límites quepan con margen
+        minx, miny = _mercator(limites[0], limites[3])
+        maxx, maxy = _mercator(limites[2], limites[1])
+        media_x = max(abs(float(maxx) - self.cx), abs(float(minx) - self.cx), 1e-9)
+        media_y = max(abs(float(maxy) - self.cy), abs(float(miny) - self.cy), 1e-9)
+        util = 1 - 2 * MARGEN
+        self.px_por_unidad = min(self.ancho * util / (2 * media_x), self.alto * util / (2 * media_y))
+
+        self.imagen = Image.new("RGBA", (self.ancho, self.alto), COLOR_FONDO + (255,))
+
+    def a_pixeles(self, lon, lat):
+        x, y = _mercator(lon, lat)
+        px = (x - self.cx) * self.px_por_unidad + self.ancho / 2
+        py = (y - self.cy) * self.px_por_unidad + self.alto / 2
+        return px, py
+
+    def fondo_teselas(self, dir_teselas=DIR_TESELAS):
+        """Pega las teselas locales que cubran el marco. Devuelve cuántas encontró."""
+        if not dir_teselas or not os.path.isdir(dir_teselas):
+            return 0
+        # Zoom entero cuya resolución es la inmediatamente superior a la del marco
+        z = max(0, min(19, math.ceil(math.log2(self.px_por_unidad / TAMANO_TESELA))))
+        n = 2 ** z
+        factor = self.px_por_unidad / (TAMANO_TESELA * n)
+
+        x0 = self.cx - self.ancho / 2 / self.px_por_unidad
+        y0 = self.cy - self.alto / 2 / self.px_por_unidad
+        x1 = self.cx + self.ancho / 2 / self.px_por_unidad
+        y1 = self.cy + self.alto / 2 / self.px_por_unidad
+
+        encontradas = 0
+        lado = math.ceil(TAMANO_TESELA * factor) + 1
+        for tx in range(max(0, int(x0 * n)), min(n - 1, int(x1 * n)) + 1):
+            for ty in range(max(0, int(y0 * n)), min(n - 1, int(y1 * n)) + 1):
+                ruta = os.path.join(dir_teselas, str(z), str(tx), f"{ty}.png")
+                if not os.path.exists(ruta):
+                    continue
+                with Image.open(ruta) as tesela:
+                    tesela = tesela.convert("RGBA").resize((lado, lado), Image.BILINEAR)
+                px = round((tx / n - self.cx) * self.px_por_unidad + self.ancho / 2)
+                py = round((ty / n - self.cy) * self.px_por_unidad + self.alto / 2)
+                self.imagen.paste(tesela, (px, py))
+                encontradas += 1
+        return encontradas
+
+    def poligono(self, geom, relleno, borde, grosor=2):
+        """Dibuja el anillo exterior de un polígono con relleno semitransparente."""
+        xs, ys = geom.exterior.xy
+        px, py = self.a_pixeles(np.asarray(xs), np.asarray(ys))
+        puntos = list(zip(px.tolist(), py.tolist()))
+        capa = Image.new("RGBA", self.imagen.size, (0, 0, 0, 0))
+        ImageDraw.Draw(capa).polygon(puntos, fill=relleno)
+        self.imagen = Image.alpha_composite(self.imagen, capa)
+        ImageDraw.Draw(self.imagen).line(puntos + puntos[:1], fill=borde, width=grosor * self.escala)
+
+    def puntos(self, lons, lats, color, diametro=6):
+        """Marcadores circulares (diámetro en píxeles de la imagen final)."""
+        if len(lons) == 0:
+            return
+        px, py = self.a_pixeles(lons, lats)
+        r = diametro * self.escala / 2
+        dibujo = ImageDraw.Draw(self.imagen)
+        relleno = _hex_a_rgb(color) + (255,)
+        for x, y in zip(px.tolist(), py.tolist()):
+            dibujo.ellipse((x - r, y - r, x + r, y + r), fill=relleno, outline=(255, 255, 255, 255),
+                           width=max(1, self.escala // 2))
+
+    def png(self):
+        """PNG final (reducido a la resolución de salida), sin metadatos variables."""
+        final = self.imagen.convert("RGB").resize(
+            (self.ancho // self.escala, self.alto // self.escala), Image.LANCZOS
+        )
+        salida = io.BytesIO()
+        final.save(salida, format="PNG", optimize=False, compress_level=6)
+        return salida.getvalue()
+
+
+def mapa_informe(area, lat, lon, capas_puntos, dir_teselas=DIR_TESELAS):
+    """
+    PNG del mapa del informe.
+    `area` es el polígono del radio (EPSG:4326); `capas_puntos` es una lista de
+    (lons, lats, color) que se dibujan en ese orden; el punto del usuario va encima.
+    """
+    lienzo = Lienzo(lon, lat, area.bounds)
+    lienzo.fondo_teselas(dir_teselas)
+    lienzo.poligono(area, COLOR_ZONA_RELLENO, COLOR_ZONA_BORDE)
+    for lons, lats, color in capas_puntos:
+        lienzo.puntos(np.asarray(lons, dtype=float), np.asarray(lats, dtype=float), color)
+    lienzo.puntos(np.array([lon]), np.array([lat]), "#000000", diametro=12)
+    return lienzo.png()
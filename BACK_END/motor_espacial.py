@@ -0,0 +1,334 @@
+# Motor de consultas espaciales de Bogotá Visible
+"""
+Consultas espaciales vectorizadas (shapely 2) que usa la app en cada clic.
+
+Todas las capas se indexan una sola vez en metros (EPSG:3116), así que las
+consultas por distancia (a menos de r metros, los k más cercanos, distancia
+al más cercano) son exactas y no reproyectan nada por petición: solo el punto
+consultado pasa de GPS a metros.
+"""
+import hashlib
+import threading
+
+import numpy as np
+import pandas as pd
+import shapely
+
+import capa_puntos
+from capa_puntos import CRS_METRICO
+
+# Se sube cuando cambia el criterio de las consultas (invalida rejillas y cachés de diagnósticos)
+VERSION_CONSULTAS = 3
+
+# Vértices del círculo que se dibuja alrededor del punto (como buffer() de shapely)
+SEGMENTOS_CIRCULO = 64
+
+# Primer radio (metros) de la búsqueda de vecinos más cercanos en capas de polígonos
+RADIO_INICIAL_CERCANOS = 250.0
+
+
+def circulo_gps(lon, lat, radio, segmentos=SEGMENTOS_CIRCULO):
+    """Polígono (EPSG:4326) de un círculo de `radio` metros, solo para dibujarlo."""
+    x, y = capa_puntos.a_metrico(lon, lat)
+    angulos = np.linspace(0, 2 * np.pi, segmentos + 1)
+    lons, lats = capa_puntos.a_gps(x + radio * np.cos(angulos), y + radio * np.sin(angulos))
+    return shapely.Polygon(np.column_stack([lons, lats]))
+
+
+class IndiceEspacial:
+    """
+    Un STRtree en metros por capa de polígonos, construido una sola vez por
+    proceso; las capas de puntos se guardan compactas (ver capa_puntos.py).
+
+    `capas` conserva los GeoDataFrames en EPSG:4326 para pintar y listar;
+    `metricas` y `arboles` son las geometrías en EPSG:3116 sobre las que se
+    consulta. Las posiciones que devuelven las consultas son posiciones (iloc)
+    de la capa.
+
+    Con `base` (el índice de una versión anterior de los datos) las capas que
+    siguen siendo el mismo objeto reutilizan sus geometrías métricas y su
+    STRtree: al refrescar una capa solo se reindexa esa.
+    """
+
+    def __init__(self, capas, base=None):
+        self.capas = {}
+        self.metricas = {}
+        self.arboles = {}
+        self._validas = {}
+        self._valores = {}
+        for nombre, gdf in capa_puntos.compactar(capas).items():
+            if isinstance(gdf, capa_puntos.CapaPuntos):
+                self.capas[nombre] = gdf
+                continue
+            if base is not None and base.capas.get(nombre) is gdf:
+                self.capas[nombre] = gdf
+                self.metricas[nombre] = base.metricas[nombre]
+                self.arboles[nombre] = base.arboles[nombre]
+                self._validas[nombre] = base._validas[nombre]
+                continue
+            # Las capas se muestran en EPSG:4326, como el resto de la app
+            if gdf.crs is not None and gdf.crs.to_string() != "EPSG:4326":
+                gdf = gdf.to_crs("EPSG:4326")
+            self.capas[nombre] = gdf
+            self.metricas[nombre] = gdf.geometry.to_crs(CRS_METRICO).values
+            self.arboles[nombre] = shapely.STRtree(self.metricas[nombre])
+            # Las que indexa el STRtree: sin nulas ni vacías (reparar_geometrias puede dejar vacías)
+            geoms = self.metricas[nombre]
+            self._validas[nombre] = int((~shapely.is_missing(geoms) & ~shapely.is_empty(geoms)).sum())
+
+        # Versión de los datos indexados (huellas de contenido de carga_datos) y del criterio de consulta
+        huellas = "|".join(f"{n}:{self.capas[n].attrs.get('huella', '')}" for n in sorted(self.capas))
+        huellas += f"|consultas:{VERSION_CONSULTAS}"
+        self.version = hashlib.sha256(huellas.encode()).hexdigest()[:12]
+        if base is not None:
+            self._valores = {
+                clave: valores for clave, valores in base._valores.items()
+                if self.capas.get(clave[0]) is base.capas.get(clave[0])
+            }
+
+    def _es_puntual(self, nombre):
+        return isinstance(self.capas[nombre], capa_puntos.CapaPuntos)
+
+    # CONSULTAS DESDE UN PUNTO
+
+    def posiciones_en_radio(self, nombre, lon, lat, radio):
+        """Posiciones (en orden) de las geometrías a `radio` metros o menos del punto."""
+        x, y = capa_puntos.a_metrico(lon, lat)
+        if self._es_puntual(nombre):
+            return self.capas[nombre].dentro_de_radio(x, y, radio)
+        return np.sort(self.arboles[nombre].query(shapely.Point(x, y), predicate="dwithin", distance=radio))
+
+    def en_radio(self, nombre, lon, lat, radio):
+        """
+        Elementos de la capa a `radio` metros o menos del punto: tabla (lon, lat,
+        atributos) para las capas de puntos, subconjunto del GeoDataFrame para las demás.
+        """
+        posiciones = self.posiciones_en_radio(nombre, lon, lat, radio)
+        if self._es_puntual(nombre):
+            return self.capas[nombre].tabla(posiciones)
+        return self.capas[nombre].iloc[posiciones]
+
+    def posiciones_en_area(self, nombre, area):
+        """
+        Posiciones (en orden) de las geometrías que tocan `area`, un polígono en
+        metros (EPSG:3116), p. ej. una isócrona de red_peatonal.py.
+        """
+        if self._es_puntual(nombre):
+            capa = self.capas[nombre]
+            shapely.prepare(area)
+            return np.flatnonzero(shapely.contains_xy(area, capa.x, capa.y))
+        return np.sort(self.arboles[nombre].query(area, predicate="intersects"))
+
+    def en_area(self, nombre, area):
+        """Como en_radio, pero con los elementos que tocan el polígono métrico `area`."""
+        posiciones = self.posiciones_en_area(nombre, area)
+        if self._es_puntual(nombre):
+            return self.capas[nombre].tabla(posiciones)
+        return self.capas[nombre].iloc[posiciones]
+
+    def _mascara(self, nombre, filtro):
+        if filtro is None:
+            return None
+        if not self._es_puntual(nombre):
+            raise ValueError(f"Los filtros solo aplican a capas de puntos ({nombre})")
+        return self.capas[nombre].mascara(*filtro)
+
+    def k_cercanos(self, nombre, lon, lat, k=1, filtro=None):
+        """
+        Los `k` elementos más cercanos al punto: (posiciones, distancias en
+        metros), ordenados de menor a mayor distancia. Para polígonos la
+        distancia es al borde (0 si el punto está dentro). `filtro` es un par
+        (columna, valor) para buscar solo entre algunos puntos (p. ej.
+        ("sector", "OFICIAL")).
+        """
+        x, y = capa_puntos.a_metrico(lon, lat)
+        if self._es_puntual(nombre):
+            return self.capas[nombre].k_cercanos(x, y, k, self._mascara(nombre, filtro))
+        self._mascara(nombre, filtro)
+
+        geoms = self.metricas[nombre]
+        k = min(int(k), self._validas[nombre])
+        if k <= 0:
+            return np.array([], dtype=np.intp), np.array([], dtype=float)
+        punto = shapely.Point(x, y)
+        # Cajas de lado creciente: toda geometría a menos de r metros toca la caja de
+        # semilado r, así que basta con reunir k candidatos a distancia <= r
+        radio = RADIO_INICIAL_CERCANOS
+        while True:
+            candidatos = self.arboles[nombre].query(shapely.box(x - radio, y - radio, x + radio, y + radio))
+            distancias = shapely.distance(geoms[candidatos], punto)
+            if (distancias <= radio).sum() >= k or len(candidatos) == self._validas[nombre]:
+                break
+            radio *= 2
+        # Ante empates gana la de menor posición, como en las capas de puntos
+        orden = np.lexsort((candidatos, distancias))[:k]
+        return candidatos[orden], distancias[orden]
+
+    def valores(self, nombre, columna):
+        """Columna de la capa como arreglo numpy de objetos (se arma una vez; para leer por posición)."""
+        clave = (nombre, columna)
+        if clave not in self._valores:
+            self._valores[clave] = np.asarray(self.capas[nombre][columna].astype(object))
+        return self._valores[clave]
+
+    def distancia_al_mas_cercano(self, nombre, lon, lat, filtro=None):
+        """Distancia en metros al elemento más cercano (inf si la capa está vacía)."""
+        _, distancias = self.k_cercanos(nombre, lon, lat, 1, filtro)
+        return float(distancias[0]) if len(distancias) else float("inf")
+
+    def localidad_en_punto(self, lon, lat):
+        """
+        Fila de la localidad que contiene el punto, o None. Equivale a recorrer
+        localidades.iterrows() con row["geometry"].contains(punto), pero
+        resuelto con una sola consulta al STRtree.
+        """
+        x, y = capa_puntos.a_metrico(lon, lat)
+        candidatas = self.arboles["localidades"].query(shapely.Point(x, y), predicate="within")
+        if len(candidatas) == 0:
+            return None
+        # Ante bordes compartidos, gana la primera en el orden original (como el bucle)
+        return self.capas["localidades"].iloc[int(np.min(candidatas))]
+
+    # CONSULTA DE UNA ZONA EN VARIAS CAPAS
+
+    def consultar_zona(self, nombres, lon, lat, radio, area=None):
+        """
+        Una sola pasada por las capas `nombres` para una misma zona: los
+        elementos a `radio` metros del punto o, con `area` (polígono en metros,
+        p. ej. una isócrona de red_peatonal.py), los que la tocan.
+        La caja de la zona se arma una vez y se consulta en el árbol de cada
+        capa; el predicado exacto solo se evalúa sobre esos candidatos.
+        Devuelve una ConsultaZona.
+        """
+        x, y = capa_puntos.a_metrico(lon, lat)
+        if area is None:
+            caja = shapely.box(x - radio, y - radio, x + radio, y + radio)
+            centro = shapely.Point(x, y)
+        else:
+            shapely.prepare(area)
+            caja = shapely.box(*area.bounds)
+
+        posiciones = {}
+        for nombre in nombres:
+            if self._es_puntual(nombre):
+                capa = self.capas[nombre]
+                candidatos = capa.arbol.query(caja)
+                xs, ys = capa.x[candidatos], capa.y[candidatos]
+                if area is None:
+                    dentro = (xs - x) ** 2 + (ys - y) ** 2 <= float(radio) ** 2
+                else:
+                    dentro = shapely.contains_xy(area, xs, ys)
+            else:
+                candidatos = self.arboles[nombre].query(caja)
+                geoms = self.metricas[nombre][candidatos]
+                if area is None:
+                    dentro = shapely.dwithin(geoms, centro, radio)
+                else:
+                    dentro = shapely.intersects(area, geoms)
+            posiciones[nombre] = np.sort(candidatos[dentro])
+        return ConsultaZona(self, posiciones)
+
+    # CONSULTAS POR LOTES
+
+    def pares_en_radio(self, nombre, xs, ys, radios):
+        """
+        Para muchos puntos en metros a la vez: (pos_punto, pos_geom) de cada
+        par punto-geometría a `radios` metros o menos.
+        """
+        xs = np.asarray(xs, dtype=float)
+        radios = np.broadcast_to(np.asarray(radios, dtype=float), xs.shape)
+        consultas = shapely.points(xs, np.asarray(ys, dtype=float))
+        arbol = self.capas[nombre].arbol if self._es_puntual(nombre) else self.arboles[nombre]
+        return arbol.query(consultas, predicate="dwithin", distance=radios)
+
+    def contar_en_radio(self, nombre, xs, ys, radios):
+        """Cuántos elementos de la capa hay a `radios` metros de cada punto (xs, ys en metros)."""
+        pos_punto, _ = self.pares_en_radio(nombre, xs, ys, radios)
+        return np.bincount(pos_punto, minlength=len(np.asarray(xs)))
+
+    def distancias_k(self, nombre, xs, ys, k=1, filtro=None):
+        """
+        Para muchos puntos en metros a la vez: matriz (n, k) de distancias a los
+        k elementos más cercanos. En capas de polígonos solo k=1 (distancia al borde).
+        """
+        if self._es_puntual(nombre):
+            return self.capas[nombre].distancias_k(xs, ys, k, filtro)
+        if k != 1:
+            raise ValueError(f"En capas de polígonos solo se calcula el más cercano ({nombre})")
+        self._mascara(nombre, filtro)
+        consultas = shapely.points(np.asarray(xs, dtype=float), np.asarray(ys, dtype=float))
+        resultado = np.full((len(consultas), 1), np.inf)
+        if len(self.metricas[nombre]) and len(consultas):
+            (pos_consulta, _), distancias = self.arboles[nombre].query_nearest(
+                consultas, return_distance=True, all_matches=False
+            )
+            resultado[pos_consulta, 0] = distancias
+        return resultado
+
+    def centroides_gps(self, nombre, posiciones):
+        """(lons, lats) de los centroides (calculados en metros) de las posiciones pedidas."""
+        centros = shapely.centroid(self.metricas[nombre][posiciones])
+        return capa_puntos.a_gps(shapely.get_x(centros), shapely.get_y(centros))
+
+
+class ConsultaZona:
+    """
+    Lo que cae en una zona, capa por capa, a partir de una sola pasada por el
+    índice (ver IndiceEspacial.consultar_zona): posiciones, conteos,
+    coordenadas para pintar, conteos y moda de una columna y, la primera vez
+    que se piden, los subconjuntos de cada capa.
+    """
+
+    def __init__(self, indice, posiciones):
+        self.indice = indice
+        self.posiciones = posiciones
+        self._subconjuntos = {}
+        self._coordenadas = {}
+        self._lock = threading.Lock()
+
+    def conteo(self, nombre):
+        return len(self.posiciones[nombre])
+
+    def subconjunto(self, nombre):
+        """Como IndiceEspacial.en_radio: tabla de puntos o subconjunto del GeoDataFrame (se arma una vez)."""
+        with self._lock:
+            if nombre not in self._subconjuntos:
+                posiciones = self.posiciones[nombre]
+                capa = self.indice.capas[nombre]
+                self._subconjuntos[nombre] = (
+                    capa.tabla(posiciones) if self.indice._es_puntual(nombre) else capa.iloc[posiciones]
+                )
+            return self._subconjuntos[nombre]
+
+    def subconjuntos_construidos(self):
+        """Los subconjuntos que ya se pidieron (para estimar memoria sin construir los demás)."""
+        with self._lock:
+            return list(self._subconjuntos.values())
+
+    def lonlat(self, nombre):
+        """(lons, lats) de los puntos, o de los centroides (en metros) de los polígonos, de la zona."""
+        with self._lock:
+            if nombre not in self._coordenadas:
+                posiciones = self.posiciones[nombre]
+                if self.indice._es_puntual(nombre):
+                    capa = self.indice.capas[nombre]
+                    self._coordenadas[nombre] = capa_puntos.a_gps(capa.x[posiciones], capa.y[posiciones])
+                else:
+                    self._coordenadas[nombre] = self.indice.centroides_gps(nombre, posiciones)
+            return self._coordenadas[nombre]
+
+    def _valores(self, nombre, columna, vacio):
+        posiciones = self.posiciones[nombre]
+        if columna not in self.indice.capas[nombre].columns:
+            return pd.Series([vacio] * len(posiciones), dtype=object, name=columna)
+        valores = pd.Series(self.indice.valores(nombre, columna)[posiciones], name=columna)
+        return valores if vacio is None else valores.fillna(vacio)
+
+    def conteos(self, nombre, columna, vacio=None):
+        """value_counts de `columna` en la zona; los nulos cuentan como `vacio` (o se omiten si es None)."""
+        return self._valores(nombre, columna, vacio).value_counts()
+
+    def moda(self, nombre, columna, vacio=None):
+        """Valor más frecuente de `columna` en la zona (el menor ante empates), o `vacio` si no hay."""
+        modas = self._valores(nombre, columna, vacio).mode()
+        return modas.iloc[0] if len(modas) else vacio
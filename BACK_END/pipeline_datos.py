@@ -0,0 +1,383 @@
+# Compilador de datos: DATOS_BRUTOS -> DATOS_LIMPIOS
+"""
+Versión reproducible y ejecutable del cuaderno NOTEBOOKS/EDA_DATOS.ipynb.
+
+Cada etapa lee sus archivos desde DATOS_BRUTOS/ (sin red), limpia la capa y
+escribe en DATOS_LIMPIOS/ el GeoJSON que consume la app más una copia GeoParquet
+compacta. Una etapa se omite si sus entradas (y las etapas de las que depende)
+no cambiaron desde la última ejecución.
+
+Las fuentes se leen por bloques, solo con las columnas que se usan y (las
+capas vectoriales) solo dentro de la caja de Bogotá: ver lectura_bruta.py.
+
+Uso:
+    python BACK_END/pipeline_datos.py                 # todas las etapas
+    python BACK_END/pipeline_datos.py --forzar        # ignora el estado guardado
+    python BACK_END/pipeline_datos.py --etapas areas,verde --reporte reporte.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+import lectura_bruta
+import preparacion
+
+RAIZ_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIR_BRUTOS = os.path.join(RAIZ_PROYECTO, "DATOS_BRUTOS")
+DIR_LIMPIOS = os.path.join(RAIZ_PROYECTO, "DATOS_LIMPIOS")
+ARCHIVO_ESTADO = ".pipeline_estado.json"
+
+
+# LÓGICA DE NEGOCIO
+# La del cuaderno (NOTEBOOKS/EDA_DATOS.ipynb), con dos diferencias a propósito
+# para reproducir los DATOS_LIMPIOS publicados:
+# - La llave del PEMP en mapeo_pot no lleva los "..." del cuaderno: con ellos
+#   no coincide con ningún nombre del POT y esas áreas quedaban como
+#   USO_SIN_CLASIFICAR en vez de 'Histórico y Patrimonial'.
+# - top_3_delitos numera los delitos ("1. Hurto Comercio, 2. ..."), como en
+#   dim_localidad.geojson; el cuaderno los deja sin número.
+
+# Simplificación de usos del POT: categorías técnicas -> lenguaje ciudadano
+mapeo_pot = {
+    'Área de Actividad de Proximidad - AAP - Receptora de soportes urbanos': 'Residencial Mixto',
+    'Área de Actividad de Proximidad - AAP- Generadora de soportes urbanos': 'Comercio y Servicios Locales',
+    'Área de Actividad Estructurante - AAE - Receptora de actividades económicas': 'Empresarial e Industrial',
+    'Área de Actividad Estructurante - AAE - Receptora de vivienda de interés social': 'Alta Densidad / VIS',
+    'Área de Actividad Grandes Servicios Metropolitanos - AAGSM': 'Grandes Dotacionales',
+    'Plan Especial de Manejo y Protección -PEMP BIC Nacional': 'Histórico y Patrimonial'
+}
+USO_SIN_CLASIFICAR = 'Otro / Sin Clasificar'
+
+# Delitos de Alto Impacto (columnas 2024 del DAI)
+cols_delitos = {
+    'CMHR24CONT': 'Hurto Residencias',
+    'CMHC24CONT': 'Hurto Comercio',
+    'CMHA24CONT': 'Hurto Autos',
+    'CMHM24CONT': 'Hurto Motos',
+    'CMHB24CONT': 'Hurto Bicicletas',
+    'CMH24CONT':  'Homicidios'
+}
+
+
+def limpiar_coordenadas(serie):
+    """
+    Convierte una columna de coordenadas a float de forma vectorizada.
+    Lo que ya es numérico pasa directo; solo las celdas de texto (tabulaciones,
+    coma decimal) se limpian con operaciones .str sobre la columna.
+    """
+    valores = pd.to_numeric(serie, errors='coerce')
+    sucias = valores.isna() & serie.notna()
+    if sucias.any():
+        texto = serie[sucias].astype(str)
+        texto = texto.str.replace("\t", "", regex=False).str.replace(",", ".", regex=False).str.strip()
+        valores[sucias] = pd.to_numeric(texto, errors='coerce')
+    return valores.astype(float)
+
+
+def top_3_delitos(gdf_loc):
+    """
+    Calcula los 3 delitos más frecuentes de cada fila con un solo argsort
+    sobre la matriz de conteos (filas = localidades, columnas = delitos).
+    """
+    conteos = gdf_loc[list(cols_delitos.keys())].to_numpy(dtype=float)
+    nombres = np.array(list(cols_delitos.values()), dtype=object)
+    # Orden descendente estable: ante empates se respeta el orden de cols_delitos
+    orden = np.argsort(-conteos, axis=1, kind="stable")[:, :3]
+    valores = np.take_along_axis(conteos, orden, axis=1)
+
+    resultado = []
+    for idx_fila, val_fila in zip(orden, valores):
+        top = nombres[idx_fila[val_fila > 0]] # Eliminar ceros
+        if len(top) == 0:
+            resultado.append("Sin datos significativos")
+        else:
+            resultado.append(", ".join(f"{i}. {nombre}" for i, nombre in enumerate(top, start=1)))
+    return pd.Series(resultado, index=gdf_loc.index)
+
+
+def simplificar_uso_pot(nombre_area):
+    """Traduce el nombre técnico del área de actividad a su uso simplificado."""
+    return next((v for k, v in mapeo_pot.items() if k in str(nombre_area)), USO_SIN_CLASIFICAR)
+
+
+def simplificar_usos_pot(serie):
+    """
+    Versión categórica de simplificar_uso_pot: el mapeo se resuelve una vez
+    por categoría distinta (6 en el POT vigente) y no una vez por polígono.
+    """
+    categorias = serie.astype("category")
+    usos = np.array(
+        [simplificar_uso_pot(c) for c in categorias.cat.categories] + [USO_SIN_CLASIFICAR],
+        dtype=object
+    )
+    # Los nulos tienen código -1, que apunta al último elemento (sin clasificar)
+    return pd.Series(usos[categorias.cat.codes.to_numpy()], index=serie.index)
+
+
+# ETAPAS
+# Cada etapa recibe las rutas de sus entradas y las capas de las que depende,
+# y devuelve un GeoDataFrame en EPSG:4326.
+
+def etapa_colegios(rutas, capas):
+    """Directorio Único de Establecimientos -> dim_colegios."""
+    columnas = {
+        "NOMBRE_ESTABLECIMIENTO_EDUCATIVO": "nombre",
+        "SECTOR": "sector",
+        "CALENDARIO": "calendario",
+        "COORDENADA LONGITUD (X)": "longitud",
+        "COORDENADA LATITUD (Y)": "latitud"
+    }
+    bloques = []
+    for bloque in lectura_bruta.bloques_excel(rutas[0], list(columnas)):
+        bloque = bloque.rename(columns=columnas)
+        bloque["longitud"] = limpiar_coordenadas(bloque["longitud"])
+        bloque["latitud"] = limpiar_coordenadas(bloque["latitud"])
+        bloques.append(bloque.dropna(subset=["longitud", "latitud"]))
+    df_cols = pd.concat(bloques, ignore_index=True)
+
+    return gpd.GeoDataFrame(
+        df_cols[["nombre", "sector", "calendario"]],
+        geometry=gpd.points_from_xy(df_cols["longitud"], df_cols["latitud"]),
+        crs="EPSG:4326"
+    ).reset_index(drop=True)
+
+
+def etapa_areas(rutas, capas):
+    """Área de Actividad del POT -> dim_area."""
+    gdf_area = lectura_bruta.leer_vectorial(rutas[0], ["NOMBRE_ARE"])
+    gdf_area = gdf_area.rename(columns={"NOMBRE_ARE": "nombre_area"})
+    gdf_area['uso_pot_simplificado'] = simplificar_usos_pot(gdf_area['nombre_area'])
+    return gdf_area
+
+
+def etapa_localidades(rutas, capas):
+    """Delitos de Alto Impacto por localidad -> dim_localidad (con Top 3)."""
+    # Sin caja: es la capa que define a Bogotá (y trae una fila sin geometría, 'Sin Localización')
+    gdf_loc = lectura_bruta.leer_vectorial(rutas[0], ['CMNOMLOCAL', 'CMIULOCAL', *cols_delitos], bbox=None)
+    gdf_loc['top_3_delitos'] = top_3_delitos(gdf_loc)
+    gdf_loc = gdf_loc[['CMNOMLOCAL', 'CMIULOCAL', 'top_3_delitos', 'geometry']]
+    return gdf_loc.rename(columns={'CMNOMLOCAL': 'nombre_localidad', 'CMIULOCAL': 'num_localidad'})
+
+
+def etapa_transporte(rutas, capas):
+    """Estaciones de TransMilenio (CSV) -> dim_transporte."""
+    df_tm = pd.concat(lectura_bruta.bloques_csv(
+        rutas[0], ['Nombre Estación', 'Troncal Estación', 'coord_x', 'coord_y'],
+        sep=';', encoding='utf-8-sig', on_bad_lines='skip'
+    ), ignore_index=True)
+    gdf_tm = gpd.GeoDataFrame(
+        df_tm,
+        geometry=gpd.points_from_xy(df_tm['coord_x'], df_tm['coord_y']),
+        crs="EPSG:4326"
+    )
+    return gdf_tm[['Nombre Estación', 'Troncal Estación', 'geometry']].rename(columns={
+        'Nombre Estación': 'nombre_estacion',
+        'Troncal Estación': 'troncal_estacion'
+    })
+
+
+def etapa_manzanas(rutas, capas):
+    """Manzanas con estrato + cruce espacial con localidades -> tabla_hechos."""
+    gdf_manz = lectura_bruta.leer_vectorial(rutas[0], ['CODIGO_MAN', 'ESTRATO'])
+    gdf_manz = gdf_manz.rename(columns={
+        'CODIGO_MAN': 'codigo_manzana',
+        'ESTRATO': 'estrato'
+    })
+    gdf_manz['estrato'] = pd.to_numeric(gdf_manz['estrato'], errors='coerce').fillna(0).astype(int)
+
+    gdf_manz, _ = preparacion.reparar_geometrias(gdf_manz)
+
+    gdf_loc = capas["localidades"]
+    gdf_manz_loc = gpd.sjoin(
+        gdf_manz, gdf_loc[['num_localidad', 'geometry']].rename(columns={'num_localidad': 'id_localidad'}),
+        how='inner', predicate='intersects'
+    )
+    gdf_manz_loc = gdf_manz_loc[['codigo_manzana', 'estrato', 'id_localidad', 'geometry']]
+
+    # Uso POT de cada manzana (por área de traslape), para que la app no cruce en cada clic
+    gdf_manz_loc['uso_pot_simplificado'] = preparacion.asignar_uso_pot(gdf_manz_loc, capas["areas"])
+    return gdf_manz_loc
+
+
+def etapa_salud(rutas, capas):
+    """Red Adscrita de Salud (RASA) -> dim_salud."""
+    gdf_salud = lectura_bruta.leer_vectorial(rutas[0], ["RSOENTADSC"])
+    return gdf_salud.rename(columns={"RSOENTADSC": "nombre_hospital"})
+
+
+def etapa_verde(rutas, capas):
+    """Inventario de parques del POT -> dim_verde."""
+    gdf_parques = lectura_bruta.leer_vectorial(rutas[0], ["NOMBRE"])
+    return gdf_parques.rename(columns={"NOMBRE": "nombre_parque"})
+
+
+# Orden de ejecución: una etapa solo puede depender de etapas anteriores.
+# "version" se sube cuando cambia la lógica de la etapa, para forzar su recálculo.
+ETAPAS = {
+    "colegios":    {"entradas": ["directorio-unico-de-establecimientos-06.25.xlsx"], "depende": [],
+                    "salida": "dim_colegios",   "funcion": etapa_colegios,    "version": 1},
+    "areas":       {"entradas": ["areaactividad.zip"],                             "depende": [],
+                    "salida": "dim_area",       "funcion": etapa_areas,       "version": 2},
+    "localidades": {"entradas": ["dai_shp.zip"],                                   "depende": [],
+                    "salida": "dim_localidad",  "funcion": etapa_localidades, "version": 2},
+    "transporte":  {"entradas": ["estaciones-de-transmilenio.csv"],                "depende": [],
+                    "salida": "dim_transporte", "funcion": etapa_transporte,  "version": 1},
+    "manzanas":    {"entradas": ["manzanaestratificacion.zip"],                    "depende": ["localidades", "areas"],
+                    "salida": "tabla_hechos",   "funcion": etapa_manzanas,    "version": 2},
+    "salud":       {"entradas": ["rasa.zip"],                                      "depende": [],
+                    "salida": "dim_salud",      "funcion": etapa_salud,       "version": 1},
+    "verde":       {"entradas": ["parque.zip"],                                    "depende": [],
+                    "salida": "dim_verde",      "funcion": etapa_verde,       "version": 2},
+}
+
+
+# MOTOR DE EJECUCIÓN
+
+def _hash_archivo(ruta):
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def _leer_estado(dir_limpios):
+    ruta = os.path.join(dir_limpios, ARCHIVO_ESTADO)
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _guardar_estado(dir_limpios, estado):
+    ruta = os.path.join(dir_limpios, ARCHIVO_ESTADO)
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(estado, f, indent=2, ensure_ascii=False)
+
+
+def _rutas_salida(dir_limpios, salida):
+    return os.path.join(dir_limpios, f"{salida}.geojson"), os.path.join(dir_limpios, f"{salida}.parquet")
+
+
+def _huella_etapa(nombre, etapa, dir_brutos, huellas):
+    """Huella = versión de la etapa + contenido de sus entradas + huellas de sus dependencias."""
+    h = hashlib.sha256(f"{nombre}:v{etapa['version']}".encode())
+    for entrada in etapa["entradas"]:
+        h.update(_hash_archivo(os.path.join(dir_brutos, entrada)).encode())
+    for dep in etapa["depende"]:
+        h.update(huellas.get(dep, "sin-dependencia").encode())
+    return h.hexdigest()
+
+
+def ejecutar_pipeline(etapas=None, forzar=False, dir_brutos=DIR_BRUTOS, dir_limpios=DIR_LIMPIOS):
+    """
+    Ejecuta las etapas pedidas (todas por defecto) y devuelve el reporte de tiempos:
+    una lista de dicts con etapa, estado, segundos, filas y tamaños de salida.
+    """
+    os.makedirs(dir_limpios, exist_ok=True)
+    estado = _leer_estado(dir_limpios)
+    seleccion = set(etapas or ETAPAS)
+    capas = {}
+    huellas = {}
+    reporte = []
+
+    for nombre, etapa in ETAPAS.items():
+        ruta_geojson, ruta_parquet = _rutas_salida(dir_limpios, etapa["salida"])
+        fila = {"etapa": nombre, "salida": etapa["salida"], "estado": "", "segundos": 0.0,
+                "filas": None, "invalidas": None, "kb_geojson": None, "kb_parquet": None}
+        t0 = time.perf_counter()
+
+        faltantes = [e for e in etapa["entradas"] if not os.path.exists(os.path.join(dir_brutos, e))]
+        if faltantes:
+            fila["estado"] = f"sin fuente ({', '.join(faltantes)})"
+            huellas[nombre] = estado.get(nombre, {}).get("huella", "")
+            reporte.append(fila)
+            continue
+
+        huella = _huella_etapa(nombre, etapa, dir_brutos, huellas)
+        huellas[nombre] = huella
+        salidas_ok = os.path.exists(ruta_geojson) and os.path.exists(ruta_parquet)
+
+        if nombre not in seleccion:
+            fila["estado"] = "no seleccionada"
+        elif not forzar and salidas_ok and estado.get(nombre, {}).get("huella") == huella:
+            fila["estado"] = "sin cambios"
+        else:
+            try:
+                # Dependencias: se leen del GeoParquet ya compilado
+                for dep in etapa["depende"]:
+                    if dep not in capas:
+                        capas[dep] = gpd.read_parquet(_rutas_salida(dir_limpios, ETAPAS[dep]["salida"])[1])
+
+                rutas = [os.path.join(dir_brutos, e) for e in etapa["entradas"]]
+                gdf = etapa["funcion"](rutas, capas)
+                # Las capas se publican ya válidas: la app no repara nada en caliente
+                gdf, validez = preparacion.reparar_geometrias(gdf)
+                capas[nombre] = gdf
+                fila["invalidas"] = validez["invalidas"]
+
+                gdf.to_parquet(ruta_parquet)
+                gdf.to_file(ruta_geojson, driver="GeoJSON")
+
+                estado[nombre] = {"huella": huella, "filas": len(gdf)}
+                _guardar_estado(dir_limpios, estado)
+                fila["estado"] = "compilada"
+                fila["filas"] = len(gdf)
+            except Exception as e:
+                fila["estado"] = f"error: {e}"
+
+        if os.path.exists(ruta_geojson):
+            fila["kb_geojson"] = round(os.path.getsize(ruta_geojson) / 1024, 1)
+        if os.path.exists(ruta_parquet):
+            fila["kb_parquet"] = round(os.path.getsize(ruta_parquet) / 1024, 1)
+        if fila["filas"] is None:
+            fila["filas"] = estado.get(nombre, {}).get("filas")
+        fila["segundos"] = round(time.perf_counter() - t0, 3)
+        reporte.append(fila)
+
+    return reporte
+
+
+def imprimir_reporte(reporte):
+    """Tabla de tiempos por etapa en la consola."""
+    print(f"{'ETAPA':<12} {'SEG':>8} {'FILAS':>7} {'INVAL.':>7} {'KB GEOJSON':>11} {'KB PARQUET':>11}  ESTADO")
+    for fila in reporte:
+        invalidas = '-' if fila.get('invalidas') is None else fila['invalidas']
+        print(f"{fila['etapa']:<12} {fila['segundos']:>8.3f} {str(fila['filas'] or '-'):>7} {invalidas:>7} "
+              f"{str(fila['kb_geojson'] or '-'):>11} {str(fila['kb_parquet'] or '-'):>11}  {fila['estado']}")
+    print(f"{'TOTAL':<12} {sum(f['segundos'] for f in reporte):>8.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compila DATOS_BRUTOS en DATOS_LIMPIOS.")
+    parser.add_argument("--etapas", help=f"Lista separada por comas. Opciones: {', '.join(ETAPAS)}")
+    parser.add_argument("--forzar", action="store_true", help="Recalcula aunque las entradas no hayan cambiado")
+    parser.add_argument("--brutos", default=DIR_BRUTOS, help="Carpeta de datos brutos")
+    parser.add_argument("--salida", default=DIR_LIMPIOS, help="Carpeta de datos limpios")
+    parser.add_argument("--reporte", help="Guarda el reporte de tiempos en este archivo JSON")
+    args = parser.parse_args(argv)
+
+    etapas = [e.strip() for e in args.etapas.split(",")] if args.etapas else None
+    desconocidas = set(etapas or []) - set(ETAPAS)
+    if desconocidas:
+        parser.error(f"Etapas desconocidas: {', '.join(sorted(desconocidas))}")
+
+    reporte = ejecutar_pipeline(etapas, args.forzar, args.brutos, args.salida)
+    imprimir_reporte(reporte)
+
+    if args.reporte:
+        with open(args.reporte, "w", encoding="utf-8") as f:
+            json.dump(reporte, f, indent=2, ensure_ascii=False)
+
+    return 1 if any(f["estado"].startswith("error") for f in reporte) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
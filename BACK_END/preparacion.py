@@ -0,0 +1,91 @@
+# Preparación geométrica de las capas (una vez por versión de datos)
+"""
+Reparaciones y cruces que antes se hacían en cada clic del paso 5:
+
+* reparar_geometrias: make_valid sobre las geometrías inválidas, con un
+  reporte de validez por capa.
+* asignar_uso_pot: uso POT de cada manzana, elegido por área de traslape
+  (el uso que más superficie cubre), en vez de "el primero que toque".
+
+Lo usan tanto el cargador de la app (carga_datos.py) como el compilador de
+datos (pipeline_datos.py).
+"""
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+CRS_METRICO = "EPSG:3116"
+SIN_CLASIFICACION = "Sin Clasificación"
+
+
+def reparar_geometrias(gdf):
+    """
+    Repara con make_valid las geometrías inválidas (conservando solo la parte
+    poligonal/lineal, sin colapsos). Devuelve (gdf, reporte) donde reporte es
+    un dict con total, nulas, invalidas y reparadas.
+    """
+    geoms = gdf.geometry.values
+    nulas = shapely.is_missing(geoms) | shapely.is_empty(geoms)
+    invalidas = ~nulas & ~shapely.is_valid(geoms)
+
+    reporte = {
+        "total": len(gdf),
+        "nulas": int(nulas.sum()),
+        "invalidas": int(invalidas.sum()),
+        "reparadas": 0,
+    }
+    if not invalidas.any():
+        return gdf, reporte
+
+    reparadas = shapely.make_valid(np.asarray(geoms)[invalidas], method="structure", keep_collapsed=False)
+    nuevas = np.asarray(geoms).copy()
+    nuevas[invalidas] = reparadas
+
+    gdf = gdf.copy()
+    gdf[gdf.geometry.name] = gpd.GeoSeries(nuevas, index=gdf.index, crs=gdf.crs)
+    reporte["reparadas"] = int(shapely.is_valid(reparadas).sum())
+    return gdf, reporte
+
+
+def asignar_uso_pot(manzanas, areas, columna="uso_pot_simplificado"):
+    """
+    Devuelve una Serie (alineada con `manzanas`) con el uso POT de cada manzana.
+
+    Si una manzana toca áreas de un solo uso, ese es su uso. Si toca áreas de
+    varios usos, gana el que más área de la manzana cubre (medida en metros).
+    Las manzanas que no tocan ninguna área quedan como 'Sin Clasificación'.
+    """
+    resultado = np.full(len(manzanas), SIN_CLASIFICACION, dtype=object)
+    if manzanas.empty or areas.empty:
+        return pd.Series(resultado, index=manzanas.index, name=columna)
+
+    geoms_manz = manzanas.geometry.to_crs(CRS_METRICO).values
+    geoms_area = areas.geometry.to_crs(CRS_METRICO).values
+    usos_area = areas[columna].to_numpy()
+
+    # Pares (área, manzana) que se tocan. Se consulta el árbol de manzanas con
+    # cada área para que sea el polígono grande el que quede "preparado".
+    arbol = shapely.STRtree(geoms_manz)
+    idx_area, idx_manz = arbol.query(geoms_area, predicate="intersects")
+    if len(idx_manz) == 0:
+        return pd.Series(resultado, index=manzanas.index, name=columna)
+
+    pares = pd.DataFrame({"manzana": idx_manz, "area": idx_area, "uso": usos_area[idx_area]})
+
+    # Caso simple (la gran mayoría): todas las áreas que toca tienen el mismo uso
+    n_usos = pares.groupby("manzana")["uso"].transform("nunique")
+    simples = pares[n_usos == 1].drop_duplicates("manzana")
+    resultado[simples["manzana"].to_numpy()] = simples["uso"].to_numpy()
+
+    # Caso mixto: se pondera por el área real de traslape
+    mixtos = pares[n_usos > 1].copy()
+    if not mixtos.empty:
+        mixtos["traslape"] = shapely.area(shapely.intersection(
+            geoms_manz[mixtos["manzana"].to_numpy()], geoms_area[mixtos["area"].to_numpy()]
+        ))
+        por_uso = mixtos.groupby(["manzana", "uso"], sort=False)["traslape"].sum().reset_index()
+        ganador = por_uso.loc[por_uso.groupby("manzana")["traslape"].idxmax()]
+        resultado[ganador["manzana"].to_numpy()] = ganador["uso"].to_numpy()
+
+    return pd.Series(resultado, index=manzanas.index, name=columna)
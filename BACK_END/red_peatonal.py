@@ -0,0 +1,282 @@
+# Isócronas a pie sobre la red de calles
+"""
+Zonas alcanzables caminando desde el punto del usuario, medidas sobre la red
+de calles y no en línea recta.
+
+La red se arma fuera de línea desde un archivo local de calles (p. ej. el
+extracto de OpenStreetMap de Geofabrik, gis_osm_roads_free_1.shp, o cualquier
+GeoJSON/GeoPackage de líneas) y se guarda como un grafo CSR en arreglos
+NumPy (.npz): coordenadas de los nodos en EPSG:3116, indptr, indices y largo
+de cada tramo en metros.
+
+En la app, el pin se engancha al nodo más cercano y un Dijkstra acotado
+recorre la red hasta agotar la distancia (radio = minutos x 80 m/min) menos
+lo que se camina del pin a ese nodo. La isócrona es la envolvente cóncava de
+lo alcanzado (incluidos los tramos recorridos a medias). Se guarda por nodo
+de origen y distancia restante redondeada a 10 m, así que los clics vecinos
+que caen en el mismo nodo la reutilizan. Sin red, o con el pin
+lejos de cualquier calle, la app vuelve al círculo.
+
+Uso:
+    python BACK_END/red_peatonal.py calles.shp
+    python BACK_END/red_peatonal.py calles.gpkg -o DATOS_LIMPIOS/red_peatonal.npz
+"""
+import argparse
+import hashlib
+import heapq
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+import capa_puntos
+import carga_datos
+from capa_puntos import CRS_METRICO
+
+RUTA_RED = os.environ.get(
+    "BOGOTA_RED_PEATONAL", os.path.join(carga_datos.DIR_DATOS_LIMPIOS, "red_peatonal.npz")
+)
+
+# Velocidad de caminata de la app (m/min): 400 m = 5 min, 1200 m = 15 min, 1600 m = 20 min
+VELOCIDAD_CAMINATA = 80
+
+# Más lejos que esto de una calle, el pin no se engancha y se usa el círculo (metros)
+DISTANCIA_MAX_ENGANCHE = float(os.environ.get("BOGOTA_ENGANCHE_RED", 250))
+# Media calzada que se agrega alrededor de lo alcanzado (metros)
+MEDIO_ANCHO_CALLE = 15.0
+# Envolvente cóncava: 0 = más ceñida a las calles, 1 = envolvente convexa
+RATIO_ENVOLVENTE = 0.15
+MAX_ISOCRONAS = int(os.environ.get("BOGOTA_MAX_ISOCRONAS", 512))
+
+# Clases de vía (fclass de Geofabrik o highway de OSM) por las que no se camina
+CLASES_NO_PEATONALES = {"motorway", "motorway_link", "trunk", "trunk_link"}
+
+# Celdas (metros) del índice de enganche
+CELDA_ENGANCHE = 200.0
+
+
+def construir_red(calles, nodar=False):
+    """
+    Grafo CSR no dirigido a partir de un GeoDataFrame de líneas.
+    Cada vértice es un nodo (los vértices compartidos se funden, redondeados a
+    10 cm), así que las calles que se cruzan en un vértice quedan conectadas,
+    como en OSM. Con `nodar`, los cruces sin vértice común también se cortan
+    (shapely.node; lento, para fuentes que no son OSM).
+    Devuelve un dict de arreglos listo para guardar_red().
+    """
+    for columna in ("fclass", "highway"):
+        if columna in calles.columns:
+            calles = calles[~calles[columna].isin(CLASES_NO_PEATONALES)]
+    if calles.crs is None:
+        calles = calles.set_crs(epsg=4326)
+    lineas = calles.geometry.to_crs(CRS_METRICO).explode(index_parts=False).values
+    lineas = lineas[shapely.get_type_id(lineas) == shapely.GeometryType.LINESTRING]
+    if nodar:
+        lineas = shapely.get_parts(shapely.node(shapely.multilinestrings(lineas)))
+
+    coords, linea = shapely.get_coordinates(lineas, return_index=True)
+    claves = np.round(coords * 10).astype(np.int64)
+    claves_unicas, nodo = np.unique(claves, axis=0, return_inverse=True)
+    nodo = nodo.ravel()
+
+    # Tramos entre vértices consecutivos de una misma línea
+    misma_linea = linea[1:] == linea[:-1]
+    origen, destino = nodo[:-1][misma_linea], nodo[1:][misma_linea]
+    largo = np.hypot(*(coords[1:][misma_linea] - coords[:-1][misma_linea]).T)
+    validos = origen != destino
+    origen, destino, largo = origen[validos], destino[validos], largo[validos]
+
+    # No dirigido: cada tramo en los dos sentidos, ordenado por nodo de origen
+    fuente = np.concatenate([origen, destino])
+    vecino = np.concatenate([destino, origen])
+    pesos = np.concatenate([largo, largo])
+    orden = np.lexsort((vecino, fuente))
+    fuente, vecino, pesos = fuente[orden], vecino[orden], pesos[orden]
+
+    n = len(claves_unicas)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(fuente, minlength=n), out=indptr[1:])
+    return {
+        "x": claves_unicas[:, 0] / 10.0,
+        "y": claves_unicas[:, 1] / 10.0,
+        "indptr": indptr.astype(np.int32),
+        "indices": vecino.astype(np.int32),
+        "pesos": pesos.astype(np.float32),
+    }
+
+
+def guardar_red(red, ruta=RUTA_RED, huella=""):
+    """npz comprimido; `huella` identifica el archivo de calles de origen (escritura atómica)."""
+    tmp = f"{ruta}.tmp.npz"
+    np.savez_compressed(tmp, huella=np.array(huella), **red)
+    os.replace(tmp, ruta)
+
+
+class RedPeatonal:
+    """Grafo CSR de calles con enganche al nodo más cercano e isócronas memoizadas."""
+
+    def __init__(self, x, y, indptr, indices, pesos, huella=""):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.indptr = np.asarray(indptr)
+        self.indices = np.asarray(indices)
+        self.pesos = np.asarray(pesos, dtype=np.float64)
+        self.version = hashlib.sha256(f"{huella}|{len(self.x)}|{len(self.indices)}".encode()).hexdigest()[:12]
+
+        # Índice de enganche: nodos ordenados por celda
+        self._cx0 = np.floor(self.x.min()) if len(self.x) else 0.0
+        self._cy0 = np.floor(self.y.min()) if len(self.y) else 0.0
+        celdas = self._celda(self.x, self.y)
+        self._orden = np.argsort(celdas, kind="stable")
+        self._celdas = celdas[self._orden]
+
+        self._isocronas = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def cargar(cls, ruta=RUTA_RED):
+        """La red guardada en `ruta`, o None si no existe."""
+        if not os.path.exists(ruta):
+            return None
+        with np.load(ruta) as datos:
+            return cls(datos["x"], datos["y"], datos["indptr"], datos["indices"], datos["pesos"],
+                       str(datos["huella"]) if "huella" in datos else "")
+
+    def __len__(self):
+        return len(self.x)
+
+    def _celda(self, x, y):
+        i = np.floor((np.asarray(x) - self._cx0) / CELDA_ENGANCHE).astype(np.int64)
+        j = np.floor((np.asarray(y) - self._cy0) / CELDA_ENGANCHE).astype(np.int64)
+        return i * 1_000_003 + j
+
+    def enganchar(self, x, y, max_distancia=DISTANCIA_MAX_ENGANCHE):
+        """(nodo, distancia) del nodo más cercano a (x, y) en metros, o (None, inf) si está muy lejos."""
+        anillos = int(np.ceil(max_distancia / CELDA_ENGANCHE))
+        centro = self._celda(x, y)
+        candidatos = []
+        for di in range(-anillos, anillos + 1):
+            for dj in range(-anillos, anillos + 1):
+                clave = centro + di * 1_000_003 + dj
+                a, b = np.searchsorted(self._celdas, [clave, clave + 1])
+                if b > a:
+                    candidatos.append(self._orden[a:b])
+        if not candidatos:
+            return None, np.inf
+        candidatos = np.concatenate(candidatos)
+        d = np.hypot(self.x[candidatos] - x, self.y[candidatos] - y)
+        k = int(np.argmin(d))
+        if d[k] > max_distancia:
+            return None, np.inf
+        return int(candidatos[k]), float(d[k])
+
+    def distancias_desde(self, nodo, presupuesto):
+        """Dijkstra acotado: dict nodo -> distancia en metros, solo hasta `presupuesto`."""
+        distancias = {nodo: 0.0}
+        cola = [(0.0, nodo)]
+        indptr, indices, pesos = self.indptr, self.indices, self.pesos
+        while cola:
+            d, u = heapq.heappop(cola)
+            if d > distancias[u]:
+                continue
+            a, b = indptr[u], indptr[u + 1]
+            for v, w in zip(indices[a:b].tolist(), pesos[a:b].tolist()):
+                nd = d + w
+                if nd <= presupuesto and nd < distancias.get(v, np.inf):
+                    distancias[v] = nd
+                    heapq.heappush(cola, (nd, v))
+        return distancias
+
+    def _poligono_alcanzado(self, distancias, presupuesto):
+        nodos = np.fromiter(distancias.keys(), dtype=np.int64, count=len(distancias))
+        d = np.fromiter(distancias.values(), dtype=np.float64, count=len(distancias))
+        puntos = [np.column_stack([self.x[nodos], self.y[nodos]])]
+
+        # Tramos que salen de lo alcanzado y se recorren solo en parte
+        largo = self.indptr[nodos + 1] - self.indptr[nodos]
+        posiciones = np.repeat(self.indptr[nodos], largo) + (
+            np.arange(largo.sum()) - np.repeat(np.cumsum(largo) - largo, largo)
+        )
+        d_origen = np.repeat(d, largo)
+        resto = presupuesto - d_origen
+        parciales = self.pesos[posiciones] > resto
+        if parciales.any():
+            u = np.repeat(nodos, largo)[parciales]
+            v = self.indices[posiciones][parciales]
+            t = (resto[parciales] / self.pesos[posiciones][parciales])[:, None]
+            inicio = np.column_stack([self.x[u], self.y[u]])
+            fin = np.column_stack([self.x[v], self.y[v]])
+            puntos.append(inicio + (fin - inicio) * t)
+
+        puntos = np.concatenate(puntos)
+        if len(puntos) < 3:
+            return None
+        envolvente = shapely.concave_hull(shapely.multipoints(puntos), ratio=RATIO_ENVOLVENTE)
+        poligono = envolvente.buffer(MEDIO_ANCHO_CALLE)
+        if poligono.geom_type == "MultiPolygon":
+            poligono = max(poligono.geoms, key=lambda g: g.area)
+        return poligono if poligono.geom_type == "Polygon" and not poligono.is_empty else None
+
+    def isocrona_metrica(self, x, y, distancia):
+        """
+        Polígono (EPSG:3116) alcanzable caminando `distancia` metros por la
+        red desde (x, y), o None si el punto no se engancha a ninguna calle.
+        El tramo del punto a la calle (el enganche) se descuenta de `distancia`.
+        """
+        nodo, enganche = self.enganchar(x, y)
+        if nodo is None:
+            return None
+        # Lo que queda al llegar al nodo, redondeado a 10 m para que los clics
+        # vecinos que caen en el mismo nodo compartan isócrona
+        presupuesto = int(round(distancia - enganche, -1))
+        if presupuesto <= 0:
+            return None
+        clave = (nodo, presupuesto)
+        with self._lock:
+            if clave in self._isocronas:
+                self._isocronas.move_to_end(clave)
+                return self._isocronas[clave]
+
+        poligono = self._poligono_alcanzado(self.distancias_desde(nodo, presupuesto), presupuesto)
+
+        with self._lock:
+            self._isocronas[clave] = poligono
+            while len(self._isocronas) > MAX_ISOCRONAS:
+                self._isocronas.popitem(last=False)
+        return poligono
+
+    def isocrona(self, lon, lat, minutos):
+        """Isócrona de `minutos` a pie en EPSG:4326, o None (ver isocrona_metrica)."""
+        x, y = capa_puntos.a_metrico(lon, lat)
+        poligono = self.isocrona_metrica(x, y, minutos * VELOCIDAD_CAMINATA)
+        return None if poligono is None else a_gps(poligono)
+
+
+def a_gps(geom):
+    """Geometría en EPSG:3116 -> EPSG:4326."""
+    return shapely.transform(geom, lambda c: np.column_stack(capa_puntos.a_gps(c[:, 0], c[:, 1])))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Arma la red peatonal (grafo CSR) desde un archivo de calles.")
+    parser.add_argument("calles", help="Archivo de líneas legible por geopandas (shp, gpkg, geojson)")
+    parser.add_argument("-o", "--salida", default=RUTA_RED, help="Archivo .npz de salida")
+    parser.add_argument("--nodar", action="store_true", help="Cortar las líneas en todos sus cruces (fuentes que no son OSM)")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    calles = gpd.read_file(args.calles)
+    red = construir_red(calles, args.nodar)
+    guardar_red(red, args.salida, huella=carga_datos.huella_archivo(args.calles))
+    print(f"{len(red['x'])} nodos, {len(red['indices']) // 2} tramos -> {args.salida} "
+          f"({os.path.getsize(args.salida) / 2**20:.1f} MB, {time.perf_counter() - t0:.1f} s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+# Registro compartido de las capas cargadas
+"""
+Las siete capas de Bogotá, cargadas una sola vez por proceso y compartidas
+(por referencia, sin copias) entre todas las sesiones de Streamlit.
+
+Antes cada sesión guardaba su propia copia de los GeoDataFrames en
+st.session_state (y st.cache_data los serializaba y deserializaba en cada
+carga), así que la memoria crecía con el número de usuarios. Ahora la app
+envuelve RegistroDatos en st.cache_resource y las sesiones solo guardan sus
+selecciones (paso, localidad, punto, radio).
+
+Las capas de puntos (transporte, colegios, salud) se guardan compactas, en
+arreglos de coordenadas y categorías (ver capa_puntos.py).
+
+Las capas son de solo lectura: quien necesite modificarlas trabaja sobre un
+subconjunto o una copia (con copy-on-write de pandas, los filtros y
+.copy() no duplican los datos hasta que se escriben).
+
+Cada RegistroDatos es una versión fija de los datos. AlmacenDatos guarda la
+vigente y la refresca en caliente: un hilo vigila el manifiesto de las
+fuentes (huellas de contenido, ver carga_datos.manifiesto) y, si cambia un
+archivo, arma una versión nueva que recarga solo esa capa (y sus
+dependientes) y reutiliza las demás, junto con sus índices. Las sesiones que
+estaban a mitad de un rerun terminan con la versión anterior; las cachés que
+dependen de la versión (diagnósticos, rejilla, teselas) dejan de coincidir
+solas con la nueva.
+"""
+import datetime
+import hashlib
+import os
+import threading
+from types import MappingProxyType
+
+import numpy as np
+import shapely
+
+import capa_puntos
+import carga_datos
+import instrumentacion
+import motor_espacial
+
+# Bytes aproximados por geometría además de sus coordenadas (objeto Python + cabecera GEOS)
+SOBRECARGA_GEOMETRIA = 120
+
+# Cada cuántos segundos se revisan las fuentes (0 = sin refresco en caliente)
+INTERVALO_REFRESCO = float(os.environ.get("BOGOTA_INTERVALO_REFRESCO", 30))
+
+
+def _bytes_geometria(geoms):
+    """Estimación de la memoria de un arreglo de geometrías shapely."""
+    geoms = np.asarray(geoms)
+    if len(geoms) == 0:
+        return 0
+    coordenadas = int(shapely.get_num_coordinates(geoms).sum())
+    dimensiones = 3 if shapely.has_z(geoms).any() else 2
+    return coordenadas * 8 * dimensiones + len(geoms) * SOBRECARGA_GEOMETRIA
+
+
+class RegistroDatos:
+    """
+    Capas de solo lectura + errores de carga + versión de los datos.
+    `capas` es un mapeo inmutable nombre -> GeoDataFrame (o CapaPuntos).
+    `manifiesto` da, por capa, el archivo de origen, su huella y (si lo armó
+    AlmacenDatos) su número de versión y fecha de actualización.
+    Con `base` (la versión anterior) el índice espacial reutiliza lo que no cambió.
+    """
+
+    def __init__(self, dataframes, errores=(), manifiesto=None, base=None):
+        self.capas = MappingProxyType(capa_puntos.compactar(dataframes))
+        self.errores = list(errores)
+        huellas = "|".join(f"{n}:{self.capas[n].attrs.get('huella', '')}" for n in sorted(self.capas))
+        self.version = hashlib.sha256(huellas.encode()).hexdigest()[:12]
+        self.manifiesto = manifiesto if manifiesto is not None else {
+            n: {"archivo": carga_datos.ARCHIVOS.get(n), "huella": capa.attrs.get("huella")}
+            for n, capa in self.capas.items()
+        }
+        self._memoria = None
+        self._indice = None
+        self._indice_base = base._indice if base is not None else None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def cargar(cls, **kwargs):
+        """Carga las capas con carga_datos.cargar_todo (mismos argumentos)."""
+        dataframes, errores = carga_datos.cargar_todo(**kwargs)
+        return cls(dataframes, errores)
+
+    @property
+    def completo(self):
+        return not self.errores and all(n in self.capas for n in carga_datos.ARCHIVOS)
+
+    def __getitem__(self, nombre):
+        return self.capas[nombre]
+
+    def indice(self):
+        """IndiceEspacial de esta versión (ver motor_espacial.py), construido la primera vez."""
+        with self._lock:
+            if self._indice is None:
+                with instrumentacion.tramo("datos.indice"):
+                    self._indice = motor_espacial.IndiceEspacial(self.capas, base=self._indice_base)
+                self._indice_base = None
+            return self._indice
+
+    def memoria(self):
+        """
+        Tabla (lista de dicts) con la memoria de cada capa en MB: atributos
+        (memory_usage profundo) y geometrías (estimada por coordenadas).
+        Se calcula una vez; las capas no cambian.
+        """
+        if self._memoria is None:
+            filas = []
+            for nombre, gdf in self.capas.items():
+                if isinstance(gdf, capa_puntos.CapaPuntos):
+                    atributos, geometria = gdf.memoria()
+                else:
+                    columna_geom = gdf.geometry.name
+                    atributos = int(gdf.drop(columns=[columna_geom]).memory_usage(deep=True, index=True).sum())
+                    geometria = _bytes_geometria(gdf.geometry.values)
+                filas.append({
+                    "capa": nombre,
+                    "registros": len(gdf),
+                    "atributos_mb": round(atributos / 2**20, 3),
+                    "geometria_mb": round(geometria / 2**20, 3),
+                    "total_mb": round((atributos + geometria) / 2**20, 3),
+                })
+            self._memoria = filas
+        return self._memoria
+
+    def memoria_total_mb(self):
+        return round(sum(f["total_mb"] for f in self.memoria()), 2)
+
+
+def _ahora():
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+def versionar(capas, previo):
+    """
+    Manifiesto de `capas` numerado a partir del manifiesto `previo`: cada capa
+    conserva su versión si la huella no cambió y sube en uno si cambió.
+    """
+    entradas = {}
+    for nombre, capa in capas.items():
+        huella = capa.attrs.get("huella")
+        anterior = previo.get(nombre, {})
+        if anterior.get("huella") == huella:
+            entradas[nombre] = dict(anterior)
+            continue
+        entradas[nombre] = {
+            "archivo": carga_datos.ARCHIVOS.get(nombre),
+            "huella": huella,
+            "version": anterior.get("version", 0) + 1,
+            "actualizada": _ahora(),
+        }
+    return entradas
+
+
+class AlmacenDatos:
+    """
+    Versión vigente de los datos (`actual`, un RegistroDatos) con refresco en
+    caliente capa por capa. Los argumentos se pasan a carga_datos.cargar_todo.
+    `historial` guarda (fecha, versión, capas cambiadas) de cada refresco.
+    """
+
+    def __init__(self, ruta_manifiesto=carga_datos.RUTA_MANIFIESTO, **opciones_carga):
+        self._opciones = opciones_carga
+        self._ruta_manifiesto = ruta_manifiesto
+        self._lock = threading.Lock()
+        self._oyentes = []
+        self._detener = threading.Event()
+        self._hilo = None
+        self.errores_refresco = []
+
+        with instrumentacion.tramo("datos.carga"):
+            dataframes, errores = carga_datos.cargar_todo(**opciones_carga)
+        self.actual = RegistroDatos(dataframes, errores, self._versionar(dataframes))
+        self.historial = [(_ahora(), self.actual.version, sorted(self.actual.capas))]
+
+    def _versionar(self, capas):
+        entradas = versionar(capas, carga_datos.leer_manifiesto(self._ruta_manifiesto))
+        try:
+            carga_datos.guardar_manifiesto(entradas, self._ruta_manifiesto)
+        except OSError:
+            pass  # Sin disco escribible las versiones solo viven en memoria
+        return entradas
+
+    def al_cambiar(self, funcion):
+        """Registra funcion(registro_nuevo, capas_cambiadas), que se llama tras cada refresco."""
+        self._oyentes.append(funcion)
+
+    def capas_cambiadas(self):
+        """Capas cuya fuente tiene otra huella que la cargada (o que faltan y ya tienen fuente)."""
+        capas = self.actual.capas
+        fuentes = carga_datos.manifiesto(self._opciones.get("base_url"))
+        return sorted(
+            nombre for nombre, fuente in fuentes.items()
+            if nombre not in capas or capas[nombre].attrs.get("huella") != fuente["huella"]
+        )
+
+    def refrescar(self):
+        """
+        Recarga solo las capas que cambiaron y publica la nueva versión.
+        Devuelve las capas refrescadas ([] si no hubo cambios o si la carga
+        falló; en ese caso sigue la versión anterior y el error queda en
+        errores_refresco).
+        """
+        with self._lock:
+            cambiadas = self.capas_cambiadas()
+            if not cambiadas:
+                return []
+            anterior = self.actual
+            with instrumentacion.tramo("datos.refresco"):
+                dataframes, errores = carga_datos.cargar_todo(
+                    nombres=cambiadas, previas=dict(anterior.capas), **self._opciones
+                )
+            self.errores_refresco = errores
+            if errores:
+                return []
+            recargadas = sorted(n for n in dataframes if dataframes[n] is not anterior.capas.get(n))
+            self.actual = RegistroDatos(dataframes, (), self._versionar(dataframes), base=anterior)
+            self.historial.append((_ahora(), self.actual.version, recargadas))
+            nuevo = self.actual
+
+        for funcion in self._oyentes:
+            funcion(nuevo, recargadas)
+        return recargadas
+
+    def vigilar(self, intervalo=INTERVALO_REFRESCO):
+        """Arranca (una sola vez) el hilo que llama refrescar() cada `intervalo` segundos."""
+        if intervalo <= 0 or self._hilo is not None:
+            return
+
+        def bucle():
+            while not self._detener.wait(intervalo):
+                try:
+                    self.refrescar()
+                except Exception as e:
+                    self.errores_refresco = [f"Error refrescando los datos: {e}"]
+
+        self._hilo = threading.Thread(target=bucle, name="vigilante-datos", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
@@ -0,0 +1,232 @@
+# Rejilla precalculada de viabilidad
+"""
+Los KPIs del paso 5 precalculados sobre una rejilla métrica regular
+(EPSG:3116) que cubre Bogotá, para los siete radios del paso 3.
+
+Un trabajo fuera de línea recorre todos los centros de celda con el motor por
+lotes (diagnostico_lote.py) y guarda el resultado en un Parquet compacto (una
+fila por celda y radio, enteros pequeños y el uso POT como categoría). La app
+lo carga en arreglos densos y responde con la celda más cercana al clic en
+microsegundos; el cálculo exacto queda para cuando el usuario lo pide.
+
+Uso:
+    python BACK_END/rejilla_viabilidad.py                   # celda de 250 m
+    python BACK_END/rejilla_viabilidad.py --celda 150 --procesos 8
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import shapely
+
+import capa_puntos
+import carga_datos
+import diagnostico
+import diagnostico_lote
+import motor_espacial
+from preparacion import SIN_CLASIFICACION
+
+RADIOS = (300, 600, 900, 1200, 1500, 1800, 2100)
+CELDA_METROS = int(os.environ.get("BOGOTA_CELDA_REJILLA", 250))
+RUTA_REJILLA = os.environ.get(
+    "BOGOTA_REJILLA", os.path.join(carga_datos.DIR_DATOS_LIMPIOS, "rejilla_viabilidad.parquet")
+)
+
+# Criterio del score -> columna con la distancia (metros, redondeada hacia arriba) que completa su umbral
+DISTANCIAS = {criterio: f"dist_{criterio[4:]}" for criterio in diagnostico.UMBRALES_SCORE}
+SIN_DISTANCIA = np.iinfo(np.int32).max
+
+CAMPOS = ["num_tm", "num_col", "num_salud", "num_parques", "uso_moda", "estrato_moda", "score",
+          *DISTANCIAS.values()]
+
+
+def centros_de_celda(localidades, celda=CELDA_METROS):
+    """
+    Centros (en EPSG:3116) de las celdas cuyo centro cae dentro de alguna
+    localidad. Devuelve (origen_x, origen_y, i, j, x, y) con i = columna y
+    j = fila de la rejilla.
+    """
+    limite = shapely.union_all(localidades.to_crs(epsg=3116).geometry.dropna().values)
+    minx, miny, maxx, maxy = limite.bounds
+    origen_x = np.floor(minx / celda) * celda
+    origen_y = np.floor(miny / celda) * celda
+    nx = int(np.ceil((maxx - origen_x) / celda)) + 1
+    ny = int(np.ceil((maxy - origen_y) / celda)) + 1
+
+    jj, ii = np.meshgrid(np.arange(ny), np.arange(nx), indexing="ij")
+    x = origen_x + ii.ravel() * celda
+    y = origen_y + jj.ravel() * celda
+    shapely.prepare(limite)
+    dentro = shapely.contains_xy(limite, x, y)
+    return origen_x, origen_y, ii.ravel()[dentro], jj.ravel()[dentro], x[dentro], y[dentro]
+
+
+def construir_rejilla(indice, celda=CELDA_METROS, radios=RADIOS, procesos=None):
+    """DataFrame compacto (una fila por celda y radio) y sus metadatos."""
+    origen_x, origen_y, i, j, x, y = centros_de_celda(indice.capas["localidades"], celda)
+    lons, lats = capa_puntos.a_gps(x, y)
+    # Las distancias a los equipamientos no dependen del radio: se calculan una vez
+    # por celda y se reutilizan para todos los radios
+    distancias_celdas = diagnostico_lote.distancias_lote(indice, x, y)
+    _, umbrales = distancias_celdas
+    distancias = {
+        columna: np.where(np.isfinite(umbrales[criterio]), np.ceil(umbrales[criterio]), SIN_DISTANCIA).astype(np.int32)
+        for criterio, columna in DISTANCIAS.items()
+    }
+
+    partes = []
+    for radio in radios:
+        bloques = diagnostico_lote.diagnosticar_en_bloques(
+            indice, lats, lons, radio, procesos=procesos, distancias=distancias_celdas
+        )
+        resultado = pd.concat(list(bloques), ignore_index=True)
+        partes.append(pd.DataFrame({
+            "i": i.astype(np.int16),
+            "j": j.astype(np.int16),
+            "radio": np.full(len(i), radio, dtype=np.int16),
+            "num_tm": resultado["num_tm"].astype(np.int32),
+            "num_col": resultado["num_col"].astype(np.int32),
+            "num_salud": resultado["num_salud"].astype(np.int32),
+            "num_parques": resultado["num_parques"].astype(np.int32),
+            "uso_moda": resultado["uso_moda"].astype("category"),
+            "estrato_moda": resultado["estrato_moda"].astype("Int8"),
+            "score": resultado["score"].astype(np.int8),
+            **distancias,
+        }))
+    rejilla = pd.concat(partes, ignore_index=True)
+    rejilla["uso_moda"] = rejilla["uso_moda"].astype("category")
+
+    metadatos = {
+        "version": indice.version,
+        "celda": celda,
+        "origen_x": float(origen_x),
+        "origen_y": float(origen_y),
+        "radios": list(radios),
+    }
+    return rejilla, metadatos
+
+
+def guardar_rejilla(rejilla, metadatos, ruta=RUTA_REJILLA):
+    """Parquet con los metadatos de la rejilla en el esquema (escritura atómica)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tabla = pa.Table.from_pandas(rejilla, preserve_index=False)
+    tabla = tabla.replace_schema_metadata({
+        **(tabla.schema.metadata or {}),
+        b"rejilla_viabilidad": json.dumps(metadatos).encode(),
+    })
+    tmp = f"{ruta}.tmp"
+    pq.write_table(tabla, tmp, compression="zstd")
+    os.replace(tmp, ruta)
+
+
+class RejillaViabilidad:
+    """
+    Rejilla cargada en arreglos densos [radio, fila, columna]; las celdas sin
+    dato quedan en -1. consultar() es una conversión de coordenadas más una
+    lectura de arreglo.
+    """
+
+    def __init__(self, rejilla, metadatos):
+        self.version = metadatos["version"]
+        self.celda = metadatos["celda"]
+        self.origen_x = metadatos["origen_x"]
+        self.origen_y = metadatos["origen_y"]
+        self.radios = {r: k for k, r in enumerate(metadatos["radios"])}
+
+        nx = int(rejilla["i"].max()) + 1 if len(rejilla) else 0
+        ny = int(rejilla["j"].max()) + 1 if len(rejilla) else 0
+        forma = (len(self.radios), ny, nx)
+        k = rejilla["radio"].map(self.radios).to_numpy()
+        j = rejilla["j"].to_numpy()
+        i = rejilla["i"].to_numpy()
+
+        self.usos = list(rejilla["uso_moda"].cat.categories)
+        self.arreglos = {}
+        for campo in CAMPOS:
+            if campo == "uso_moda":
+                valores = rejilla["uso_moda"].cat.codes.to_numpy()
+            elif campo == "estrato_moda":
+                valores = rejilla["estrato_moda"].fillna(-1).to_numpy(dtype=np.int16)
+            else:
+                valores = rejilla[campo].to_numpy()
+            arreglo = np.full(forma, -1, dtype=np.int32 if campo.startswith(("num_", "dist_")) else np.int16)
+            arreglo[k, j, i] = valores
+            self.arreglos[campo] = arreglo
+
+    def consultar(self, lat, lon, radio):
+        """KPIs de la celda más cercana al punto, o None si no hay dato para ese punto y radio."""
+        k = self.radios.get(int(radio))
+        if k is None:
+            return None
+        x, y = capa_puntos.a_metrico(lon, lat)
+        i = int(round((x - self.origen_x) / self.celda))
+        j = int(round((y - self.origen_y) / self.celda))
+        _, ny, nx = self.arreglos["score"].shape
+        if not (0 <= i < nx and 0 <= j < ny) or self.arreglos["score"][k, j, i] < 0:
+            return None
+
+        fila = {campo: int(self.arreglos[campo][k, j, i]) for campo in CAMPOS}
+        fila["uso_moda"] = self.usos[fila["uso_moda"]] if fila["uso_moda"] >= 0 else SIN_CLASIFICACION
+        fila["estrato_moda"] = fila["estrato_moda"] if fila["estrato_moda"] >= 0 else "N/A"
+        distancias = {
+            criterio: np.inf if fila[columna] == SIN_DISTANCIA else fila[columna]
+            for criterio, columna in DISTANCIAS.items()
+        }
+        fila["score"], fila["dictamen"], fila["color_fondo"] = diagnostico.calcular_score(
+            fila["num_tm"], fila["num_col"], fila["uso_moda"], fila["num_parques"], fila["num_salud"],
+            diagnostico.alcance_score(int(radio)), distancias
+        )
+        return fila
+
+    def tamano_bytes(self):
+        return sum(a.nbytes for a in self.arreglos.values())
+
+
+def cargar_rejilla(version=None, ruta=RUTA_REJILLA):
+    """
+    Carga la rejilla si existe y corresponde a `version` (la de los datos en
+    uso). Devuelve None si no hay rejilla o está desactualizada.
+    """
+    if not os.path.exists(ruta):
+        return None
+    import pyarrow.parquet as pq
+
+    tabla = pq.read_table(ruta)
+    metadatos = json.loads(tabla.schema.metadata[b"rejilla_viabilidad"])
+    if version is not None and metadatos["version"] != version:
+        return None
+    if any(campo not in tabla.column_names for campo in CAMPOS):
+        return None
+    return RejillaViabilidad(tabla.to_pandas(), metadatos)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precalcula la rejilla de viabilidad de Bogotá.")
+    parser.add_argument("--celda", type=int, default=CELDA_METROS, help="Lado de la celda en metros")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos en paralelo (por defecto, uno por núcleo)")
+    parser.add_argument("--salida", default=RUTA_REJILLA, help="Archivo Parquet de salida")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    dataframes, errores = carga_datos.cargar_todo()
+    if errores:
+        for err in errores:
+            print(err, file=sys.stderr)
+        return 1
+    indice = motor_espacial.IndiceEspacial(dataframes)
+
+    rejilla, metadatos = construir_rejilla(indice, args.celda, procesos=args.procesos)
+    guardar_rejilla(rejilla, metadatos, args.salida)
+    print(f"{rejilla[['i', 'j']].drop_duplicates().shape[0]} celdas x {len(RADIOS)} radios -> {args.salida} "
+          f"({os.path.getsize(args.salida) / 1024:.0f} KB, {time.perf_counter() - t0:.1f} s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+# Servicio de informes en segundo plano
+"""
+Cola de trabajos para generar el Informe Ejecutivo en un pool de procesos.
+
+La sesión de Streamlit solo encola el trabajo y consulta su estado; el mapa y
+el HTML se construyen en otro proceso, así que un informe lento no bloquea el
+hilo de la sesión y los usuarios concurrentes comparten un tope de procesos
+por máquina (BOGOTA_MAX_INFORMES). Los trabajos idénticos (mismo punto, radio,
+versión de datos y localidad) se deduplican: el segundo pedido se engancha al
+primero.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import informe
+import instrumentacion
+
+# Procesos simultáneos por máquina. 0 = generar en el hilo que lo pide (sin pool)
+MAX_INFORMES = int(os.environ.get("BOGOTA_MAX_INFORMES", max(1, (os.cpu_count() or 2) // 2)))
+# Informes terminados que se conservan para volver a descargarlos
+MAX_INFORMES_GUARDADOS = int(os.environ.get("BOGOTA_MAX_INFORMES_GUARDADOS", 64))
+
+EN_COLA = "en_cola"
+EN_PROCESO = "en_proceso"
+LISTO = "listo"
+ERROR = "error"
+
+PROGRESO = {EN_COLA: 0.1, EN_PROCESO: 0.5, LISTO: 1.0, ERROR: 1.0}
+
+
+def _calentar():
+    """Tarea vacía: basta con que el proceso exista y haya importado informe."""
+    return os.getpid()
+
+
+class ServicioInformes:
+    """
+    Pool de procesos + registro de trabajos indexado por clave.
+    Pensado para vivir una sola vez por proceso (st.cache_resource).
+    """
+
+    def __init__(self, max_procesos=MAX_INFORMES, max_guardados=MAX_INFORMES_GUARDADOS):
+        self.max_procesos = max_procesos
+        self.max_guardados = max_guardados
+        self._pool = None
+        self._trabajos = OrderedDict()
+        # Reentrante: si el trabajo termina antes de registrar el callback, este corre con el lock tomado
+        self._lock = threading.RLock()
+
+    def _obtener_pool(self):
+        if self._pool is None:
+            # spawn: el proceso de Streamlit tiene hilos vivos y fork no es seguro con ellos
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_procesos, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def calentar(self):
+        """Arranca los procesos del pool por adelantado (importar módulos cuesta ~2 s por proceso)."""
+        if self.max_procesos <= 0:
+            return
+        with self._lock:
+            pool = self._obtener_pool()
+            for _ in range(self.max_procesos):
+                pool.submit(_calentar)
+
+    def enviar(self, clave, datos):
+        """
+        Encola el informe `clave` (si no existe ya uno vivo o terminado con esa
+        clave) y devuelve la clave para consultar su estado.
+        """
+        with self._lock:
+            trabajo = self._trabajos.get(clave)
+            if trabajo is not None and trabajo["estado"] != ERROR:
+                self._trabajos.move_to_end(clave)
+                return clave
+
+            trabajo = {"estado": EN_COLA, "html": None, "error": None,
+                       "inicio": time.perf_counter(), "segundos": None, "futuro": None}
+            self._trabajos[clave] = trabajo
+            self._recortar()
+
+            if self.max_procesos <= 0:
+                self._ejecutar_en_linea(trabajo, datos)
+                return clave
+
+            try:
+                futuro = self._obtener_pool().submit(informe.generar_informe, datos)
+            except BrokenProcessPool:
+                # Un proceso murió (p. ej. por memoria): se rehace el pool una vez
+                self._pool = None
+                futuro = self._obtener_pool().submit(informe.generar_informe, datos)
+            trabajo["futuro"] = futuro
+            futuro.add_done_callback(lambda f, t=trabajo: self._terminar(t, f))
+        return clave
+
+    def _ejecutar_en_linea(self, trabajo, datos):
+        try:
+            trabajo["html"] = informe.generar_informe(datos)
+            trabajo["estado"] = LISTO
+        except Exception as e:
+            trabajo["estado"] = ERROR
+            trabajo["error"] = str(e)
+        trabajo["segundos"] = round(time.perf_counter() - trabajo["inicio"], 3)
+        instrumentacion.registrar("informe.generacion", trabajo["segundos"] * 1000)
+
+    def _terminar(self, trabajo, futuro):
+        with self._lock:
+            try:
+                trabajo["html"] = futuro.result()
+                trabajo["estado"] = LISTO
+            except Exception as e:
+                trabajo["estado"] = ERROR
+                trabajo["error"] = str(e) or type(e).__name__
+            trabajo["segundos"] = round(time.perf_counter() - trabajo["inicio"], 3)
+            trabajo["futuro"] = None
+        instrumentacion.registrar("informe.generacion", trabajo["segundos"] * 1000)
+
+    def _recortar(self):
+        """Descarta los trabajos terminados más viejos por encima del tope."""
+        terminados = [c for c, t in self._trabajos.items() if t["estado"] in (LISTO, ERROR)]
+        for clave in terminados[:max(0, len(terminados) - self.max_guardados)]:
+            del self._trabajos[clave]
+
+    def estado(self, clave):
+        """
+        Estado del trabajo: dict con estado, progreso (0-1), posicion en la cola,
+        html (si terminó), error y segundos. None si la clave no existe.
+        """
+        with self._lock:
+            trabajo = self._trabajos.get(clave)
+            if trabajo is None:
+                return None
+            estado = trabajo["estado"]
+            posicion = 0
+            if estado == EN_COLA and trabajo["futuro"] is not None:
+                if trabajo["futuro"].running():
+                    estado = trabajo["estado"] = EN_PROCESO
+                else:
+                    # Trabajos pendientes encolados antes que este
+                    for otro in self._trabajos.values():
+                        if otro is trabajo:
+                            break
+                        if otro["estado"] in (EN_COLA, EN_PROCESO):
+                            posicion += 1
+            return {
+                "estado": estado,
+                "progreso": PROGRESO[estado],
+                "posicion": posicion,
+                "html": trabajo["html"],
+                "error": trabajo["error"],
+                "segundos": trabajo["segundos"],
+            }
+
+    def pendientes(self):
+        with self._lock:
+            return sum(1 for t in self._trabajos.values() if t["estado"] in (EN_COLA, EN_PROCESO))
+
+    def cerrar(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,297 @@
+# Pirámide de teselas vectoriales (MVT) para los mapas del paso 5
+"""
+Genera teselas Mapbox Vector Tile (.pbf) de manzanas y parques, para que los
+mapas de estrato, POT y parques carguen solo las teselas visibles en vez de
+llevar todos los polígonos de la zona dentro del JSON de cada figura.
+
+Las teselas se escriben en BACK_END/static/teselas/{z}/{x}/{y}.pbf y las sirve
+el propio Streamlit (server.enableStaticServing en .streamlit/config.toml).
+Cada tesela trae una capa por categoría (estrato_1 ... estrato_6, pot_0 ...,
+verde) porque las capas de Plotly se pintan con un solo color cada una.
+teselas.json guarda la versión de los datos y el nombre de cada categoría.
+
+El codificador MVT (protobuf) está escrito aquí mismo: solo hacen falta
+polígonos sin atributos, y así no se agrega una dependencia.
+
+Uso:
+    python BACK_END/teselas_vectoriales.py
+    python BACK_END/teselas_vectoriales.py --zoom-min 12 --zoom-max 16
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+import shapely
+
+import carga_datos
+from preparacion import SIN_CLASIFICACION
+
+DIR_TESELAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "teselas")
+ARCHIVO_METADATOS = "teselas.json"
+ZOOM_MIN, ZOOM_MAX = 12, 17
+EXTENSION = 4096
+# Margen alrededor de cada tesela (en unidades de tesela) para que los bordes no se vean al unirlas
+MARGEN = 64
+
+_ORIGEN = 20037508.342789244  # medio ecuador en EPSG:3857
+
+# Lo que necesita una figura para pintar desde las teselas: plantilla de URL
+# (.../{z}/{x}/{y}.pbf), pares (capa, etiqueta) y zoom máximo generado.
+FuenteTeselas = namedtuple("FuenteTeselas", ["url", "capas", "maxzoom"])
+
+
+# CODIFICACIÓN PROTOBUF / MVT
+
+def _varint(n):
+    salida = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            salida.append(byte | 0x80)
+        else:
+            salida.append(byte)
+            return bytes(salida)
+
+
+def _campo_bytes(numero, datos):
+    return _varint((numero << 3) | 2) + _varint(len(datos)) + datos
+
+
+def _campo_varint(numero, valor):
+    return _varint(numero << 3) + _varint(valor)
+
+
+def _comando(id_comando, cuenta):
+    return (id_comando & 0x7) | (cuenta << 3)
+
+
+def _geometria_poligono(geom):
+    """Comandos MVT (MoveTo/LineTo/ClosePath con deltas zigzag) de un (Multi)Polygon ya en enteros."""
+    comandos = []
+    cx = cy = 0
+    partes = geom.geoms if geom.geom_type == "MultiPolygon" else [geom]
+    for poligono in partes:
+        for anillo in [poligono.exterior, *poligono.interiors]:
+            coords = np.asarray(anillo.coords, dtype=np.int64)[:-1]
+            if len(coords) < 3:
+                continue
+            deltas = np.diff(np.vstack([[cx, cy], coords]), axis=0)
+            zz = (deltas << 1) ^ (deltas >> 63)
+            comandos.append(_comando(1, 1))
+            comandos.extend(zz[0].tolist())
+            comandos.append(_comando(2, len(coords) - 1))
+            comandos.extend(zz[1:].ravel().tolist())
+            comandos.append(_comando(7, 1))
+            cx, cy = int(coords[-1, 0]), int(coords[-1, 1])
+    return comandos
+
+
+def _capa_mvt(nombre, geometrias):
+    """Mensaje Layer con una Feature POLYGON por geometría."""
+    features = b""
+    for geom in geometrias:
+        comandos = _geometria_poligono(geom)
+        if not comandos:
+            continue
+        empaquetado = b"".join(_varint(c) for c in comandos)
+        feature = _campo_varint(3, 3) + _campo_bytes(4, empaquetado)
+        features += _campo_bytes(2, feature)
+    if not features:
+        return b""
+    capa = (_campo_varint(15, 2) + _campo_bytes(1, nombre.encode("utf-8"))
+            + features + _campo_varint(5, EXTENSION))
+    return _campo_bytes(3, capa)
+
+
+# GEOMETRÍA DE TESELAS
+
+def a_mercator(geoms):
+    """EPSG:4326 -> EPSG:3857 (esférico) sobre un arreglo de geometrías."""
+    def transformar(coords):
+        x = np.radians(coords[:, 0]) * 6378137.0
+        lat = np.clip(coords[:, 1], -85.0511, 85.0511)
+        y = np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)) * 6378137.0
+        return np.column_stack([x, y])
+    return shapely.transform(geoms, transformar)
+
+
+def limites_tesela(z, x, y):
+    lado = 2 * _ORIGEN / (2 ** z)
+    minx = -_ORIGEN + x * lado
+    maxy = _ORIGEN - y * lado
+    return minx, maxy - lado, minx + lado, maxy
+
+
+def rango_teselas(limites, z):
+    """Columnas y filas de teselas que cubren unos límites en EPSG:3857."""
+    n = 2 ** z
+    lado = 2 * _ORIGEN / n
+    x0 = int((limites[0] + _ORIGEN) // lado)
+    x1 = int((limites[2] + _ORIGEN) // lado)
+    y0 = int((_ORIGEN - limites[3]) // lado)
+    y1 = int((_ORIGEN - limites[1]) // lado)
+    return range(max(0, x0), min(n - 1, x1) + 1), range(max(0, y0), min(n - 1, y1) + 1)
+
+
+def _a_tesela(geoms, z, x, y):
+    """Recorta a la tesela (con margen), pasa a coordenadas 0..EXTENSION y ajusta a enteros."""
+    minx, miny, maxx, maxy = limites_tesela(z, x, y)
+    escala = EXTENSION / (maxx - minx)
+    margen = MARGEN / escala
+    recortadas = shapely.clip_by_rect(geoms, minx - margen, miny - margen, maxx + margen, maxy + margen)
+
+    def transformar(coords):
+        # Y hacia abajo, como pide la especificación
+        return np.column_stack([(coords[:, 0] - minx) * escala, (maxy - coords[:, 1]) * escala])
+
+    en_tesela = shapely.transform(recortadas, transformar)
+    # Rejilla entera: lo que colapsa a esta escala desaparece (simplificación implícita por zoom)
+    en_tesela = shapely.set_precision(en_tesela, 1.0)
+    en_tesela = en_tesela[~shapely.is_empty(en_tesela)]
+    en_tesela = shapely.get_parts(en_tesela) if len(en_tesela) else en_tesela
+    en_tesela = en_tesela[shapely.get_type_id(en_tesela) == 3] if len(en_tesela) else en_tesela
+    # Exterior en sentido horario en pantalla (y hacia abajo) = antihorario con y hacia arriba
+    return shapely.orient_polygons(en_tesela, exterior_cw=False)
+
+
+# CONSTRUCCIÓN DE LA PIRÁMIDE
+
+def capas_por_categoria(manzanas, verde):
+    """
+    {nombre_capa: geometrías EPSG:3857} y {nombre_capa: etiqueta}:
+    una capa por estrato, una por uso POT y una de parques.
+    """
+    capas, etiquetas = {}, {}
+    geom_manz = a_mercator(np.asarray(manzanas.geometry.values))
+
+    estratos = manzanas["estrato"].astype(int).to_numpy()
+    for estrato in sorted(set(estratos.tolist())):
+        capas[f"estrato_{estrato}"] = geom_manz[estratos == estrato]
+        etiquetas[f"estrato_{estrato}"] = estrato
+
+    if "uso_pot_simplificado" in manzanas.columns:
+        usos = manzanas["uso_pot_simplificado"].fillna(SIN_CLASIFICACION).to_numpy(dtype=object)
+        for k, uso in enumerate(sorted(set(usos.tolist()))):
+            capas[f"pot_{k}"] = geom_manz[usos == uso]
+            etiquetas[f"pot_{k}"] = uso
+
+    if verde is not None and not verde.empty:
+        capas["verde"] = a_mercator(np.asarray(verde.geometry.dropna().values))
+        etiquetas["verde"] = "Zonas Verdes"
+    return capas, etiquetas
+
+
+def generar_piramide(capas, zoom_min=ZOOM_MIN, zoom_max=ZOOM_MAX, dir_salida=DIR_TESELAS):
+    """Escribe {z}/{x}/{y}.pbf para todas las teselas que cubren los datos. Devuelve (teselas, bytes)."""
+    arboles = {nombre: shapely.STRtree(geoms) for nombre, geoms in capas.items()}
+    todas = np.concatenate(list(capas.values()))
+    limites = shapely.total_bounds(todas)
+
+    total_teselas = total_bytes = 0
+    for z in range(zoom_min, zoom_max + 1):
+        columnas, filas = rango_teselas(limites, z)
+        for x in columnas:
+            os.makedirs(os.path.join(dir_salida, str(z), str(x)), exist_ok=True)
+            for y in filas:
+                caja = shapely.box(*limites_tesela(z, x, y))
+                contenido = b""
+                for nombre, geoms in capas.items():
+                    pos = arboles[nombre].query(caja, predicate="intersects")
+                    if len(pos):
+                        contenido += _capa_mvt(nombre, _a_tesela(geoms[np.sort(pos)], z, x, y))
+                # Las teselas vacías también se escriben (0 bytes) para que el mapa no reciba 404
+                with open(os.path.join(dir_salida, str(z), str(x), f"{y}.pbf"), "wb") as f:
+                    f.write(contenido)
+                total_teselas += 1
+                total_bytes += len(contenido)
+    return total_teselas, total_bytes
+
+
+def version_teselas(dataframes):
+    """Versión de los datos con que se generan las teselas (huellas de manzanas, áreas y parques)."""
+    return "|".join(f"{n}:{dataframes[n].attrs.get('huella', '')}" for n in ("manzanas", "areas", "verde"))
+
+
+def leer_metadatos(dir_teselas=DIR_TESELAS):
+    ruta = os.path.join(dir_teselas, ARCHIVO_METADATOS)
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def disponibles(dataframes, dir_teselas=DIR_TESELAS):
+    """Metadatos de la pirámide si existe y corresponde a los datos cargados; si no, None."""
+    metadatos = leer_metadatos(dir_teselas)
+    if metadatos is None or metadatos.get("version") != version_teselas(dataframes):
+        return None
+    return metadatos
+
+
+def fuente(metadatos, url_base):
+    """FuenteTeselas para las figuras a partir de teselas.json y la URL pública de la carpeta."""
+    return FuenteTeselas(
+        url=f"{url_base.rstrip('/')}/{{z}}/{{x}}/{{y}}.pbf",
+        capas=tuple((nombre, etiqueta) for nombre, etiqueta in metadatos["capas"].items()),
+        maxzoom=metadatos["maxzoom"],
+    )
+
+
+def capa_mapbox(fuente_teselas, capa, color, opacidad):
+    """Capa de relleno de Plotly (layout.mapbox.layers) que lee una capa de las teselas."""
+    return dict(
+        sourcetype="vector", source=[fuente_teselas.url], sourcelayer=capa,
+        type="fill", color=color, opacity=opacidad, below="traces",
+        # Más allá del último zoom generado no hay teselas: la capa se oculta
+        maxzoom=fuente_teselas.maxzoom + 1,
+    )
+
+
+def construir(dataframes, zoom_min=ZOOM_MIN, zoom_max=ZOOM_MAX, dir_salida=DIR_TESELAS):
+    """Regenera la pirámide completa (borra la anterior) y escribe teselas.json."""
+    capas, etiquetas = capas_por_categoria(dataframes["manzanas"], dataframes.get("verde"))
+    if os.path.isdir(dir_salida):
+        shutil.rmtree(dir_salida)
+    os.makedirs(dir_salida)
+    teselas, tamano = generar_piramide(capas, zoom_min, zoom_max, dir_salida)
+
+    metadatos = {
+        "version": version_teselas(dataframes),
+        "minzoom": zoom_min,
+        "maxzoom": zoom_max,
+        "capas": etiquetas,
+        "teselas": teselas,
+        "bytes": tamano,
+    }
+    with open(os.path.join(dir_salida, ARCHIVO_METADATOS), "w", encoding="utf-8") as f:
+        json.dump(metadatos, f, indent=2, ensure_ascii=False)
+    return metadatos
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera la pirámide de teselas vectoriales (MVT).")
+    parser.add_argument("--zoom-min", type=int, default=ZOOM_MIN)
+    parser.add_argument("--zoom-max", type=int, default=ZOOM_MAX)
+    parser.add_argument("--salida", default=DIR_TESELAS, help="Carpeta de salida")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    dataframes, errores = carga_datos.cargar_todo()
+    if errores:
+        for err in errores:
+            print(err, file=sys.stderr)
+        return 1
+    metadatos = construir(dataframes, args.zoom_min, args.zoom_max, args.salida)
+    print(f"{metadatos['teselas']} teselas, {metadatos['bytes'] / 1024 / 1024:.1f} MB -> {args.salida} "
+          f"({time.perf_counter() - t0:.0f} s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,263 @@
+# Micro-benchmark: etapas del paso 5 sobre las capas reales
+"""
+Mide por separado cada pieza de la que depende el diagnóstico del paso 5,
+para cada uno de los siete radios del paso 3 y un conjunto fijo de puntos en
+cada localidad (su punto representativo y --puntos pines al azar dentro de
+ella, reproducibles con --semilla):
+
+    zona.circulo          círculo del radio en EPSG:4326 (lo que antes era el buffer en 3116)
+    zona.isocrona         isócrona a pie sin caché (solo si hay red peatonal, ver red_peatonal.py)
+    cruce.<capa>          filtro exacto por distancia en metros de cada capa
+                          (lo que antes era geometry.intersects(area_interes))
+    cruce.zona            las cinco capas en una sola pasada (motor_espacial.ConsultaZona)
+    pot.consulta          clasificar_pot: consulta de la columna POT precalculada
+    pot.sjoin             preparacion.asignar_uso_pot sobre las manzanas de la zona
+                          (el cruce con las áreas del POT que hacía el sjoin con buffer(0))
+    cercanias             k equipamientos más cercanos por categoría
+    diagnostico           Diagnostico completo (todo lo anterior + KPIs y puntaje)
+    figura.<nombre>       cada figura Plotly (los mapas choropleth y las barras)
+    informe.png           mapa PNG del informe (mapa_estatico.py; lo que antes era to_image)
+
+Cada caso reporta operaciones por segundo (tiempo de pared, el mejor de
+--repeticiones pasadas por todos los puntos) y la memoria que asigna cada
+operación según tracemalloc (pico y lo que queda retenido, en KB, medidos en
+una pasada aparte porque tracemalloc hace lento el código medido).
+
+Uso:
+    python BENCHMARKS/bench_motor_espacial.py [--repeticiones 3] [--puntos 2] [--radios 300,600]
+    python BENCHMARKS/bench_motor_espacial.py --solo figura --salida BENCHMARKS/resultados/motor.json \\
+        --comparar BENCHMARKS/resultados/motor_base.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import shapely
+
+RAIZ_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RAIZ_PROYECTO, "BACK_END"))
+
+import capa_puntos  # noqa: E402
+import diagnostico  # noqa: E402
+import mapa_estatico  # noqa: E402
+import preparacion  # noqa: E402
+import red_peatonal  # noqa: E402
+import registro_datos  # noqa: E402
+
+RADIOS = (300, 600, 900, 1200, 1500, 1800, 2100)
+CAPAS_CRUCE = ("transporte", "colegios", "salud", "manzanas", "verde")
+FIGURAS = ("movilidad", "educacion", "salud", "parques", "estrato", "estrato_barras", "pot", "pot_barras")
+
+# Figuras que el paso 5 solo dibuja en algunas zonas (como en la app): nombre -> condición
+CONDICION_FIGURA = {
+    "estrato": lambda d: not d.manzanas_zona.empty,
+    "estrato_barras": lambda d: not d.manzanas_zona.empty,
+    "pot_barras": lambda d: d.clasificacion_exitosa,
+}
+
+# Una regresión se marca cuando las ops/s caen más de esto frente a --comparar
+UMBRAL_REGRESION = 0.20
+
+
+def puntos_fijos(localidades, por_localidad, semilla):
+    """(localidad, lat, lon): el punto representativo de cada localidad y `por_localidad` pines dentro."""
+    aleatorio = random.Random(semilla)
+    puntos = []
+    for nombre, geometria in zip(localidades["nombre_localidad"], localidades.geometry):
+        if geometria is None or geometria.is_empty:
+            continue  # 'Sin Localización'
+        centro = geometria.representative_point()
+        puntos.append((nombre, centro.y, centro.x))
+        minx, miny, maxx, maxy = geometria.bounds
+        for _ in range(por_localidad):
+            while True:
+                lon, lat = aleatorio.uniform(minx, maxx), aleatorio.uniform(miny, maxy)
+                if shapely.contains_xy(geometria, lon, lat):
+                    puntos.append((nombre, lat, lon))
+                    break
+    return puntos
+
+
+def casos(indice, registro, red):
+    """
+    Nombre -> (preparar, operar). `preparar(lat, lon, radio)` arma fuera del
+    tiempo medido lo que la operación recibe (None = el caso no aplica en ese
+    punto); `operar(preparado)` es lo medido.
+    """
+    def punto(lat, lon, radio):
+        return lat, lon, radio
+
+    def diag(lat, lon, radio):
+        return diagnostico.Diagnostico(indice, lat, lon, radio, red=red)
+
+    lista = {"zona.circulo": (punto, lambda p: diagnostico.area_de_analisis(*p))}
+
+    if red is not None:
+        def isocrona_fria(p):
+            lat, lon, radio = p
+            red._isocronas.clear()
+            return red.isocrona_metrica(*capa_puntos.a_metrico(lon, lat), radio)
+        lista["zona.isocrona"] = (punto, isocrona_fria)
+
+    for capa in CAPAS_CRUCE:
+        lista[f"cruce.{capa}"] = (
+            punto, lambda p, capa=capa: indice.posiciones_en_radio(capa, p[1], p[0], p[2])
+        )
+
+    # Las cinco capas a la vez, como las cruza el diagnóstico (caja compartida)
+    lista["cruce.zona"] = (
+        punto, lambda p: indice.consultar_zona(diagnostico.CAPAS_ZONA, p[1], p[0], p[2])
+    )
+
+    def manzanas_zona(lat, lon, radio):
+        return indice.en_radio("manzanas", lon, lat, radio)
+
+    areas = registro["areas"]
+    lista["pot.consulta"] = (manzanas_zona, diagnostico.clasificar_pot)
+    lista["pot.sjoin"] = (manzanas_zona, lambda m: preparacion.asignar_uso_pot(m, areas))
+    lista["cercanias"] = (punto, lambda p: diagnostico.cercanias(indice, p[1], p[0]))
+    lista["diagnostico"] = (punto, lambda p: diag(*p))
+
+    def diag_con(condicion):
+        def preparar(lat, lon, radio):
+            d = diag(lat, lon, radio)
+            return d if condicion(d) else None
+        return preparar
+
+    for nombre in FIGURAS:
+        # Directo al constructor: Diagnostico.figura() memoiza y solo mediría la primera vez
+        preparar = diag_con(CONDICION_FIGURA[nombre]) if nombre in CONDICION_FIGURA else diag
+        lista[f"figura.{nombre}"] = (preparar, lambda d, nombre=nombre: getattr(d, f"_fig_{nombre}")())
+
+    lista["informe.png"] = (
+        diag, lambda d: mapa_estatico.mapa_informe(d.area_interes, d.lat, d.lon, d.puntos_informe())
+    )
+    return lista
+
+
+def medir(preparar, operar, puntos, radio, repeticiones):
+    """ops/s (mejor pasada) y KB de pico y retenidos por operación (media), o None si no aplica."""
+    preparados = [preparar(lat, lon, radio) for _, lat, lon in puntos]
+    preparados = [p for p in preparados if p is not None]
+    if not preparados:
+        return None
+    operar(preparados[0])  # Calentamiento (importaciones perezosas, cachés de pyproj)
+
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        for p in preparados:
+            operar(p)
+        mejor = min(mejor, time.perf_counter() - inicio)
+
+    picos, retenidos = [], []
+    tracemalloc.start()
+    try:
+        for p in preparados:
+            antes = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            resultado = operar(p)
+            actual, pico = tracemalloc.get_traced_memory()
+            picos.append(pico - antes)
+            retenidos.append(actual - antes)
+            del resultado
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "n": len(preparados),
+        "ops_s": round(len(preparados) / mejor, 1),
+        "ms_op": round(mejor * 1000 / len(preparados), 3),
+        "pico_kb": round(float(np.mean(picos)) / 1024, 1),
+        "retenido_kb": round(float(np.mean(retenidos)) / 1024, 1),
+    }
+
+
+def comparar(actual, ruta_base):
+    """Imprime la variación de ops/s y de memoria contra otra corrida; devuelve cuántas regresiones hay."""
+    with open(ruta_base, encoding="utf-8") as f:
+        base = {(r["caso"], r["radio"]): r for r in json.load(f)["resultados"]}
+    print(f"\nCOMPARACIÓN CON {ruta_base}")
+    print(f"{'CASO':<24} {'RADIO':>6} {'ops/s base':>11} {'ops/s':>11} {'VAR':>7} {'pico base':>10} {'pico KB':>10}")
+    regresiones = 0
+    for r in actual:
+        b = base.get((r["caso"], r["radio"]))
+        if b is None:
+            continue
+        variacion = r["ops_s"] / b["ops_s"] - 1 if b["ops_s"] else 0.0
+        marca = ""
+        if variacion < -UMBRAL_REGRESION:
+            marca = "  REGRESIÓN"
+            regresiones += 1
+        print(f"{r['caso']:<24} {r['radio']:>6} {b['ops_s']:>11.1f} {r['ops_s']:>11.1f} {variacion:>+7.0%} "
+              f"{b['pico_kb']:>10.1f} {r['pico_kb']:>10.1f}{marca}")
+    return regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--puntos", type=int, default=2, help="Pines al azar por localidad (además del representativo)")
+    parser.add_argument("--radios", default=",".join(str(r) for r in RADIOS), help="Radios, separados por coma")
+    parser.add_argument("--solo", default=None, help="Solo los casos cuyo nombre empieza así (p. ej. figura, cruce.)")
+    parser.add_argument("--semilla", type=int, default=2025)
+    parser.add_argument("--salida", default=None, help="JSON de resultados")
+    parser.add_argument("--comparar", default=None, help="JSON de otra corrida para comparar")
+    args = parser.parse_args(argv)
+
+    os.chdir(RAIZ_PROYECTO)  # Rutas de DATOS_LIMPIOS y teselas como en la app
+    radios = [int(r) for r in args.radios.split(",") if r.strip()]
+    registro = registro_datos.RegistroDatos.cargar()
+    if registro.errores:
+        print("Errores de carga:", *registro.errores, sep="\n  ")
+        return 1
+    indice = registro.indice()
+    red = red_peatonal.RedPeatonal.cargar()
+    puntos = puntos_fijos(registro["localidades"], args.puntos, args.semilla)
+
+    todos = casos(indice, registro, red)
+    if args.solo:
+        todos = {n: c for n, c in todos.items() if n.startswith(args.solo)}
+    print(f"{len(puntos)} puntos en {len({p[0] for p in puntos})} localidades, radios {radios}, "
+          f"red peatonal: {'sí' if red is not None else 'no'}\n")
+    print(f"{'CASO':<24} {'RADIO':>6} {'N':>4} {'ops/s':>11} {'ms/op':>9} {'pico KB':>10} {'ret. KB':>9}")
+
+    resultados = []
+    for nombre, (preparar, operar) in todos.items():
+        for radio in radios:
+            medicion = medir(preparar, operar, puntos, radio, args.repeticiones)
+            if medicion is None:
+                print(f"{nombre:<24} {radio:>6} {'(no aplica en ningún punto)':>40}")
+                continue
+            r = {"caso": nombre, "radio": radio, **medicion}
+            resultados.append(r)
+            print(f"{nombre:<24} {radio:>6} {r['n']:>4} {r['ops_s']:>11.1f} {r['ms_op']:>9.3f} "
+                  f"{r['pico_kb']:>10.1f} {r['retenido_kb']:>9.1f}", flush=True)
+
+    if args.salida:
+        os.makedirs(os.path.dirname(os.path.abspath(args.salida)), exist_ok=True)
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({
+                "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "parametros": {"puntos": len(puntos), "radios": radios, "semilla": args.semilla,
+                               "repeticiones": args.repeticiones, "red_peatonal": red is not None},
+                "entorno": {"python": platform.python_version(), "plataforma": platform.platform(),
+                            "cpus": os.cpu_count()},
+                "datos": registro.version,
+                "resultados": resultados,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\n-> {args.salida}")
+
+    if args.comparar:
+        return 1 if comparar(resultados, args.comparar) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
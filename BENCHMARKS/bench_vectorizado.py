@@ -0,0 +1,130 @@
+# Micro-benchmark: versiones fila a fila vs. vectorizadas
+"""
+Compara, sobre los archivos reales de DATOS_LIMPIOS y DATOS_BRUTOS, las
+implementaciones originales (iterrows / apply / next por fila) con sus
+reemplazos vectorizados, y verifica que ambas den el mismo resultado.
+
+Uso:
+    python BENCHMARKS/bench_vectorizado.py [--repeticiones 5] [--puntos 500]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely.geometry import Point
+
+RAIZ_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RAIZ_PROYECTO, "BACK_END"))
+
+import motor_espacial  # noqa: E402
+import pipeline_datos  # noqa: E402
+
+DIR_BRUTOS = os.path.join(RAIZ_PROYECTO, "DATOS_BRUTOS")
+DIR_LIMPIOS = os.path.join(RAIZ_PROYECTO, "DATOS_LIMPIOS")
+
+
+# IMPLEMENTACIONES ORIGINALES (copiadas de la app y del cuaderno)
+
+def localidad_iterrows(localidades, lon, lat):
+    punto = Point(lon, lat)
+    for _, row in localidades.iterrows():
+        # En la app este bucle fallaba con la fila sin geometría ("Sin Localización")
+        if pd.notna(row["geometry"]) and row["geometry"].contains(punto):
+            return row["nombre_localidad"]
+    return None
+
+
+def limpiar_coord(val):
+    if pd.isna(val): return np.nan
+    return str(val).replace('\t', '').replace(',', '.').strip()
+
+
+def coords_apply(serie):
+    return pd.to_numeric(serie.apply(limpiar_coord), errors='coerce')
+
+
+def obtener_top_3(row):
+    cols_delitos = pipeline_datos.cols_delitos
+    datos = row[list(cols_delitos.keys())].rename(index=cols_delitos)
+    top = datos.sort_values(ascending=False).head(3)
+    top = top[top > 0]
+    if top.empty: return "Sin datos significativos"
+    return ", ".join([f"{i}. {idx}" for i, idx in enumerate(top.index, start=1)])
+
+
+def usos_pot_next(serie):
+    return serie.apply(pipeline_datos.simplificar_uso_pot)
+
+
+# CASOS
+
+def medir(nombre, original, vectorizada, repeticiones):
+    """Ejecuta ambas versiones, compara resultados e imprime la aceleración."""
+    res_original = original()
+    res_vectorizada = vectorizada()
+    if isinstance(res_original, pd.Series):
+        iguales = res_original.reset_index(drop=True).equals(res_vectorizada.reset_index(drop=True))
+    else:
+        iguales = res_original == res_vectorizada
+
+    t_original = min(timeit.repeat(original, number=1, repeat=repeticiones))
+    t_vectorizada = min(timeit.repeat(vectorizada, number=1, repeat=repeticiones))
+    print(f"{nombre:<34} {t_original * 1000:>10.2f} {t_vectorizada * 1000:>10.2f} "
+          f"{t_original / t_vectorizada:>8.1f}x  {'OK' if iguales else 'DIFERENTE'}")
+    return iguales
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--puntos", type=int, default=500, help="Clics simulados para el paso 2")
+    args = parser.parse_args(argv)
+
+    localidades = gpd.read_file(os.path.join(DIR_LIMPIOS, "dim_localidad.geojson"))
+    dai = gpd.read_file(os.path.join(DIR_BRUTOS, "dai_shp.zip"))
+    areas = gpd.read_file(os.path.join(DIR_BRUTOS, "areaactividad.zip"), columns=["NOMBRE_ARE"])
+    directorio = pd.read_excel(
+        os.path.join(DIR_BRUTOS, "directorio-unico-de-establecimientos-06.25.xlsx"),
+        usecols=["COORDENADA LONGITUD (X)", "COORDENADA LATITUD (Y)"]
+    )
+
+    # Clics aleatorios (reproducibles) dentro del rectángulo urbano
+    rng = np.random.default_rng(2025)
+    lons = rng.uniform(-74.22, -74.01, args.puntos)
+    lats = rng.uniform(4.47, 4.83, args.puntos)
+    # El mismo índice que usa la app (en metros), construido una vez fuera de la medición
+    indice = motor_espacial.IndiceEspacial({"localidades": localidades})
+
+    def clics_originales():
+        return [localidad_iterrows(localidades, x, y) for x, y in zip(lons, lats)]
+
+    def clics_vectorizados():
+        salida = []
+        for x, y in zip(lons, lats):
+            row = indice.localidad_en_punto(x, y)
+            salida.append(None if row is None else row["nombre_localidad"])
+        return salida
+
+    print(f"{'CASO':<34} {'ORIG ms':>10} {'VECT ms':>10} {'ACEL':>9}  RESULTADO")
+    todo_ok = all([
+        medir(f"Paso 2: localidad ({args.puntos} clics)", clics_originales, clics_vectorizados, args.repeticiones),
+        medir("Cuaderno: top 3 delitos (DAI)",
+              lambda: dai.apply(obtener_top_3, axis=1),
+              lambda: pipeline_datos.top_3_delitos(dai), args.repeticiones),
+        medir("Cuaderno: mapeo_pot (POT)",
+              lambda: usos_pot_next(areas["NOMBRE_ARE"]),
+              lambda: pipeline_datos.simplificar_usos_pot(areas["NOMBRE_ARE"]), args.repeticiones),
+        medir("Cuaderno: limpiar_coord (2 col.)",
+              lambda: pd.concat([coords_apply(directorio[c]) for c in directorio.columns]),
+              lambda: pd.concat([pipeline_datos.limpiar_coordenadas(directorio[c]) for c in directorio.columns]),
+              args.repeticiones),
+    ])
+    return 0 if todo_ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,365 @@
+# Prueba de carga: usuarios concurrentes recorriendo el asistente
+"""
+Simula N usuarios que recorren los pasos 1 -> 2 -> 3 -> 5 de la app contra los
+archivos locales de DATOS_LIMPIOS, sin navegador: cada usuario es un AppTest
+de Streamlit y todos comparten el proceso (y por lo tanto las cachés
+st.cache_resource), como las sesiones de un mismo servidor.
+
+Los usuarios avanzan por fases: todos hacen la misma acción a la vez (con
+--concurrencia hilos) y se espera a que terminen antes de la siguiente. Así
+cada fase tiene su propia latencia (p50/p95/máx por usuario), CPU del proceso
+y pico de memoria (RSS, muestreado con psutil).
+
+AppTest crea y destruye un runtime global de Streamlit en cada corrida, así
+que dos corridas no pueden ir a la vez en un mismo proceso: las corridas de
+los usuarios se turnan (un candado) y la latencia de cada uno incluye la
+espera detrás de los demás, como la cola de un servidor con un solo núcleo.
+Lo que sí corre en paralelo es lo que la app manda a otros hilos o procesos
+(informes, carga de capas).
+
+Recorrido de cada usuario:
+    paso1_carga           abre la app (la primera sesión carga los datos)
+    paso2_mapa            "Comenzar a Explorar" -> mapa de localidades
+    paso2_clic            clic en una localidad (al azar, con --semilla)
+    paso3_mapa            "Analizar esta Zona" -> mapa de la localidad
+    paso3_pin             clic en un punto dentro de la localidad
+    y por cada radio de --radios:
+    paso3_radio_<r>       mueve el control de radio
+    paso5_<r>             "Generar Diagnóstico Completo"
+    informe_<r>           "Preparar Ficha" y espera hasta que aparece "Descargar Ficha"
+
+Los clics en los mapas folium no se pueden hacer desde AppTest: el arnés
+envuelve st_folium (que sigue armando y enviando el mapa) y le agrega el
+last_clicked del usuario simulado en el paso donde hizo clic.
+
+Uso:
+    python BENCHMARKS/carga_asistente.py --usuarios 50
+    python BENCHMARKS/carga_asistente.py --usuarios 200 --concurrencia 50 --radios 600,1200 \\
+        --salida BENCHMARKS/resultados/carga_200.json --comparar BENCHMARKS/resultados/carga_base.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import psutil
+
+RAIZ_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RAIZ_PROYECTO, "BACK_END"))
+
+APP = os.path.join(RAIZ_PROYECTO, "BACK_END", "app_bogota_inteligente.py")
+DIR_RESULTADOS = os.path.join(RAIZ_PROYECTO, "BENCHMARKS", "resultados")
+RADIOS = (300, 600, 900, 1200, 1500, 1800, 2100)
+
+# Clave de session_state con el clic que "devuelve" el mapa folium del usuario simulado
+CLAVE_CLIC = "_clic_simulado"
+
+# Cada cuánto se muestrea la memoria del proceso (segundos)
+INTERVALO_MUESTREO = 0.05
+
+# Una corrida de AppTest a la vez (ver el docstring)
+_turno = threading.Lock()
+
+
+def instalar_clics_simulados():
+    """Envuelve streamlit_folium.st_folium para que devuelva el clic del usuario simulado."""
+    import streamlit as st
+    import streamlit_folium
+
+    st_folium_real = streamlit_folium.st_folium
+
+    def st_folium_simulado(mapa, *args, **kwargs):
+        salida = st_folium_real(mapa, *args, **kwargs)
+        clic = st.session_state.get(CLAVE_CLIC)
+        if clic is None or clic["paso"] != st.session_state.get("step"):
+            return salida
+        if not clic.get("persistente", True):
+            # Un clic de una sola vez (el pin del paso 3 hace st.rerun() al recibirlo)
+            del st.session_state[CLAVE_CLIC]
+        return dict(salida or {}, last_clicked={"lat": clic["lat"], "lng": clic["lng"]})
+
+    streamlit_folium.st_folium = st_folium_simulado
+
+
+def puntos_de_prueba(semilla):
+    """Por localidad: (punto para el clic del paso 2, generador de pines dentro de ella)."""
+    import shapely
+
+    import carga_datos
+
+    localidades, _ = carga_datos.cargar_todo(nombres=["localidades"])
+    localidades = localidades["localidades"]
+    localidades = localidades[localidades.geometry.notna() & ~localidades.geometry.is_empty]
+    # Sumapaz es casi toda rural: se deja por fuera para que los pines caigan en la ciudad
+    localidades = localidades[localidades["nombre_localidad"] != "Sumapaz"]
+    aleatorio = random.Random(semilla)
+
+    def pin(geometria):
+        minx, miny, maxx, maxy = geometria.bounds
+        while True:
+            lon, lat = aleatorio.uniform(minx, maxx), aleatorio.uniform(miny, maxy)
+            if shapely.contains_xy(geometria, lon, lat):
+                return lat, lon
+
+    casos = []
+    for geometria in localidades.geometry:
+        centro = geometria.representative_point()
+        casos.append(((centro.y, centro.x), geometria))
+    return casos, pin, aleatorio
+
+
+class Usuario:
+    """Una sesión simulada: su AppTest, su localidad, su pin y si sigue viva."""
+
+    def __init__(self, numero, clic_localidad, pin, tiempo_limite):
+        from streamlit.testing.v1 import AppTest
+
+        self.numero = numero
+        self.clic_localidad = clic_localidad
+        self.pin = pin
+        self.at = AppTest.from_file(APP, default_timeout=tiempo_limite)
+        self.error = None
+
+    def correr(self):
+        with _turno:
+            self.at.run()
+        if self.at.exception:
+            raise RuntimeError(self.at.exception[0].message)
+
+    def boton(self, etiqueta):
+        for boton in self.at.button:
+            if boton.label == etiqueta:
+                boton.click()
+                self.correr()
+                return
+        raise RuntimeError(f"No aparece el botón '{etiqueta}' (paso {self.at.session_state.step})")
+
+    def clic(self, lat, lon, persistente=True):
+        self.at.session_state[CLAVE_CLIC] = {
+            "lat": lat, "lng": lon, "paso": self.at.session_state.step, "persistente": persistente
+        }
+        self.correr()
+
+    def descarga_lista(self):
+        return any(b.proto.label == "📥 Descargar Ficha" for b in self.at.get("download_button"))
+
+
+def paso1_carga(u):
+    u.correr()
+
+
+def paso2_mapa(u):
+    u.boton("📍 Comenzar a Explorar")
+
+
+def paso2_clic(u):
+    u.clic(*u.clic_localidad)
+
+
+def paso3_mapa(u):
+    u.boton("🔍 Analizar esta Zona")
+
+
+def paso3_pin(u):
+    u.clic(*u.pin, persistente=False)
+    if "punto_lat" not in u.at.session_state:
+        raise RuntimeError("El pin quedó por fuera de la localidad")
+
+
+def paso3_radio(radio):
+    def accion(u):
+        if u.at.session_state.step != 3:
+            u.at.session_state.step = 3
+            u.correr()
+        u.at.select_slider[0].set_value(radio)
+        u.correr()
+    return accion
+
+
+def paso5(u):
+    u.boton("🚀 Generar Diagnóstico Completo")
+
+
+def informe(tiempo_limite):
+    def accion(u):
+        limite = time.perf_counter() + tiempo_limite
+        # Otro usuario en el mismo punto puede haberla pedido ya (en cola o lista)
+        if any(b.label == "📄 Preparar Ficha" for b in u.at.button):
+            u.boton("📄 Preparar Ficha")
+        # En el navegador el fragmento sondea solo; aquí se vuelve a correr la página
+        while not u.descarga_lista():
+            if time.perf_counter() > limite:
+                raise TimeoutError(f"El informe no terminó en {tiempo_limite} s")
+            time.sleep(0.2)
+            u.correr()
+    return accion
+
+
+class MuestreoMemoria:
+    """Hilo que registra el RSS máximo del proceso mientras dura el bloque with."""
+
+    def __init__(self, proceso):
+        self.proceso = proceso
+        self.pico = 0
+        self._fin = threading.Event()
+
+    def _muestrear(self):
+        while not self._fin.is_set():
+            self.pico = max(self.pico, self.proceso.memory_info().rss)
+            self._fin.wait(INTERVALO_MUESTREO)
+
+    def __enter__(self):
+        self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._fin.set()
+        self._hilo.join()
+        self.pico = max(self.pico, self.proceso.memory_info().rss)
+
+
+def fase(nombre, usuarios, accion, concurrencia, proceso):
+    """Corre `accion` para todos los usuarios vivos y devuelve las métricas de la fase."""
+    vivos = [u for u in usuarios if u.error is None]
+    latencias = []
+    errores = []
+
+    def medir(u):
+        inicio = time.perf_counter()
+        try:
+            accion(u)
+        except Exception as e:
+            u.error = f"{nombre}: {e}"
+            errores.append(u.error)
+            return
+        latencias.append((time.perf_counter() - inicio) * 1000)
+
+    cpu_inicio = sum(proceso.cpu_times()[:2])
+    rss_inicio = proceso.memory_info().rss
+    inicio = time.perf_counter()
+    with MuestreoMemoria(proceso) as memoria, ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        list(pool.map(medir, vivos))
+    pared = time.perf_counter() - inicio
+    cpu = sum(proceso.cpu_times()[:2]) - cpu_inicio
+
+    resultado = {
+        "fase": nombre,
+        "usuarios": len(vivos),
+        "errores": len(errores),
+        "p50_ms": round(float(np.percentile(latencias, 50)), 1) if latencias else None,
+        "p95_ms": round(float(np.percentile(latencias, 95)), 1) if latencias else None,
+        "max_ms": round(max(latencias), 1) if latencias else None,
+        "media_ms": round(float(np.mean(latencias)), 1) if latencias else None,
+        "pared_s": round(pared, 3),
+        "cpu_s": round(cpu, 3),
+        "rss_inicio_mb": round(rss_inicio / 2**20, 1),
+        "rss_pico_mb": round(memoria.pico / 2**20, 1),
+        "muestra_errores": errores[:3],
+    }
+    imprimir_fase(resultado)
+    return resultado
+
+
+def imprimir_fase(r):
+    def ms(valor):
+        return f"{valor:>9.1f}" if valor is not None else f"{'-':>9}"
+    print(f"{r['fase']:<18} {r['usuarios']:>5} {r['errores']:>4} {ms(r['p50_ms'])} {ms(r['p95_ms'])} "
+          f"{ms(r['max_ms'])} {r['cpu_s']:>8.2f} {r['rss_pico_mb']:>9.1f}", flush=True)
+
+
+def comparar(actual, ruta_base):
+    """Imprime la variación de p50/p95/RSS contra otra corrida guardada."""
+    with open(ruta_base, encoding="utf-8") as f:
+        base = {r["fase"]: r for r in json.load(f)["fases"]}
+    print(f"\nCOMPARACIÓN CON {ruta_base}")
+    print(f"{'FASE':<18} {'p50 base':>9} {'p50':>9} {'p95 base':>9} {'p95':>9} {'RSS base':>9} {'RSS':>9}")
+    for r in actual:
+        b = base.get(r["fase"])
+        if b is None:
+            continue
+        print(f"{r['fase']:<18} {b['p50_ms'] or 0:>9.1f} {r['p50_ms'] or 0:>9.1f} {b['p95_ms'] or 0:>9.1f} "
+              f"{r['p95_ms'] or 0:>9.1f} {b['rss_pico_mb']:>9.1f} {r['rss_pico_mb']:>9.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--usuarios", type=int, default=50)
+    parser.add_argument("--concurrencia", type=int, default=None, help="Hilos a la vez (por defecto, todos los usuarios)")
+    parser.add_argument("--radios", default=",".join(str(r) for r in RADIOS), help="Radios a recorrer, separados por coma")
+    parser.add_argument("--semilla", type=int, default=2025)
+    parser.add_argument("--tiempo-limite", type=float, default=300, help="Segundos máximos por acción")
+    parser.add_argument("--salida", default=None, help="JSON de resultados (por defecto en BENCHMARKS/resultados/)")
+    parser.add_argument("--comparar", default=None, help="JSON de otra corrida para comparar")
+    args = parser.parse_args(argv)
+
+    # Sin refresco en caliente ni exportador: solo se mide el recorrido
+    os.environ.setdefault("BOGOTA_INTERVALO_REFRESCO", "0")
+    os.environ.pop("BOGOTA_PUERTO_METRICAS", None)
+    os.chdir(RAIZ_PROYECTO)  # Como `streamlit run BACK_END/app_bogota_inteligente.py`
+    radios = [int(r) for r in args.radios.split(",") if r.strip()]
+    concurrencia = args.concurrencia or args.usuarios
+
+    instalar_clics_simulados()
+    import instrumentacion
+
+    casos, pin, aleatorio = puntos_de_prueba(args.semilla)
+    usuarios = []
+    for numero in range(args.usuarios):
+        clic_localidad, geometria = casos[aleatorio.randrange(len(casos))]
+        usuarios.append(Usuario(numero, clic_localidad, pin(geometria), args.tiempo_limite))
+
+    proceso = psutil.Process()
+    print(f"{args.usuarios} usuarios, {concurrencia} a la vez, radios {radios}\n")
+    print(f"{'FASE':<18} {'USR':>5} {'ERR':>4} {'p50 ms':>9} {'p95 ms':>9} {'máx ms':>9} {'CPU s':>8} {'RSS MB':>9}")
+    recorrido = [
+        ("paso1_carga", paso1_carga),
+        ("paso2_mapa", paso2_mapa),
+        ("paso2_clic", paso2_clic),
+        ("paso3_mapa", paso3_mapa),
+        ("paso3_pin", paso3_pin),
+    ]
+    for radio in radios:
+        recorrido += [
+            (f"paso3_radio_{radio}", paso3_radio(radio)),
+            (f"paso5_{radio}", paso5),
+            (f"informe_{radio}", informe(args.tiempo_limite)),
+        ]
+    inicio = time.perf_counter()
+    fases = [fase(nombre, usuarios, accion, concurrencia, proceso) for nombre, accion in recorrido]
+
+    resultados = {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "parametros": {
+            "usuarios": args.usuarios, "concurrencia": concurrencia, "radios": radios, "semilla": args.semilla,
+        },
+        "entorno": {
+            "python": platform.python_version(), "plataforma": platform.platform(),
+            "cpus": os.cpu_count(), "memoria_mb": round(psutil.virtual_memory().total / 2**20),
+        },
+        "duracion_s": round(time.perf_counter() - inicio, 2),
+        "completaron": sum(u.error is None for u in usuarios),
+        "fases": fases,
+        # Tramos internos de la app durante la prueba (ver BACK_END/instrumentacion.py)
+        "tramos": instrumentacion.METRICAS.resumen(),
+    }
+    salida = args.salida or os.path.join(DIR_RESULTADOS, f"carga_{args.usuarios}u_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(resultados, f, ensure_ascii=False, indent=2)
+    print(f"\n{resultados['completaron']}/{args.usuarios} usuarios completaron el recorrido "
+          f"en {resultados['duracion_s']} s -> {salida}")
+
+    if args.comparar:
+        comparar(fases, args.comparar)
+    return 0 if resultados["completaron"] == args.usuarios else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
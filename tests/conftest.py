@@ -0,0 +1,5 @@
+# Las pruebas importan los módulos de BACK_END como lo hace la app (desde la raíz del proyecto)
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "BACK_END"))
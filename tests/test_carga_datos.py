@@ -0,0 +1,90 @@
+# Pruebas de las capas remotas de carga_datos.py: revalidación condicional y espera tras fallos
+import functools
+import http.server
+import os
+import threading
+
+import pytest
+
+import carga_datos
+
+
+@pytest.fixture
+def remoto(tmp_path, monkeypatch):
+    """Servidor HTTP local con los GeoJSON 'remotos'; cuenta las peticiones por archivo."""
+    dir_remoto = tmp_path / "remoto"
+    dir_remoto.mkdir()
+    peticiones = []
+
+    class Manejador(http.server.SimpleHTTPRequestHandler):
+        def do_GET(self):
+            peticiones.append(self.path)
+            super().do_GET()
+
+        def log_message(self, *args):
+            pass
+
+    servidor = http.server.ThreadingHTTPServer(
+        ("127.0.0.1", 0), functools.partial(Manejador, directory=str(dir_remoto))
+    )
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+    monkeypatch.setattr(carga_datos, "DIR_DATOS_LIMPIOS", str(tmp_path / "limpios"))
+    monkeypatch.setattr(carga_datos, "DIR_CACHE", str(tmp_path / "cache"))
+    monkeypatch.setattr(carga_datos, "_remotos", {})
+    yield dir_remoto, f"http://127.0.0.1:{servidor.server_address[1]}/", peticiones
+    servidor.shutdown()
+
+
+def _vencer(nombre_archivo):
+    # Como si ya hubieran pasado INTERVALO_REMOTOS segundos desde la última revisión
+    carga_datos._remotos[nombre_archivo]["revisada"] -= carga_datos.INTERVALO_REMOTOS + 1
+
+
+def test_capa_remota_se_revalida(remoto):
+    dir_remoto, url, peticiones = remoto
+    (dir_remoto / "dim_verde.geojson").write_text("v1")
+
+    ruta = carga_datos.ubicar_fuente("dim_verde.geojson", url)
+    assert open(ruta).read() == "v1" and len(peticiones) == 1
+
+    # Antes del intervalo no se consulta el remoto
+    assert carga_datos.ubicar_fuente("dim_verde.geojson", url, revalidar=True) == ruta
+    assert len(peticiones) == 1
+
+    # Vencido y sin cambios: petición condicional (304), el archivo no se toca
+    _vencer("dim_verde.geojson")
+    mtime = os.stat(ruta).st_mtime_ns
+    carga_datos.ubicar_fuente("dim_verde.geojson", url, revalidar=True)
+    assert len(peticiones) == 2 and os.stat(ruta).st_mtime_ns == mtime
+
+    # Vencido y con cambios en el remoto: se baja la versión nueva
+    (dir_remoto / "dim_verde.geojson").write_text("v2")
+    os.utime(dir_remoto / "dim_verde.geojson", (os.stat(ruta).st_mtime + 10,) * 2)
+    _vencer("dim_verde.geojson")
+    carga_datos.ubicar_fuente("dim_verde.geojson", url, revalidar=True)
+    assert open(ruta).read() == "v2"
+
+
+def test_fuente_caida_espera_antes_de_reintentar(remoto):
+    dir_remoto, url, peticiones = remoto
+
+    with pytest.raises(Exception):
+        carga_datos.ubicar_fuente("dim_area.geojson", url, revalidar=True)
+    assert len(peticiones) == 1
+
+    # Dentro de la espera no se vuelve a pedir
+    with pytest.raises(OSError, match="en espera"):
+        carga_datos.ubicar_fuente("dim_area.geojson", url, revalidar=True)
+    assert len(peticiones) == 1
+
+    # Pasada la espera se reintenta; con copia previa, un fallo la deja en uso
+    (dir_remoto / "dim_area.geojson").write_text("v1")
+    carga_datos._remotos["dim_area.geojson"]["reintento"] = 0.0
+    ruta = carga_datos.ubicar_fuente("dim_area.geojson", url, revalidar=True)
+    assert open(ruta).read() == "v1" and len(peticiones) == 2
+
+    (dir_remoto / "dim_area.geojson").unlink()
+    _vencer("dim_area.geojson")
+    assert carga_datos.ubicar_fuente("dim_area.geojson", url, revalidar=True) == ruta
+    assert carga_datos._remotos["dim_area.geojson"]["fallos"] == 1
@@ -0,0 +1,21 @@
+# Pruebas del puntaje de viabilidad (diagnostico.calcular_score)
+import diagnostico
+
+# Ningún conteo llega a su umbral; los equipamientos que los completarían están a 650 m
+CONTEOS = dict(num_tm=0, num_col=0, uso_moda="Residencial", num_parques=0, num_salud=0)
+DISTANCIAS = dict.fromkeys(diagnostico.UMBRALES_SCORE, 650.0)
+
+
+def test_tolerancia_con_circulo():
+    # Radio de 600 m: a 650 m quedan dentro de la tolerancia y los cuatro criterios cuentan
+    alcance = diagnostico.alcance_score(600)
+    assert alcance == 600 + diagnostico.TOLERANCIA_CERCANIA
+    assert diagnostico.calcular_score(**CONTEOS, alcance=alcance, distancias=DISTANCIAS)[0] == 5
+    assert diagnostico.calcular_score(**CONTEOS, alcance=600, distancias=DISTANCIAS)[0] == 1
+
+
+def test_sin_tolerancia_con_isocrona():
+    # Con la isócrona solo cuenta lo que está dentro de la zona a pie
+    alcance = diagnostico.alcance_score(600, isocrona=True)
+    assert alcance is None
+    assert diagnostico.calcular_score(**CONTEOS, alcance=alcance, distancias=DISTANCIAS)[0] == 1
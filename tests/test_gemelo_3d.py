@@ -0,0 +1,90 @@
+# Pruebas de la carga compacta del gemelo 3D (gemelo_3d.py); el visor (docs/index.html) lee el mismo formato
+import os
+import re
+from types import SimpleNamespace
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+import capa_puntos
+import gemelo_3d
+import motor_espacial
+
+LON, LAT, RADIO = -74.0660, 4.6490, 500
+
+
+def _diagnostico(isocrona=False):
+    """Lo que carga_gemelo lee de un Diagnostico, sobre tres capas de puntos sintéticas."""
+    rnd = np.random.default_rng(3)
+    capas = {}
+    for clave, (capa, columna) in gemelo_3d.CAPAS_GEMELO.items():
+        lons = LON + rnd.uniform(-0.006, 0.006, 40)
+        lats = LAT + rnd.uniform(-0.006, 0.006, 40)
+        nombres = [f"{capa} {i} con un nombre bastante más largo que el tope" for i in range(40)]
+        capas[capa] = gpd.GeoDataFrame(
+            {columna: nombres}, geometry=gpd.points_from_xy(lons, lats), crs="EPSG:4326"
+        )
+    indice = motor_espacial.IndiceEspacial(capas)
+    nombres_capas = [capa for capa, _ in gemelo_3d.CAPAS_GEMELO.values()]
+    area = motor_espacial.circulo_gps(LON, LAT, RADIO)
+    return SimpleNamespace(
+        zona=indice.consultar_zona(nombres_capas, LON, LAT, RADIO), lon=LON, lat=LAT, radio=RADIO,
+        isocrona=isocrona, area_interes=area,
+    ), capas
+
+
+def _metrico(geom):
+    return shapely.transform(geom, lambda c: np.column_stack(capa_puntos.a_metrico(c[:, 0], c[:, 1])))
+
+
+def test_codificar_decodificar_ida_y_vuelta():
+    diag, capas = _diagnostico()
+    carga = gemelo_3d.carga_gemelo(diag)
+    texto = gemelo_3d.codificar(carga)
+
+    # Va en el fragmento de la URL: solo caracteres base64url, sin relleno
+    assert re.fullmatch(r"[A-Za-z0-9_-]+", texto)
+    assert gemelo_3d.decodificar(texto) == carga
+
+    assert carga["v"] == gemelo_3d.VERSION_CARGA
+    assert carga["q"] == gemelo_3d.CUANTIZACION
+    assert carga["r"] == RADIO
+    lon0, lat0 = carga["o"]
+    for clave, (capa, columna) in gemelo_3d.CAPAS_GEMELO.items():
+        posiciones = diag.zona.posiciones[capa]
+        assert len(carga[clave]) == len(posiciones) > 0
+        originales = capas[capa].iloc[posiciones]
+        for (dlon, dlat, nombre), geom, nombre_original in zip(
+            carga[clave], originales.geometry, originales[columna]
+        ):
+            # Cada punto vuelve a su sitio salvo media unidad de cuantización
+            assert abs(lon0 + dlon / carga["q"] - geom.x) <= 0.5 / gemelo_3d.CUANTIZACION + 1e-9
+            assert abs(lat0 + dlat / carga["q"] - geom.y) <= 0.5 / gemelo_3d.CUANTIZACION + 1e-9
+            assert nombre == nombre_original[:gemelo_3d.MAX_NOMBRE]
+
+
+def test_tope_de_elementos_conserva_los_mas_cercanos():
+    diag, _ = _diagnostico()
+    completa = gemelo_3d.carga_gemelo(diag)
+    recortada = gemelo_3d.carga_gemelo(diag, max_elementos=3)
+    for clave in gemelo_3d.CAPAS_GEMELO:
+        cercanos = sorted(completa[clave], key=lambda e: e[0] ** 2 + e[1] ** 2)[:3]
+        assert sorted(recortada[clave]) == sorted(cercanos)
+
+
+def test_contorno_de_isocrona():
+    diag, _ = _diagnostico(isocrona=True)
+    carga = gemelo_3d.decodificar(gemelo_3d.codificar(gemelo_3d.carga_gemelo(diag)))
+    lon0, lat0 = carga["o"]
+    contorno = shapely.Polygon([(lon0 + dx / carga["q"], lat0 + dy / carga["q"]) for dx, dy in carga["z"]])
+    # Simplificado a TOLERANCIA_CONTORNO metros, más el redondeo de la cuantización (~1 m)
+    distancia = shapely.hausdorff_distance(_metrico(contorno), _metrico(diag.area_interes))
+    assert distancia <= gemelo_3d.TOLERANCIA_CONTORNO + 2
+
+
+def test_visor_usa_la_misma_version():
+    visor = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "docs", "index.html")
+    with open(visor, encoding="utf-8") as f:
+        version = re.search(r"const VERSION_CARGA = (\d+);", f.read())
+    assert version and int(version.group(1)) == gemelo_3d.VERSION_CARGA
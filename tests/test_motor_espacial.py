@@ -0,0 +1,32 @@
+# Pruebas del índice espacial (motor_espacial.py)
+import threading
+
+import geopandas as gpd
+import shapely
+
+import motor_espacial
+
+
+def _en_hilo(funcion, segundos=10):
+    """Corre `funcion` con límite de tiempo: un bucle infinito falla en vez de colgar la prueba."""
+    resultado = {}
+    hilo = threading.Thread(target=lambda: resultado.update(valor=funcion()), daemon=True)
+    hilo.start()
+    hilo.join(segundos)
+    assert not hilo.is_alive(), f"no terminó en {segundos} s"
+    return resultado["valor"]
+
+
+def test_k_cercanos_con_geometria_vacia_termina():
+    # Una caja de 100 m y un polígono vacío (como los que deja make_valid al reparar)
+    caja = shapely.box(1000000, 1000000, 1000100, 1000100)
+    verde = gpd.GeoDataFrame(
+        {"nombre_parque": ["Parque", "Vacío"]}, geometry=[caja, shapely.Polygon()], crs="EPSG:3116"
+    )
+    indice = motor_espacial.IndiceEspacial({"verde": verde})
+    lon, lat = gpd.GeoSeries([shapely.Point(1000050, 1000500)], crs="EPSG:3116").to_crs("EPSG:4326").iloc[0].coords[0]
+
+    posiciones, distancias = _en_hilo(lambda: indice.k_cercanos("verde", lon, lat, k=2))
+
+    assert list(posiciones) == [0]
+    assert abs(distancias[0] - 400) < 0.5
@@ -0,0 +1,42 @@
+# Pruebas de las isócronas a pie (red_peatonal.py) sobre una calle recta sintética
+import geopandas as gpd
+import numpy as np
+import shapely
+
+import red_peatonal
+
+X0, Y0 = 1000000.0, 1000000.0
+
+
+def _red_recta():
+    """Una calle recta de 3 km (EPSG:3116) con un vértice cada 10 m."""
+    xs = np.arange(X0, X0 + 3000 + 1, 10.0)
+    calle = shapely.LineString(np.column_stack([xs, np.full(len(xs), Y0)]))
+    calles = gpd.GeoDataFrame(geometry=[calle], crs="EPSG:3116")
+    return red_peatonal.RedPeatonal(**red_peatonal.construir_red(calles))
+
+
+def _alcance(poligono, x):
+    # Hasta dónde llega a cada lado de x, sin la media calzada del buffer
+    minx, _, maxx, _ = poligono.bounds
+    return x - minx - red_peatonal.MEDIO_ANCHO_CALLE, maxx - x - red_peatonal.MEDIO_ANCHO_CALLE
+
+
+def test_enganche_se_descuenta_de_la_distancia():
+    red = _red_recta()
+    x = X0 + 1500
+    sobre_la_calle = _alcance(red.isocrona_metrica(x, Y0, 600), x)
+    a_200_m = _alcance(red.isocrona_metrica(x, Y0 + 200, 600), x)
+    assert np.allclose(sobre_la_calle, 600, atol=1)
+    # 200 m para llegar a la calle: quedan 400 m por la red
+    assert np.allclose(a_200_m, 400, atol=1)
+
+    # Enganche que agota la distancia: no hay isócrona (la app vuelve al círculo)
+    assert red.isocrona_metrica(x, Y0 + 200, 200) is None
+
+
+def test_clics_vecinos_comparten_isocrona():
+    red = _red_recta()
+    x = X0 + 1500
+    # Mismo nodo y enganches que redondean a la misma distancia restante
+    assert red.isocrona_metrica(x, Y0 + 201, 600) is red.isocrona_metrica(x, Y0 + 203, 600)
@@ -0,0 +1,148 @@
+# Pruebas del codificador MVT (teselas_vectoriales.py): se escribe una tesela y se decodifica
+import shapely
+
+import teselas_vectoriales as tv
+
+
+# DECODIFICADOR PROTOBUF / MVT MÍNIMO (lo justo para leer lo que escribe el codificador)
+
+def _varint(datos, i):
+    valor = desplazamiento = 0
+    while True:
+        byte = datos[i]
+        i += 1
+        valor |= (byte & 0x7F) << desplazamiento
+        if not byte & 0x80:
+            return valor, i
+        desplazamiento += 7
+
+
+def _campos(datos):
+    """[(número de campo, valor)] de un mensaje con campos varint (tipo 0) y de longitud (tipo 2)."""
+    campos, i = [], 0
+    while i < len(datos):
+        clave, i = _varint(datos, i)
+        numero, tipo = clave >> 3, clave & 0x7
+        if tipo == 0:
+            valor, i = _varint(datos, i)
+        elif tipo == 2:
+            largo, i = _varint(datos, i)
+            valor, i = datos[i:i + largo], i + largo
+        else:
+            raise AssertionError(f"tipo de campo inesperado: {tipo}")
+        campos.append((numero, valor))
+    return campos
+
+
+def _anillos(comandos):
+    """Anillos [(x, y), ...] en coordenadas de tesela a partir de la secuencia de comandos."""
+    anillos, actual, cx, cy, i = [], [], 0, 0, 0
+    while i < len(comandos):
+        id_comando, cuenta = comandos[i] & 0x7, comandos[i] >> 3
+        i += 1
+        if id_comando == 7:
+            anillos.append(actual)
+            continue
+        for _ in range(cuenta):
+            dx, dy = (comandos[i] >> 1) ^ -(comandos[i] & 1), (comandos[i + 1] >> 1) ^ -(comandos[i + 1] & 1)
+            i += 2
+            cx, cy = cx + dx, cy + dy
+            if id_comando == 1:
+                actual = []
+            actual.append((cx, cy))
+    return anillos
+
+
+def _area_con_signo(anillo):
+    # Fórmula del agrimensor sobre coordenadas de tesela: positiva = anillo exterior según la especificación
+    return sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(anillo, anillo[1:] + anillo[:1])) / 2
+
+
+def _decodificar(datos):
+    """{capa: {"version", "extent", "keys", "values", "features": [{"tipo", "tags", "anillos"}]}}"""
+    capas = {}
+    for numero, mensaje in _campos(datos):
+        assert numero == 3
+        capa = {"keys": [], "values": [], "features": []}
+        for campo, valor in _campos(mensaje):
+            if campo == 1:
+                capa["nombre"] = valor.decode("utf-8")
+            elif campo == 15:
+                capa["version"] = valor
+            elif campo == 5:
+                capa["extent"] = valor
+            elif campo == 3:
+                capa["keys"].append(valor)
+            elif campo == 4:
+                capa["values"].append(valor)
+            elif campo == 2:
+                feature = {"tags": []}
+                for c, v in _campos(valor):
+                    if c == 3:
+                        feature["tipo"] = v
+                    elif c == 2:
+                        feature["tags"].append(v)
+                    elif c == 4:
+                        comandos, j = [], 0
+                        while j < len(v):
+                            comando, j = _varint(v, j)
+                            comandos.append(comando)
+                        feature["anillos"] = _anillos(comandos)
+                capa["features"].append(feature)
+        capas[capa["nombre"]] = capa
+    return capas
+
+
+def _poligonos(anillos):
+    """Agrupa anillos (exterior con área positiva y sus huecos a continuación) en polígonos."""
+    poligonos = []
+    for anillo in anillos:
+        if _area_con_signo(anillo) > 0:
+            poligonos.append([anillo, []])
+        else:
+            poligonos[-1][1].append(anillo)
+    return shapely.MultiPolygon([shapely.Polygon(ext, huecos) for ext, huecos in poligonos])
+
+
+def test_tesela_ida_y_vuelta(tmp_path):
+    z = 15
+    # Un parque con hueco y una manzana en dos partes, pequeños y dentro de una misma tesela
+    parque = shapely.Polygon(
+        [(-74.0660, 4.6480), (-74.0640, 4.6480), (-74.0640, 4.6500), (-74.0660, 4.6500)],
+        [[(-74.0655, 4.6485), (-74.0655, 4.6490), (-74.0650, 4.6490), (-74.0650, 4.6485)]],
+    )
+    manzana = shapely.MultiPolygon([
+        shapely.box(-74.0630, 4.6480, -74.0625, 4.6485),
+        shapely.box(-74.0620, 4.6480, -74.0615, 4.6485),
+    ])
+    capas = {"verde": tv.a_mercator([parque]), "estrato_3": tv.a_mercator([manzana])}
+    tv.generar_piramide(capas, z, z, str(tmp_path))
+
+    centro = tv.a_mercator(shapely.Point(-74.0640, 4.6490))
+    columnas, filas = tv.rango_teselas((centro.x, centro.y, centro.x, centro.y), z)
+    x, y = columnas[0], filas[0]
+    tesela = _decodificar((tmp_path / str(z) / str(x) / f"{y}.pbf").read_bytes())
+
+    assert set(tesela) == {"verde", "estrato_3"}
+    minx, miny, maxx, maxy = tv.limites_tesela(z, x, y)
+    escala = tv.EXTENSION / (maxx - minx)
+    for nombre, original, partes in (("verde", capas["verde"][0], 1), ("estrato_3", capas["estrato_3"][0], 2)):
+        capa = tesela[nombre]
+        assert capa["version"] == 2
+        assert capa["extent"] == tv.EXTENSION
+        # Sin atributos: la categoría va en el nombre de la capa
+        assert capa["keys"] == [] and capa["values"] == []
+        # Las geometrías multiparte se escriben como una feature POLYGON por parte
+        assert len(capa["features"]) == partes
+        assert all(f["tipo"] == 3 and f["tags"] == [] for f in capa["features"])
+
+        decodificado = shapely.union_all([_poligonos(f["anillos"]) for f in capa["features"]])
+        decodificado = shapely.MultiPolygon(shapely.get_parts(decodificado).tolist())
+        assert len(decodificado.geoms) == partes
+        assert all(len(p.interiors) == (1 if nombre == "verde" else 0) for p in decodificado.geoms)
+        # De vuelta a EPSG:3857: coincide con el original salvo el redondeo a la rejilla entera
+        en_mercator = shapely.transform(
+            decodificado, lambda c: c * [1 / escala, -1 / escala] + [minx, maxy]
+        )
+        assert shapely.hausdorff_distance(en_mercator, original) <= 1 / escala
+        assert abs(en_mercator.area - original.area) / original.area < 0.01